@@ -0,0 +1,423 @@
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+"""
+* Benchmarks for the Jack compiler
+*
+* startup:    time to start an interpreter and import jackanalyzer, measured in fresh
+*             processes and reported as the overhead over a bare interpreter start.
+*             Fails (exit code 1) when the overhead is above the target.
+*
+* throughput: Tokenizer, SymbolTable and CompilationEngine throughput and peak memory,
+*             measured separately in this process on a synthetic corpus (see
+*             generate_class). Results can be saved as a baseline; later runs are
+*             compared against it and fail (exit code 1) when a throughput dropped or
+*             a peak grew by more than the threshold. The numbers depend on the
+*             machine, so no baseline is shipped: the first run on a machine has to
+*             save one with --save-baseline.
+*
+* corpus:     writes the synthetic corpus as .jack files, e.g. to time jackanalyzer.
+
+"""
+
+#import overhead budget of jackanalyzer on top of a bare interpreter start
+STARTUP_TARGET_MS = 25.0
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+BASELINE_FILE = os.path.join(REPO_DIR, "benchmark_baseline.json")
+
+#allowed throughput drop / peak memory growth against the baseline
+REGRESSION_THRESHOLD = 0.20
+
+#shape of the synthetic corpus, see generate_class
+CORPUS_DEFAULTS = {"classes": 4, "fields": 24, "methods": 24, "depth": 3, "expression_terms": 8,
+                   "string_length": 64, "seed": 0}
+
+_OPERATORS = ("+", "-", "*", "/", "&", "|")
+
+
+def _time_process(code:str, runs:int) -> float:
+    #median wall time in ms of running python -c code in a fresh interpreter
+    timings = []
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(timings)
+
+
+def benchmark_startup(runs:int=20, target_ms:float=STARTUP_TARGET_MS) -> bool:
+    """
+    Measures the import cost of jackanalyzer and checks it against target_ms
+
+    Returns True when the target is met
+    """
+    #warm the OS file cache and the bytecode cache first
+    _time_process("import jackanalyzer", 1)
+
+    bare = _time_process("pass", runs)
+    startup = _time_process("import jackanalyzer", runs)
+    overhead = startup - bare
+
+    print(f"interpreter start       : {bare:8.1f} ms")
+    print(f"import jackanalyzer     : {startup:8.1f} ms")
+    print(f"import overhead         : {overhead:8.1f} ms (target {target_ms:.1f} ms)")
+
+    met = overhead <= target_ms
+    print("startup target met" if met else "STARTUP TARGET MISSED")
+
+    return met
+
+
+def generate_class(name:str, fields:int=24, methods:int=24, depth:int=3, expression_terms:int=8,
+                   string_length:int=64, seed:int=0) -> str:
+    """
+    Jack source of a synthetic class that exercises every part of the compiler
+
+    fields int fields (plus a static), a constructor initialising them and methods
+    methods, each with locals, a string constant of string_length characters, long
+    expressions of expression_terms terms, OS calls and if/else and while statements
+    nested depth levels deep. The same arguments always give the same source.
+    """
+    rng = random.Random(f"{name}:{seed}")
+    field_names = [f"f{index}" for index in range(fields)]
+    variables = ["a", "b", "x", "y", "i"] + field_names
+
+    lines = [f"class {name} {{"]
+
+    for start in range(0, fields, 6):
+        lines.append(f"    field int {', '.join(field_names[start:start + 6])};")
+    lines.append("    static int count;")
+    lines.append("")
+
+    lines.append(f"    constructor {name} new() {{")
+    for field in field_names:
+        lines.append(f"        let {field} = {rng.randint(0, 999)};")
+    lines.append("        let count = count + 1;")
+    lines.append("        return this;")
+    lines.append("    }")
+
+    for method in range(methods):
+        text = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789")
+                       for _ in range(string_length))
+        lines.append("")
+        lines.append(f"    method int m{method}(int a, int b) {{")
+        lines.append("        var int x, y, i;")
+        lines.append("        var String s;")
+        lines.append(f"        let x = {_expression(rng, variables, expression_terms)};")
+        lines.append("        let y = 0;")
+        lines.append("        let i = 0;")
+        lines.append(f"        let s = \"{text}\";")
+        lines.extend(_block(rng, variables, depth, expression_terms, "        "))
+        lines.append("        do Output.printString(s);")
+        lines.append("        do Output.printInt(Math.max(x, y));")
+        lines.append("        do s.dispose();")
+        lines.append("        return x;")
+        lines.append("    }")
+
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def _expression(rng:random.Random, variables:list, terms:int) -> str:
+    #terms operands joined by binary operators, some negated or parenthesized
+    parts = []
+
+    for position in range(terms):
+        if position:
+            parts.append(rng.choice(_OPERATORS))
+
+        choice = rng.random()
+        if choice < 0.45:
+            parts.append(rng.choice(variables))
+        elif choice < 0.75:
+            parts.append(str(rng.randint(0, 32767)))
+        elif choice < 0.85:
+            parts.append(f"-{rng.choice(variables)}")
+        else:
+            parts.append(f"({rng.choice(variables)} {rng.choice(_OPERATORS)} {rng.randint(1, 99)})")
+
+    return " ".join(parts)
+
+
+def _block(rng:random.Random, variables:list, depth:int, terms:int, indent:str) -> list:
+    #statements with if/else and while nested depth levels deep
+    lines = [f"{indent}let y = {_expression(rng, variables, terms)};"]
+
+    if depth == 0:
+        lines.append(f"{indent}let {rng.choice(variables[3:])} = {_expression(rng, variables, max(1, terms // 2))};")
+        return lines
+
+    inner = indent + "    "
+    condition = f"({_expression(rng, variables, max(1, terms // 2))}) < {rng.randint(0, 999)}"
+
+    lines.append(f"{indent}if ({condition}) {{")
+    lines.extend(_block(rng, variables, depth - 1, terms, inner))
+    lines.append(f"{indent}}} else {{")
+    lines.append(f"{inner}let x = ~x;")
+    lines.append(f"{indent}}}")
+
+    lines.append(f"{indent}while (i < {rng.randint(1, 50)}) {{")
+    lines.extend(_block(rng, variables, depth - 1, terms, inner))
+    lines.append(f"{inner}let i = i + 1;")
+    lines.append(f"{indent}}}")
+
+    return lines
+
+
+def generate_corpus(classes:int=8, seed:int=0, **shape) -> dict:
+    #class name -> source of classes synthetic classes, shape as in generate_class
+    names = [f"Bench{index}" for index in range(classes)]
+    return {name: generate_class(name, seed=seed, **shape) for name in names}
+
+
+def _best_time(function, runs:int) -> float:
+    #fastest of runs calls in seconds - the least disturbed by the rest of the system.
+    #like timeit, the garbage collector is off while timing
+    import gc
+
+    best = float("inf")
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        for _ in range(runs):
+            start = time.perf_counter()
+            function()
+            best = min(best, time.perf_counter() - start)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    return best
+
+
+def _peak_memory(function) -> int:
+    #peak bytes allocated by one call of function, as traced by tracemalloc
+    import tracemalloc
+
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _tokenize(corpus:dict, lexer:str) -> int:
+    from tokenizer import Tokenizer
+
+    count = 0
+    for name, source in corpus.items():
+        count += len(Tokenizer(f"{name}.jack", lexer=lexer, source=source).tokens)
+    return count
+
+
+def _exercise_symbol_table(classes:int, fields:int, methods:int) -> int:
+    #the define/lookup pattern of compiling the corpus: per method a new scope with
+    #arguments and locals, then lookups of locals, arguments and fields
+    from symboltable import SymbolTable
+
+    operations = 0
+    names = [f"f{index}" for index in range(fields)]
+    locals_ = ["x", "y", "i", "s"]
+
+    for _ in range(classes):
+        table = SymbolTable()
+        for name in names:
+            table._define(name, "int", "field")
+        operations += fields
+
+        for _ in range(methods):
+            table._startSubroutine()
+            table._define("this", "Bench", "argument")
+            table._define("a", "int", "argument")
+            table._define("b", "int", "argument")
+            for name in locals_:
+                table._define(name, "int", "local")
+            operations += 8
+
+            for _ in range(8):
+                for name in locals_:
+                    table.lookup(name)
+                for name in names:
+                    table.lookup(name)
+            operations += 8 * (len(locals_) + fields)
+
+    return operations
+
+
+def _compile(corpus:dict, **engine_options):
+    from compilation_engine import compile_source
+
+    for name, source in corpus.items():
+        compile_source(source, name, **engine_options)
+
+
+def benchmark_throughput(runs:int=5, corpus_shape:dict=None) -> dict:
+    """
+    Measures throughput and peak memory of the compiler's parts on a synthetic corpus
+
+    Returns {benchmark: {"rate": units per second, "unit": ..., "peak_bytes": ...}}
+    """
+    from peephole import DEFAULT_RULES
+
+    shape = dict(CORPUS_DEFAULTS, **(corpus_shape or {}))
+    corpus = generate_corpus(**shape)
+    tokens = _tokenize(corpus, "hand")
+
+    optimized = {"fold_constants": True, "strength_reduce": True, "peephole_rules": DEFAULT_RULES}
+
+    #name -> (function, units processed per call, unit)
+    benchmarks = {
+        "tokenizer (hand)": (lambda: _tokenize(corpus, "hand"), tokens, "tokens/s"),
+        "tokenizer (regex)": (lambda: _tokenize(corpus, "regex"), tokens, "tokens/s"),
+        "symbol table": (lambda: _exercise_symbol_table(shape["classes"], shape["fields"], shape["methods"]),
+                         _exercise_symbol_table(shape["classes"], shape["fields"], shape["methods"]), "ops/s"),
+        "engine": (lambda: _compile(corpus), tokens, "tokens/s"),
+        "engine (streaming)": (lambda: _compile(corpus, streaming=True), tokens, "tokens/s"),
+        "engine (optimized)": (lambda: _compile(corpus, **optimized), tokens, "tokens/s"),
+        "engine (ast)": (lambda: _compile(corpus, build_ast=True), tokens, "tokens/s"),
+    }
+
+    results = {}
+    for name, (function, units, unit) in benchmarks.items():
+        function()  # warm up caches and lazy imports
+        results[name] = {"rate": units / _best_time(function, runs), "unit": unit,
+                         "peak_bytes": _peak_memory(function)}
+
+    return results
+
+
+def compare_to_baseline(results:dict, baseline:dict, threshold:float=REGRESSION_THRESHOLD) -> list:
+    #names of the benchmarks that regressed by more than threshold
+    regressions = []
+
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+
+        if result["rate"] < reference["rate"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {result['rate']:.0f} < baseline {reference['rate']:.0f} {result['unit']}")
+
+        if result["peak_bytes"] > reference["peak_bytes"] * (1 + threshold):
+            regressions.append(f"{name}: peak memory {result['peak_bytes']} > baseline {reference['peak_bytes']} bytes")
+
+    return regressions
+
+
+def run_throughput(runs:int, corpus_shape:dict, baseline_file:str, save_baseline:bool, threshold:float) -> bool:
+    """
+    Runs the throughput benchmarks, prints them next to the baseline and compares
+
+    Returns False when something regressed by more than threshold
+    """
+    import json
+
+    shape = dict(CORPUS_DEFAULTS, **corpus_shape)
+    results = benchmark_throughput(runs=runs, corpus_shape=shape)
+
+    baseline = None
+    if os.path.exists(baseline_file):
+        with open(baseline_file) as f:
+            stored = json.load(f)
+
+        #a baseline only compares with runs on the same corpus
+        if stored.get("corpus") == shape:
+            baseline = stored["results"]
+        else:
+            print(f"baseline {baseline_file} was measured on a different corpus, not comparing")
+
+    elif not save_baseline:
+        #throughput depends on the machine, so there is no baseline in the repository
+        print(f"no baseline at {baseline_file}, not comparing - run once with --save-baseline "
+              f"on this machine to store one")
+
+    print(f"{'benchmark':<22} {'throughput':>14} {'':<9} {'baseline':>14} {'peak KiB':>10} {'baseline':>10}")
+
+    for name, result in results.items():
+        reference = (baseline or {}).get(name)
+        base_rate = f"{reference['rate']:14.0f}" if reference else f"{'-':>14}"
+        base_peak = f"{reference['peak_bytes'] / 1024:10.1f}" if reference else f"{'-':>10}"
+        print(f"{name:<22} {result['rate']:14.0f} {result['unit']:<9} {base_rate} {result['peak_bytes'] / 1024:10.1f} {base_peak}")
+
+    #the regex lexer exists to be the faster backend, show by how much
+    speedup = results["tokenizer (regex)"]["rate"] / results["tokenizer (hand)"]["rate"]
+    print(f"regex lexer vs hand lexer: {speedup:.2f}x")
+
+    regressions = compare_to_baseline(results, baseline, threshold) if baseline else []
+
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+
+    if save_baseline:
+        with open(baseline_file, "w") as f:
+            json.dump({"corpus": shape, "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"baseline saved to {baseline_file}")
+
+    return not regressions
+
+
+def _add_corpus_arguments(parser):
+    #the corpus shape options shared by the throughput and corpus subcommands
+    parser.add_argument("--classes", type=int, default=CORPUS_DEFAULTS["classes"], help="number of classes")
+    parser.add_argument("--fields", type=int, default=CORPUS_DEFAULTS["fields"], help="fields per class")
+    parser.add_argument("--methods", type=int, default=CORPUS_DEFAULTS["methods"], help="methods per class")
+    parser.add_argument("--depth", type=int, default=CORPUS_DEFAULTS["depth"], help="if/while nesting depth")
+    parser.add_argument("--expression-terms", type=int, default=CORPUS_DEFAULTS["expression_terms"],
+                        help="terms per expression")
+    parser.add_argument("--string-length", type=int, default=CORPUS_DEFAULTS["string_length"],
+                        help="characters per string constant")
+    parser.add_argument("--seed", type=int, default=CORPUS_DEFAULTS["seed"], help="random seed of the generator")
+
+
+def _corpus_shape(args) -> dict:
+    return {name: getattr(args, name) for name in CORPUS_DEFAULTS}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Jack compiler benchmarks")
+    subcommands = parser.add_subparsers(dest="benchmark", required=True)
+
+    startup = subcommands.add_parser("startup", help="import time of jackanalyzer in a fresh interpreter")
+    startup.add_argument("--runs", type=int, default=20, help="interpreter starts per measurement (default: 20)")
+    startup.add_argument("--target-ms", type=float, default=STARTUP_TARGET_MS,
+                         help=f"allowed import overhead in ms (default: {STARTUP_TARGET_MS})")
+
+    throughput = subcommands.add_parser("throughput", help="tokenizer, symbol table and engine throughput and peak memory")
+    throughput.add_argument("--runs", type=int, default=5, help="timed runs per benchmark, the fastest counts (default: 5)")
+    throughput.add_argument("--baseline", default=BASELINE_FILE, help=f"baseline file (default: {BASELINE_FILE})")
+    throughput.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    throughput.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                            help=f"allowed relative regression (default: {REGRESSION_THRESHOLD})")
+    _add_corpus_arguments(throughput)
+
+    corpus = subcommands.add_parser("corpus", help="write the synthetic corpus as .jack files")
+    corpus.add_argument("directory", help="directory to write the .jack files to")
+    _add_corpus_arguments(corpus)
+
+    args = parser.parse_args()
+
+    if args.benchmark == "startup":
+        sys.exit(0 if benchmark_startup(runs=args.runs, target_ms=args.target_ms) else 1)
+
+    elif args.benchmark == "throughput":
+        sys.exit(0 if run_throughput(args.runs, _corpus_shape(args), args.baseline, args.save_baseline, args.threshold) else 1)
+
+    else:
+        os.makedirs(args.directory, exist_ok=True)
+
+        for name, source in generate_corpus(**_corpus_shape(args)).items():
+            with open(os.path.join(args.directory, f"{name}.jack"), "w") as f:
+                f.write(source)
@@ -0,0 +1,177 @@
+import os
+from vm_writer import write_atomically
+
+"""
+* Content-hash build cache for JackAnalyzer
+* A manifest next to the .jack files records, per source file, the hash of its contents,
+* the compiler options it was built with and a stamp (size, mtime) of the .vm file
+* that was written. A file is up to date when its hash and options match the manifest
+* and the .vm file still carries the recorded stamp. The whole manifest is discarded
+* when the compiler changes: its version is COMPILER_VERSION plus a hash of the
+* sources of the modules that generate code (COMPILER_MODULES), so editing the code
+* generator invalidates the cache even if nobody bumps COMPILER_VERSION.
+
+"""
+
+#bump when the manifest format changes; code changes are caught by the source hash
+COMPILER_VERSION = "1.2"
+
+#the modules whose code decides what ends up in a .vm file
+COMPILER_MODULES = ("tokenizer", "compilation_engine", "jack_ast", "code_generator", "vm_emitter", "symboltable",
+                    "vm_writer", "vm_ir", "peephole")
+
+_source_digest = None
+
+MANIFEST_NAME = ".jackcache.json"
+
+
+def _describe(value):
+    #JSON-friendly form of an engine option: functions (peephole rules) by name
+    if callable(value):
+        return value.__name__
+    if isinstance(value, (list, tuple)):
+        return [_describe(item) for item in value]
+    return value
+
+
+def _describe_options(engine_options:dict) -> dict:
+    return {name: _describe(value) for name, value in engine_options.items()}
+
+
+def _vm_stamp(vm_file:str):
+    #(size, mtime in ns) of a .vm file, or None if it does not exist
+    try:
+        stat = os.stat(vm_file)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _vm_file(jack_file:str) -> str:
+    return os.path.splitext(jack_file)[0] + ".vm"
+
+
+def compiler_version() -> str:
+    #COMPILER_VERSION and a digest of the compiler's sources, hashed once per process
+    global _source_digest
+
+    if _source_digest is None:
+        import hashlib
+
+        digest = hashlib.sha256()
+        directory = os.path.dirname(os.path.abspath(__file__))
+
+        for module in COMPILER_MODULES:
+            with open(os.path.join(directory, f"{module}.py"), "rb") as f:
+                digest.update(f.read())
+
+        _source_digest = digest.hexdigest()[:16]
+
+    return f"{COMPILER_VERSION}+{_source_digest}"
+
+
+class BuildCache:
+
+    def __init__(self, directory:str, engine_options:dict):
+        """
+        Loads the manifest of directory, if there is one
+
+        engine_options are the CompilationEngine options of this run; entries built
+        with different options are out of date
+        """
+        import json  # only the cache needs json and hashlib, keep them off the import path
+
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self.options = json.dumps(_describe_options(engine_options), sort_keys=True)
+
+        #file name -> {"source_hash", "options", "vm_stamp"}
+        self.entries = {}
+        self._hashes = {}  # file -> ((size, mtime), sha256)
+        self._dirty = False
+
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            manifest = None
+
+        if isinstance(manifest, dict) and manifest.get("compiler_version") == compiler_version():
+            self.entries = manifest.get("files", {})
+        elif manifest is not None:
+            #written by another compiler version, or unreadable - start over
+            self._dirty = True
+
+    def is_up_to_date(self, jack_file:str) -> bool:
+        #True when the .vm file of jack_file was built from the same source and options
+        entry = self.entries.get(os.path.basename(jack_file))
+
+        return (entry is not None
+                and entry["options"] == self.options
+                and entry["source_hash"] == self._source_hash(jack_file)
+                and entry["vm_stamp"] == _vm_stamp(_vm_file(jack_file)))
+
+    def record(self, jack_file:str):
+        #remember that jack_file was just compiled to its .vm file
+        self.entries[os.path.basename(jack_file)] = {
+            "source_hash": self._source_hash(jack_file),
+            "options": self.options,
+            "vm_stamp": _vm_stamp(_vm_file(jack_file)),
+        }
+        self._dirty = True
+
+    def forget(self, jack_file:str):
+        #drop the entry of a file that failed to compile
+        if self.entries.pop(os.path.basename(jack_file), None) is not None:
+            self._dirty = True
+
+    def evict(self, jack_files:list) -> list:
+        """
+        Removes the entries of classes whose .jack file no longer exists
+
+        Their .vm files are deleted too, unless they were changed after the compiler
+        wrote them. Returns the evicted file names
+        """
+        present = {os.path.basename(file) for file in jack_files}
+        evicted = [name for name in self.entries if name not in present]
+
+        for name in evicted:
+            entry = self.entries.pop(name)
+            vm_file = _vm_file(os.path.join(self.directory, name))
+
+            if entry["vm_stamp"] is not None and _vm_stamp(vm_file) == entry["vm_stamp"]:
+                os.unlink(vm_file)
+
+        if evicted:
+            self._dirty = True
+
+        return evicted
+
+    def save(self):
+        #write the manifest if anything changed, atomically like the .vm files
+        if not self._dirty:
+            return
+
+        import json
+
+        manifest = {"compiler_version": compiler_version(), "files": self.entries}
+        write_atomically(self.manifest_path, json.dumps(manifest, indent=1, sort_keys=True))
+        self._dirty = False
+
+    def _source_hash(self, jack_file:str) -> str:
+        #sha256 of the file contents, recomputed only when the file's size or mtime
+        #changed, so a long-lived cache (watch mode) never serves a stale hash
+        stat = os.stat(jack_file)
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        cached = self._hashes.get(jack_file)
+
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        import hashlib
+
+        with open(jack_file, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        self._hashes[jack_file] = (stamp, digest)
+
+        return digest
@@ -0,0 +1,328 @@
+import jack_ast
+from symboltable import VariableNotFoundError
+from vm_emitter import BUILT_IN_CLASSES, VMEmitter, fold, to_int16
+
+"""
+* VM code generator for jack_ast trees
+* Writes the same VM code CompilationEngine writes while parsing - including its
+* label numbering, constant folding and strength reduction - so the two can be used
+* interchangeably. The symbol table is filled in during the walk, in the order the
+* engine fills it in, so every name resolves to the same symbol. What both write the
+* same way (constants, operators, folding, strength reduction) is vm_emitter.VMEmitter.
+
+"""
+
+
+class CodeGenerator(VMEmitter):
+
+    def __init__(self, vm_writer, symbol_table, fold_constants:bool=False, strength_reduce:bool=False):
+        self.vm_writer = vm_writer
+        self.symbol_table = symbol_table
+        self.fold_constants = fold_constants
+        self.strength_reduce = strength_reduce
+        self.built_in_classes = BUILT_IN_CLASSES
+        self.class_name = ""
+        self._label_num = 0
+
+    def generate(self, class_node:jack_ast.Class):
+        #write the VM code of a whole class
+        self.class_name = class_node.name
+
+        for declaration in class_node.class_var_decs:
+            for name in declaration.names:
+                self.symbol_table._define(name=name, type=declaration.type, kind=declaration.kind)
+
+        for subroutine in class_node.subroutines:
+            self._generateSubroutine(subroutine)
+
+    def _generateSubroutine(self, subroutine:jack_ast.Subroutine):
+        symbol_table = self.symbol_table
+
+        symbol_table._startSubroutine()
+        self._label_num = 0
+
+        if subroutine.kind == "method":
+            symbol_table._define(name="this", type=self.class_name, kind="argument")
+
+        for type_, name in subroutine.parameters:
+            symbol_table._define(name=name, type=type_, kind="argument")
+
+        for declaration in subroutine.var_decs:
+            for name in declaration.names:
+                symbol_table._define(name=name, type=declaration.type, kind="local")
+
+        self.vm_writer.writeFunction(f"{self.class_name}.{subroutine.name}", symbol_table._varCount(kind="local"))
+
+        if subroutine.kind == "constructor":
+            self.vm_writer.writePush("constant", symbol_table._varCount(kind="field"))
+            self.vm_writer.writeCall("Memory.alloc", 1)
+            self.vm_writer.writePop("pointer", 0)
+
+        elif subroutine.kind == "method":
+            self.vm_writer.writePush("argument", 0)
+            self.vm_writer.writePop("pointer", 0)
+
+        self._generateStatements(subroutine.statements)
+
+    def _generateStatements(self, statements:list):
+        for statement in statements:
+            kind = type(statement)
+
+            if kind is jack_ast.Let:
+                self._generateLet(statement)
+            elif kind is jack_ast.If:
+                self._generateIf(statement)
+            elif kind is jack_ast.While:
+                self._generateWhile(statement)
+            elif kind is jack_ast.Do:
+                self._generateDo(statement.call)
+            else:
+                self._generateReturn(statement)
+
+    def _generateLet(self, let:jack_ast.Let):
+        symbol = self.symbol_table.lookup(let.name)
+        segment = self._get_vm_segment(symbol.kind)
+
+        if let.index is None:
+            self._generateExpression(let.value)
+            self.vm_writer.writePop(segment, symbol.index)
+            return
+
+        #arr[i] = value: compute arr + i first, keep value in temp 0 while THAT is set
+        self._generateExpression(let.index)
+        self.vm_writer.writePush(segment, symbol.index)
+        self.vm_writer.writeArithmetic("add")
+
+        self._generateExpression(let.value)
+        self.vm_writer.writePop("temp", 0)
+        self.vm_writer.writePop("pointer", 1)
+        self.vm_writer.writePush("temp", 0)
+        self.vm_writer.writePop("that", 0)
+
+    def _generateIf(self, statement:jack_ast.If):
+        #labels are numbered before the condition, like the engine does
+        self._generate_label("IF_TRUE")
+        label_false = self._generate_label("IF_FALSE")
+        label_end = self._generate_label("IF_END")
+
+        self._generateExpression(statement.condition)
+        self.vm_writer.writeArithmetic("not")
+        self.vm_writer.writeIf(label_false)
+
+        self._generateStatements(statement.statements)
+        self.vm_writer.writeGoto(label_end)
+        self.vm_writer.writeLabel(label_false)
+
+        if statement.else_statements is not None:
+            self._generateStatements(statement.else_statements)
+
+        self.vm_writer.writeLabel(label_end)
+
+    def _generateWhile(self, statement:jack_ast.While):
+        while_exp_label = f"WHILE_EXP{self._label_num}"
+        while_end_label = f"WHILE_END{self._label_num}"
+        self._label_num += 1
+
+        self.vm_writer.writeLabel(while_exp_label)
+        self._generateExpression(statement.condition)
+        self.vm_writer.writeArithmetic("not")
+        self.vm_writer.writeIf(while_end_label)
+
+        self._generateStatements(statement.statements)
+        self.vm_writer.writeGoto(while_exp_label)
+        self.vm_writer.writeLabel(while_end_label)
+
+    def _generateDo(self, call:jack_ast.SubroutineCall):
+        n_args = 0
+
+        if call.receiver is None:
+            #method of this class
+            full_fxn_name = f"{self.class_name}.{call.name}"
+            self.vm_writer.writePush("pointer", 0)
+            n_args += 1
+
+        elif call.receiver in self.built_in_classes:
+            full_fxn_name = f"{call.receiver}.{call.name}"
+
+        else:
+            try:
+                symbol = self.symbol_table.lookup(call.receiver)
+                if symbol.kind in ["field", "local"]:
+                    self.vm_writer.writePush(self._get_vm_segment(symbol.kind), symbol.index)
+                    n_args += 1
+                    full_fxn_name = f"{symbol.type}.{call.name}"
+                else:
+                    full_fxn_name = f"{call.receiver}.{call.name}"
+            except VariableNotFoundError:
+                full_fxn_name = f"{call.receiver}.{call.name}"
+
+        for argument in call.arguments:
+            self._generateExpression(argument)
+
+        self.vm_writer.writeCall(full_fxn_name, n_args + len(call.arguments))
+        self.vm_writer.writePop("temp", 0)
+
+    def _generateReturn(self, statement:jack_ast.Return):
+        #the engine resolves 'this' before looking at the return value
+        try:
+            is_constructor = self.symbol_table.lookup("this").kind == "argument"
+        except VariableNotFoundError:
+            is_constructor = False
+
+        if statement.value is None:
+            self.vm_writer.writePush("constant", 0)
+            self.vm_writer.writeReturn()
+            return
+
+        self._generateExpression(statement.value)
+
+        if is_constructor:
+            self.vm_writer.writePop("temp", 0)
+            self.vm_writer.writePush("pointer", 0)
+
+        self.vm_writer.writeReturn()
+
+    def _generateExpression(self, expression:jack_ast.Expression):
+        if self.fold_constants or self.strength_reduce:
+            self._generateFoldedExpression(expression)
+            return
+
+        terms = expression.terms
+        self._generateTerm(terms[0])
+
+        for op, term in zip(expression.operators, terms[1:]):
+            self._generateTerm(term)
+            self._writeOperator(op)
+
+    def _generateFoldedExpression(self, expression:jack_ast.Expression):
+        #CompilationEngine._compileFoldedExpression over terms instead of tokens
+        terms = expression.terms
+        pending = self._constant(terms[0])
+
+        if pending is None:
+            self._generateTerm(terms[0])
+
+        operands = ((op, self._constant(term), term) for op, term in zip(expression.operators, terms[1:]))
+        self._writeFoldedOperations(pending, operands, self._generateTerm, lambda term: None)
+
+    def _constant(self, term):
+        #the value of a constant term as CompilationEngine._peekConstant finds it, else None
+        if self.fold_constants:
+            return _constant_term(term)
+
+        return term.value if type(term) is jack_ast.IntegerConstant else None
+
+    def _generateTerm(self, term):
+        kind = type(term)
+
+        if kind is jack_ast.IntegerConstant:
+            self.vm_writer.writePush("constant", term.value)
+
+        elif kind is jack_ast.StringConstant:
+            self.vm_writer.writePush("constant", len(term.value))
+            self.vm_writer.writeCall("String.new", 1)
+
+            for char in term.value:
+                self.vm_writer.writePush("constant", ord(char))
+                self.vm_writer.writeCall("String.appendChar", 2)
+
+        elif kind is jack_ast.KeywordConstant:
+            if term.value == "this":
+                self.vm_writer.writePush("pointer", 0)
+            else:
+                self.vm_writer.writePush("constant", 1 if term.value == "true" else 0)
+
+        elif kind is jack_ast.Parenthesized:
+            self._generateExpression(term.expression)
+
+        elif kind is jack_ast.UnaryOp:
+            self._generateTerm(term.term)
+            self.vm_writer.writeArithmetic("neg" if term.operator == "-" else "not")
+
+        elif kind is jack_ast.ArrayAccess:
+            self._generateExpression(term.index)
+
+            symbol = self.symbol_table.lookup(term.name)
+            self.vm_writer.writePush(self._get_vm_segment(symbol.kind), symbol.index)
+            self.vm_writer.writeArithmetic("add")
+            self.vm_writer.writePop("pointer", 1)
+            self.vm_writer.writePush("that", 0)
+
+        elif kind is jack_ast.SubroutineCall:
+            self._generateCall(term)
+
+        else:
+            symbol = self.symbol_table.lookup(term.name)
+            self.vm_writer.writePush(self._get_vm_segment(symbol.kind), symbol.index)
+
+    def _generateCall(self, call:jack_ast.SubroutineCall):
+        """
+        Writes a subroutine call used as a term, resolving the receiver in the same
+        two steps (and with the same symbol lookups) as CompilationEngine._compileTerm
+        """
+        full_fxn_name = call.name
+        n_args = 0
+
+        if call.receiver is not None:
+            var_name = call.receiver
+
+            if var_name not in self.built_in_classes:
+                try:
+                    if (symbol := self.symbol_table.lookup(var_name)).kind in ["field", "local"]:
+                        self.vm_writer.writePush(self._get_vm_segment(symbol.kind), symbol.index)
+                        n_args += 1
+                        var_name = symbol.type
+                except VariableNotFoundError:
+                    pass
+
+            try:
+                if var_name in self.built_in_classes:
+                    pass
+                elif (symbol := self.symbol_table.lookup(var_name)).kind in ["field", "local"]:
+                    self.vm_writer.writePush(self._get_vm_segment(symbol.kind), symbol.index)
+                    var_name = symbol.type
+                    n_args += 1
+            except VariableNotFoundError:
+                pass
+
+            full_fxn_name = f"{var_name}.{call.name}"
+
+        for argument in call.arguments:
+            self._generateExpression(argument)
+
+        self.vm_writer.writeCall(full_fxn_name, n_args + len(call.arguments))
+
+
+def _constant_term(term):
+    #CompilationEngine._peekConstantTerm over a term node: integer constants, unary
+    #ops on constant terms and parenthesized expressions of constant terms
+    kind = type(term)
+
+    if kind is jack_ast.IntegerConstant:
+        return term.value
+
+    if kind is jack_ast.UnaryOp:
+        value = _constant_term(term.term)
+
+        if value is None:
+            return None
+
+        return to_int16(-value) if term.operator == "-" else ~value
+
+    if kind is jack_ast.Parenthesized:
+        terms = term.expression.terms
+        value = _constant_term(terms[0])
+
+        for op, right in zip(term.expression.operators, terms[1:]):
+            if value is None:
+                return None
+
+            right = _constant_term(right)
+            if right is None:
+                return None
+
+            value = fold(op, value, right)
+
+        return value
+
+    return None
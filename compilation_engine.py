@@ -1,12 +1,68 @@
 import os
-from tokenizer import Tokenizer
+import time
+from diagnostics import TRACE, get_logger
+from tokenizer import Tokenizer, TokenType
+from vm_emitter import BUILT_IN_CLASSES, FOLDABLE_OPERATORS, VMEmitter, fold, to_int16
 from vm_writer import VM_Writer
 from symboltable import SymbolTable, VariableNotFoundError
 
-class CompilationEngine:
+
+logger = get_logger(__name__)
+
+#VM command each VM_Writer method emits (writeArithmetic emits its argument)
+_WRITER_COMMANDS = {"writePush": "push", "writePop": "pop", "writeArithmetic": None, "writeLabel": "label",
+                    "writeGoto": "goto", "writeIf": "if-goto", "writeCall": "call", "writeFunction": "function",
+                    "writeReturn": "return"}
+
+
+#_compile* routine -> the grammar rule it compiles. The other _compile* routines
+#(_compileFoldedExpression, _compileTermOrConstant) are helpers whose work belongs to
+#the rule that called them, so hooks and profiles do not report them as rules
+GRAMMAR_RULES = {
+    "_compileClass": "class",
+    "_compileClassVarDec": "classVarDec",
+    "_compileSubroutineDec": "subroutineDec",
+    "_compileParameterList": "parameterList",
+    "_compileSubroutineBody": "subroutineBody",
+    "_compilevarDec": "varDec",
+    "_compileStatements": "statements",
+    "_compileLet": "let",
+    "_compileIf": "if",
+    "_compileWhile": "while",
+    "_compileDo": "do",
+    "_compileReturn": "return",
+    "_compileExpression": "expression",
+    "_compileTerm": "term",
+    "_compileExpressionList": "expressionList",
+}
+
+
+class CompileHook:
+    """
+    Base class of compilation hooks, registered with CompilationEngine.add_hook
+
+    rule is a grammar rule compiled by a routine in GRAMMAR_RULES, e.g. "class", "subroutineDec",
+    "expression" or "term"; command is the VM command emitted, e.g. "push", "add"
+    or "call", and args are its arguments. Override any of the three.
+    """
+
+    def enter(self, rule:str):
+        pass
+
+    def exit(self, rule:str):
+        pass
+
+    def emit(self, command:str, args:tuple):
+        pass
+
+
+class CompilationEngine(VMEmitter):
 
    
-    def __init__(self, input_file):
+    def __init__(self, input_file, lexer:str="hand", streaming:bool=False, use_mmap:bool=False,
+                 buffered_output:bool=False, record_ir:bool=False, peephole_rules=None,
+                 fold_constants:bool=False, strength_reduce:bool=False, source:str=None, output_stream=None,
+                 stats=None, build_ast:bool=False):
 
         """
         Initializes the compilation engine
@@ -15,23 +71,61 @@ class CompilationEngine:
 
         input_file (str): Path to the input.jack file.
         output_file (str): Path to the output XML file.
+        lexer (str): Tokenizer backend, "hand" or "regex".
+        streaming (bool): Lex lazily while parsing instead of tokenizing the whole file up front.
+        use_mmap (bool): Lex a memory-mapped view of the file (regex lexer only).
+        buffered_output (bool): Collect the VM commands in memory and write the .vm file once on close.
+        record_ir (bool): Record the VM commands as per-subroutine instruction lists (vm_writer.ir).
+        peephole_rules (tuple): Peephole rules to run over the IR on close, e.g. peephole.DEFAULT_RULES.
+        fold_constants (bool): Evaluate integer constant subexpressions at compile time.
+        strength_reduce (bool): Replace Math.multiply/Math.divide calls by small or power-of-two constants with adds.
+        source (str): Jack source text to compile instead of reading input_file, which then only names it.
+        output_stream: Text stream (e.g. io.StringIO) that receives the VM code instead of the .vm file.
+        stats (stats.CompileStats): Filled in with phase timings and counters while the class compiles.
+        build_ast (bool): Parse the class into a jack_ast tree (self.ast) first, then generate its code from the tree.
         
         """
 
+        #path of the .vm file - the VM_Writer is the only sink that writes to it
         self.output_file = os.path.splitext(input_file)[0] + ".vm"
         self.input_file = input_file
-        self.tokenizer = Tokenizer(input_file=input_file)
-        self.vm_writer = VM_Writer(input_file.replace(".jack", ".vm"))
-        self.built_in_classes = ["Math", "String", "Array", "Output", "Screen", "Keyboard", "Memory", "Sys"]
+        self.stats = stats
+
+        if stats is not None:
+            stats.bytes_in = len(source.encode()) if source is not None else os.path.getsize(input_file)
+            start = time.perf_counter()
+
+        self.tokenizer = Tokenizer(input_file=input_file, lexer=lexer, streaming=streaming, use_mmap=use_mmap,
+                                   source=source)
+
+        if stats is not None:
+            stats.lex_seconds = time.perf_counter() - start
+
+        try:
+            self.vm_writer = VM_Writer(self.output_file, buffered=buffered_output, record_ir=record_ir,
+                                       peephole_rules=peephole_rules, stream=output_stream,
+                                       count_output=stats is not None)
+        except BaseException:
+            #a streaming tokenizer still holds the source file open
+            self.tokenizer.close()
+            raise
+
+        self.built_in_classes = BUILT_IN_CLASSES
         self.symbol_table = SymbolTable()
         self.class_name = ""
         self.tokenizer.index = 0
         self.indent_level = 0
         self._label_num=0
-        self.output = open(self.output_file, "w")
-
-        if self.tokenizer.tokens and len(self.tokenizer.tokens) > 0:
-            self.tokenizer.current_token = self.tokenizer.tokens[0]
+        self.fold_constants = fold_constants
+        self.strength_reduce = strength_reduce
+        self.build_ast = build_ast
+        #the jack_ast.Class of the compiled class, in build_ast mode
+        self.ast = None
+        #per-token logging is decided once per class, the hot paths only test this flag
+        self._trace = logger.isEnabledFor(TRACE)
+
+        if stats is not None:
+            self._instrument(stats)
             
         
 
@@ -51,9 +145,9 @@ class CompilationEngine:
         """
         token_type = self.tokenizer.tokenType()
 
-        if token_type == "KEYWORD":
+        if token_type is TokenType.KEYWORD:
             xml_line = f"<keyword>{token}</keyword>"
-        elif token_type == "SYMBOL":
+        elif token_type is TokenType.SYMBOL:
             # Escape symbols for XML
             if token == "<":
                 token = "&lt;"
@@ -62,11 +156,11 @@ class CompilationEngine:
             elif token == "&":
                 token = "&amp;"
             xml_line = f"<symbol>{token}</symbol>"
-        elif token_type == "INT_CONST":
+        elif token_type is TokenType.INT_CONST:
             xml_line = f"<integerConstant>{token}</integerConstant>"
-        elif token_type == "STRING_CONST":
+        elif token_type is TokenType.STRING_CONST:
             xml_line = f"<stringConstant>{self.tokenizer.stringVal()}</stringConstant>"
-        elif token_type == "IDENTIFIER":
+        elif token_type is TokenType.IDENTIFIER:
             xml_line = f"<identifier>{token}</identifier>"
         else:
             xml_line = token
@@ -79,29 +173,24 @@ class CompilationEngine:
         Checks if the current token matches the expected token.
         Raises a SyntaxError with a line number if it does not match.
         """
-        # Assuming tokens_with_line_numbers is a list of (token, line_number) pairs:
         current = self.tokenizer.current_token
         # Retrieve the line number for the current token
-        line_number = self.tokenizer.tokens_with_line_numbers[self.tokenizer.index][1] #get line number from the tuple
+        line_number = self.tokenizer.lineNumber()
         
         if current not in expected_token:
-            raise SyntaxError(f"Error on line {line_number}: expected either '{", ".join(map(str, expected_token))}' but received '{current}'")
+            raise SyntaxError(f"Error on line {line_number}: expected either '{', '.join(map(str, expected_token))}' but received '{current}'")
         
 
 
-    #generate label helper
-    def _generate_label(self, prefix: str) -> str:
-        self._label_num += 1
-        return f"{prefix}_{self._label_num}"
-
-    #mapping vm segments
-    def _get_vm_segment(self, kind:str)->str:
-        return "this" if kind == "field"  else kind
-
     def _compileClass(self):
         try:
 
-            print(f"Starting compilation of class: {self.input_file}")
+            logger.debug("Starting compilation of class: %s", self.input_file)
+            self._expectClassStart()
+
+            if self.build_ast:
+                self._generateFromAst()
+                return
           
             #---------------------------------
             #process the 'class' keyword
@@ -109,7 +198,7 @@ class CompilationEngine:
             self.tokenizer.advance() #advance from class keyword
 
             self.class_name = self.tokenizer.current_token #save class name
-            print(f"Saved class name : {self.class_name}")
+            logger.debug("Saved class name : %s", self.class_name)
             self.tokenizer.advance() #currently at '{'
 
 
@@ -123,27 +212,30 @@ class CompilationEngine:
             #process classVar
             while self.tokenizer.current_token in ["static", "field"]:
 
-                print(f"Advancing to _compileClassVarDec current token is : {self.tokenizer.current_token}")
+                if self._trace:
+                    logger.log(TRACE, "Advancing to _compileClassVarDec current token is : %s", self.tokenizer.current_token)
                 self._compileClassVarDec() #compile the variables
                 #self.tokenizer.advance()
             
             #consume the  '}'
             #self.tokenizer.advance()
-            print(f"Proceeding to constructor/method level the current token is : {self.tokenizer.current_token}")
+            if self._trace:
+                logger.log(TRACE, "Proceeding to constructor/method level the current token is : %s", self.tokenizer.current_token)
 
             #self.tokenizer.advance()
 
             # process subroutines
             while self.tokenizer.current_token in ["constructor","method","function"]:
-                print(f"Advancing to _compilesubroutine current token is : {self.tokenizer.current_token}")
+                if self._trace:
+                    logger.log(TRACE, "Advancing to _compilesubroutine current token is : %s", self.tokenizer.current_token)
                 self._compileSubroutineDec() #compile subroutines
 
             
             #process the '}' of the class
             #self._expect_token(expected_token=["}"])
             #self._write_token(self.tokenizer.current_token)
-            print(f"Done with the constructor/method current token is {self.tokenizer.current_token}")
-            self.tokenizer.advance()  #advance from '}'
+            logger.debug("Done with the constructor/method current token is %s", self.tokenizer.current_token)
+            self._expectClassEnd()
 
 
             #reduce indent level when closing the class node
@@ -153,13 +245,46 @@ class CompilationEngine:
             #self._write("</class>")
 
         except Exception as e:
-            print(f"Error compiling class {self.input_file}: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.debug("Error compiling class %s: %s", self.input_file, e)
             raise
 
 
 
+    def _expectClassStart(self):
+        #the source must start with a class
+        if not self.tokenizer.hasMoreTokens():
+            raise SyntaxError(f"Error in {self.input_file}: expected a class but the source is empty")
+
+        self._expect_token(["class"])
+
+    def _expectClassEnd(self):
+        #the class's closing '}' must be the current token and the last one of the source
+        tokenizer = self.tokenizer
+
+        if not tokenizer.hasMoreTokens():
+            raise SyntaxError(f"Error on line {tokenizer.lineNumber()}: class {self.class_name} is not closed, "
+                              f"expected '}}' before the end of the source")
+
+        self._expect_token(["}"])
+        tokenizer.advance()
+
+        if tokenizer.hasMoreTokens():
+            raise SyntaxError(f"Error on line {tokenizer.lineNumber()}: unexpected '{tokenizer.current_token}' "
+                              f"after the end of class {self.class_name}")
+
+    def _generateFromAst(self):
+        #parse the whole class into self.ast, then walk it to write the VM code
+        import jack_ast  # only needed in build_ast mode
+        from code_generator import CodeGenerator
+
+        self.ast = jack_ast.parse_class(self.tokenizer)
+        self.class_name = self.ast.name
+        self._expectClassEnd()
+        logger.debug("Parsed class %s, generating code", self.class_name)
+
+        CodeGenerator(self.vm_writer, self.symbol_table, fold_constants=self.fold_constants,
+                      strength_reduce=self.strength_reduce).generate(self.ast)
+
     def _compileClassVarDec(self):
         """
         compile the class variable declarations
@@ -168,20 +293,23 @@ class CompilationEngine:
         
         """
 
-        print(f"currently inside _compileClassVarDec current token is : {self.tokenizer.current_token}")
+        if self._trace:
+            logger.log(TRACE, "currently inside _compileClassVarDec current token is : %s", self.tokenizer.current_token)
         #get kind
         kind = self.tokenizer.current_token #either static|field
         self.tokenizer.advance() #advance to type
 
         #get type
         type_ = self.tokenizer.current_token
-        print(f"getting type which is : {self.tokenizer.current_token}")
+        if self._trace:
+            logger.log(TRACE, "getting type which is : %s", self.tokenizer.current_token)
         self.tokenizer.advance() #advance to variable name
 
 
         #get name
         name = self.tokenizer.current_token
-        print(f"getting name is : {self.tokenizer.current_token}")
+        if self._trace:
+            logger.log(TRACE, "getting name is : %s", self.tokenizer.current_token)
         self.tokenizer.advance() #advance to , if any
 
         #append symbol table
@@ -191,7 +319,8 @@ class CompilationEngine:
             type=type_,
             kind=kind
         )
-        print(f"updated symbol table : {self.symbol_table._symbol_table}")
+        if self._trace:
+            logger.log(TRACE, "updated symbol table : %s", self.symbol_table._symbol_table)
 
 
         #next token - there might be 0 or more occurences
@@ -201,7 +330,8 @@ class CompilationEngine:
             self.tokenizer.advance()
 
             #get name
-            print(f"getting name of the next variable: {self.tokenizer.current_token}")
+            if self._trace:
+                logger.log(TRACE, "getting name of the next variable: %s", self.tokenizer.current_token)
             name = self.tokenizer.current_token
             self.tokenizer.advance()
 
@@ -211,13 +341,14 @@ class CompilationEngine:
                 type=type_,
                 kind=kind
             )
-            print(f"updating symbol table : {self.symbol_table._symbol_table}")
-
-            print(f"Current token is {self.tokenizer.current_token}")
+            if self._trace:
+                logger.log(TRACE, "updating symbol table : %s", self.symbol_table._symbol_table)
+                logger.log(TRACE, "Current token is %s", self.tokenizer.current_token)
 
             #advance to next variable if any
             #self.tokenizer.advance() #advance from the ';'
-            print(f"Done with compileclassVar while loop current token : {self.tokenizer.current_token}")
+            if self._trace:
+                logger.log(TRACE, "Done with compileclassVar while loop current token : %s", self.tokenizer.current_token)
 
 
 
@@ -225,7 +356,8 @@ class CompilationEngine:
         self.tokenizer.advance()
 
         #self.tokenizer.advance()
-        print(f"Done with the compileClassvarDec current token is : {self.tokenizer.current_token}")
+        if self._trace:
+            logger.log(TRACE, "Done with the compileClassvarDec current token is : %s", self.tokenizer.current_token)
 
 
 
@@ -238,10 +370,12 @@ class CompilationEngine:
 
         
         """
-        print(f"currently inside compilesubroutineDec : {self.tokenizer.current_token}")
+        if self._trace:
+            logger.log(TRACE, "currently inside compilesubroutineDec : %s", self.tokenizer.current_token)
         #handle keyword function, method, constructor
         subroutine_type = self.tokenizer.current_token
-        print(f"determining subroutine type : {subroutine_type}")
+        if self._trace:
+            logger.log(TRACE, "determining subroutine type : %s", subroutine_type)
         self.tokenizer.advance() #advance from the keyword
 
         #process return type or void
@@ -250,7 +384,7 @@ class CompilationEngine:
         #process full subroutinename(identifier)
         subroutine_name = self.tokenizer.current_token
         full_name = f"{self.class_name}.{subroutine_name}"
-        print(f"getting subroutine fullname : {full_name}")
+        logger.debug("getting subroutine fullname : %s", full_name)
         self.tokenizer.advance()
 
 
@@ -260,7 +394,8 @@ class CompilationEngine:
 
         #reset symbol table
         self.symbol_table._startSubroutine()
-        print(f"reseting symbol table : {self.symbol_table._symbol_table}")
+        if self._trace:
+            logger.log(TRACE, "reseting symbol table : %s", self.symbol_table._symbol_table)
         self._label_num = 0  # Reset label counter for each subroutine
 
 
@@ -272,24 +407,27 @@ class CompilationEngine:
                 type=self.class_name,
                 kind="argument"
             )
-            print(f"subroutine is a method so handling this: {self.symbol_table._symbol_table}")
+            if self._trace:
+                logger.log(TRACE, "subroutine is a method so handling this: %s", self.symbol_table._symbol_table)
 
         
 
         #parameter list ? (optional)
-        print(f"parameter list?")
+        if self._trace:
+            logger.log(TRACE, "parameter list?")
         self._compileParameterList()
 
 
         # handle ')'
         self.tokenizer.advance()
-        print(f"Current token after compiledParameter list's closing bracket ) is : {self.tokenizer.current_token}")
+        if self._trace:
+            logger.log(TRACE, "Current token after compiledParameter list's closing bracket ) is : %s", self.tokenizer.current_token)
 
         #handle '{'
 
 
         #process subroutine body
-        print(f"processing subroutine body for: {full_name, subroutine_type}")
+        logger.debug("processing subroutine body for: %s %s", full_name, subroutine_type)
         self._compileSubroutineBody(full_name, subroutine_type)
 
 
@@ -306,7 +444,8 @@ class CompilationEngine:
         #handle '{'
         self.tokenizer.advance()
 
-        print(f"Current token is {self.tokenizer.current_token}")
+        if self._trace:
+            logger.log(TRACE, "Current token is %s", self.tokenizer.current_token)
 
         #handle varDec*
         while self.tokenizer.current_token == "var":
@@ -315,7 +454,7 @@ class CompilationEngine:
 
         #local variables number 
         num_locals = self.symbol_table._varCount(kind="local")
-        print(f"Number of local variables is {num_locals}")
+        logger.debug("Number of local variables is %s", num_locals)
 
         #write VM function decl command
         self.vm_writer.writeFunction(name=full_function_name, nLocals=num_locals)
@@ -324,11 +463,11 @@ class CompilationEngine:
         #handle constructors
         if subroutine_type == "constructor":
 
-            print(f"Handling constructor: {full_function_name}")
+            logger.debug("Handling constructor: %s", full_function_name)
 
             #get fields for object size - OS memory.alloc
             num_fields = self.symbol_table._varCount(kind="field")
-            print(f"Number of fields: {num_fields}")
+            logger.debug("Number of fields: %s", num_fields)
             self.vm_writer.writePush(memory_segment="constant", index=num_fields)
 
             #allocate memory
@@ -336,14 +475,16 @@ class CompilationEngine:
 
             self.vm_writer.writePop(memory_segment="pointer", index=0) #align THIS to the base address
 
-            print(f"Current token after writing pop to set this : {self.tokenizer.current_token}")
+            if self._trace:
+                logger.log(TRACE, "Current token after writing pop to set this : %s", self.tokenizer.current_token)
 
         elif subroutine_type == "method":
             self.vm_writer.writePush(memory_segment="argument", index=0)
             self.vm_writer.writePop(memory_segment="pointer", index=0)
 
 
-        print(f"Current token before moving to compile statements : {self.tokenizer.current_token}")
+        if self._trace:
+            logger.log(TRACE, "Current token before moving to compile statements : %s", self.tokenizer.current_token)
         #process statements
         self._compileStatements()
 
@@ -387,16 +528,19 @@ class CompilationEngine:
     def _compileParameterList(self):
         """Compiles a (possibly empty) parameter list"""
 
-        print(f"inside parameter list ....")    # Check if it's empty
+        if self._trace:
+            logger.log(TRACE, "inside parameter list ....")    # Check if it's empty
         if self.tokenizer.current_token != ")":
             # Process first parameter
             param_type = self.tokenizer.current_token
-            print(f"Getting the type of first param : {self.tokenizer.current_token}: {param_type}")
+            if self._trace:
+                logger.log(TRACE, "Getting the type of first param : %s: %s", self.tokenizer.current_token, param_type)
             self.tokenizer.advance()
             
             # Get parameter name
             param_name = self.tokenizer.current_token
-            print(f"Getting the name of first param : {self.tokenizer.current_token}: {param_name}")
+            if self._trace:
+                logger.log(TRACE, "Getting the name of first param : %s: %s", self.tokenizer.current_token, param_name)
             self.tokenizer.advance()
             
             # Add to symbol table
@@ -405,7 +549,8 @@ class CompilationEngine:
                 type=param_type,
                 kind="argument"
             )
-            print(f"updating symbol table : {self.symbol_table._symbol_table}")
+            if self._trace:
+                logger.log(TRACE, "updating symbol table : %s", self.symbol_table._symbol_table)
             
             # Handle additional parameters
             while self.tokenizer.current_token == ',':
@@ -413,12 +558,14 @@ class CompilationEngine:
                 
                 # Get next parameter type
                 param_type = self.tokenizer.current_token
-                print(f"Getting the type of next param : {self.tokenizer.current_token}: {param_type}")
+                if self._trace:
+                    logger.log(TRACE, "Getting the type of next param : %s: %s", self.tokenizer.current_token, param_type)
                 self.tokenizer.advance()
                 
                 # Get next parameter name
                 param_name = self.tokenizer.current_token
-                print(f"Getting the name of next param : {self.tokenizer.current_token}: {param_name}")
+                if self._trace:
+                    logger.log(TRACE, "Getting the name of next param : %s: %s", self.tokenizer.current_token, param_name)
                 self.tokenizer.advance()
                 
                 # Add to symbol table
@@ -429,8 +576,9 @@ class CompilationEngine:
                 )
 
 
-        print(f"Now this is the symbol table: {self.symbol_table._symbol_table}")
-        print(f"This is the current token : {self.tokenizer.current_token}")
+        if self._trace:
+            logger.log(TRACE, "Now this is the symbol table: %s", self.symbol_table._symbol_table)
+            logger.log(TRACE, "This is the current token : %s", self.tokenizer.current_token)
         
         return  # No need to advance past the closing parenthesis here
         
@@ -502,8 +650,9 @@ class CompilationEngine:
 
         #get variable name
         var_name = self.tokenizer.current_token
-        memory_segment = self._get_vm_segment(self.symbol_table._kindof(name=var_name))
-        index = self.symbol_table._indexof(name=var_name)
+        symbol = self.symbol_table.lookup(var_name)
+        memory_segment = self._get_vm_segment(symbol.kind)
+        index = symbol.index
         self.tokenizer.advance()
 
         is_array = False
@@ -688,7 +837,10 @@ class CompilationEngine:
         Grammar: expression: term (op term)*
         """
 
-      
+        if self.fold_constants or self.strength_reduce:
+            self._compileFoldedExpression()
+            return
+
         #handle first term
         self._compileTerm()
 
@@ -704,35 +856,127 @@ class CompilationEngine:
             #process next term
             self._compileTerm()
 
-            if op == "+":
-                self.vm_writer.writeArithmetic("add")
+            self._writeOperator(op)
+
+
+    def _compileFoldedExpression(self):
+        """
+        compiles expression, folding constant terms at compile time and/or
+        strength-reducing multiplications and divisions by constants
 
-            elif op == "-":
-                self.vm_writer.writeArithmetic("sub")
+        A constant term is kept as a pending value and only pushed
+        once a term that is not constant follows.
+        """
 
-            elif op == "*":
-                self.vm_writer.writeCall("Math.multiply", 2)
+        #handle first term
+        pending = self._compileTermOrConstant()
 
-            elif op == "/":
-                self.vm_writer.writeCall("Math.divide", 2)
+        self._writeFoldedOperations(pending, self._foldableOperands(), lambda right: self._compileTerm(),
+                                    lambda right: self._skipTokens(right[1]))
 
-            elif op == "=":
-                self.vm_writer.writeArithmetic("eq")
 
-            elif op == "&":
-                self.vm_writer.writeArithmetic("and")
+    def _foldableOperands(self):
+        #(op, constant value of the right term or None, (value, length) of that constant)
+        #for each 'op term' after the first term; the term is compiled or skipped by the caller
+        while self.tokenizer.current_token in FOLDABLE_OPERATORS:
 
-            elif op == "|":
-                self.vm_writer.writeArithmetic("or")
+            op = self.tokenizer.current_token
+            self.tokenizer.advance()
 
-            elif op == "<":
-                self.vm_writer.writeArithmetic("lt")
+            right = self._peekConstant(0)
+            yield op, None if right is None else right[0], right
 
-            elif op == ">":
-                self.vm_writer.writeArithmetic("gt")
 
-            else:
-                pass
+    def _compileTermOrConstant(self):
+        """
+        Returns the value of the current term without writing anything if it is
+        an integer constant, otherwise compiles the term and returns None
+        """
+        constant = self._peekConstant(0)
+
+        if constant is None:
+            self._compileTerm()
+            return None
+
+        value, length = constant
+        self._skipTokens(length)
+        return value
+
+
+    def _peekConstant(self, offset:int):
+        #a constant term as _peekConstantTerm finds it, or only a plain integer when folding is off
+        if self.fold_constants:
+            return self._peekConstantTerm(offset)
+
+        token = self.tokenizer.peek(offset)
+        if token is not None and token.type is TokenType.INT_CONST:
+            return token.int_value, offset + 1
+
+        return None
+
+
+    def _peekConstantTerm(self, offset:int):
+        """
+        Looks ahead, without consuming tokens, for an integer constant term starting
+        offset tokens after the current one
+
+        Returns (value, offset after the term) or None if the term is not constant
+        """
+        token = self.tokenizer.peek(offset)
+
+        if token is None:
+            return None
+
+        if token.type is TokenType.INT_CONST:
+            return token.int_value, offset + 1
+
+        #unary op applied to a constant term
+        if token.value in ("-", "~"):
+            operand = self._peekConstantTerm(offset + 1)
+
+            if operand is None:
+                return None
+
+            value, end = operand
+            return (to_int16(-value) if token.value == "-" else ~value), end
+
+        #parenthesized expression made only of constant terms
+        if token.value == "(":
+            constant = self._peekConstantTerm(offset + 1)
+
+            if constant is None:
+                return None
+
+            value, end = constant
+            while True:
+                token = self.tokenizer.peek(end)
+
+                if token is None:
+                    return None
+
+                if token.value == ")":
+                    return value, end + 1
+
+                if token.value not in FOLDABLE_OPERATORS:
+                    return None
+
+                right = self._peekConstantTerm(end + 1)
+                if right is None:
+                    return None
+
+                value = fold(token.value, value, right[0])
+                if value is None:
+                    return None
+                end = right[1]
+
+        return None
+
+
+    def _skipTokens(self, count:int):
+        #advance past tokens that were already evaluated by lookahead
+        for _ in range(count):
+            self.tokenizer.advance()
+
 
 
     def _compileTerm(self):
@@ -742,19 +986,21 @@ class CompilationEngine:
 
         """
         token = self.tokenizer.current_token
+        token_type = self.tokenizer.tokenType()
 
-        # Debugging: Print the variable being accessed
-        print(f"DEBUG: Accessing variable `{token}` in scope `{self.symbol_table._current_scope}`")
+        # Debugging: log the term being compiled
+        if self._trace:
+            logger.log(TRACE, "Accessing variable `%s` in scope `%s`", token, self.symbol_table._current_scope)
 
 
         #1. integer constant eg 1,2,3...
         #case 1
-        if token.isdigit():
-            self.vm_writer.writePush("constant", int(token))
+        if token_type is TokenType.INT_CONST:
+            self.vm_writer.writePush("constant", self.tokenizer.intVal())
             self.tokenizer.advance()
 
         #case 2. string constant
-        elif token.startswith('"') :
+        elif token_type is TokenType.STRING_CONST:
             string_content = self.tokenizer.stringVal()
             length = len(string_content)
             self.vm_writer.writePush("constant", length)
@@ -823,10 +1069,10 @@ class CompilationEngine:
                 #process ']'
                 self.tokenizer.advance()
 
-                segment = self._get_vm_segment(self.symbol_table._kindof(var_name))
-                index = self.symbol_table._indexof(var_name)
+                symbol = self.symbol_table.lookup(var_name)
+                segment = self._get_vm_segment(symbol.kind)
 
-                self.vm_writer.writePush(segment, index) #arr+i
+                self.vm_writer.writePush(segment, symbol.index) #arr+i
                 self.vm_writer.writeArithmetic("add")
 
 
@@ -861,12 +1107,11 @@ class CompilationEngine:
                             if var_name in self.built_in_classes:
                                 # It's a built-in class, no need to look it up in the symbol table
                                 pass
-                            elif self.symbol_table._kindof(var_name) in ["field","local"]:
-                                segment = self._get_vm_segment(self.symbol_table._kindof(var_name))
-                                index = self.symbol_table._indexof(var_name)
-                                self.vm_writer.writePush(segment,index)
+                            elif (symbol := self.symbol_table.lookup(var_name)).kind in ["field","local"]:
+                                segment = self._get_vm_segment(symbol.kind)
+                                self.vm_writer.writePush(segment,symbol.index)
                                 n_args+=1
-                                var_name = self.symbol_table._typeof(var_name)
+                                var_name = symbol.type
                                 full_fxn_name = f"{var_name}.{method_name}"
 
                             else:
@@ -880,11 +1125,10 @@ class CompilationEngine:
                         if var_name in self.built_in_classes:
                             # It's a built-in class, no need to look it up in the symbol table
                             pass
-                        elif self.symbol_table._kindof(var_name) in ["field","local"]:
-                            segment = self._get_vm_segment(self.symbol_table._kindof(var_name))
-                            index = self.symbol_table._indexof(var_name)
-                            self.vm_writer.writePush(segment,index) #push this
-                            var_name = self.symbol_table._typeof(var_name)
+                        elif (symbol := self.symbol_table.lookup(var_name)).kind in ["field","local"]:
+                            segment = self._get_vm_segment(symbol.kind)
+                            self.vm_writer.writePush(segment,symbol.index) #push this
+                            var_name = symbol.type
                             n_args+=1 #first argument this
                     except VariableNotFoundError:
                         # If it's not in the symbol table, assume it's a class name
@@ -910,10 +1154,10 @@ class CompilationEngine:
 
             #case 6c
             else:
-                segment = self._get_vm_segment(self.symbol_table._kindof(var_name))
-                index = self.symbol_table._indexof(var_name)
+                symbol = self.symbol_table.lookup(var_name)
+                segment = self._get_vm_segment(symbol.kind)
 
-                self.vm_writer.writePush(segment,index)
+                self.vm_writer.writePush(segment,symbol.index)
 
 
 
@@ -942,13 +1186,12 @@ class CompilationEngine:
             else:
                 # Check if identifier is a variable (field/local)
                 try:
-                    kind = self.symbol_table._kindof(identifier)
-                    if kind in ["field", "local"]:
-                        segment = self._get_vm_segment(kind)
-                        index = self.symbol_table._indexof(identifier)
-                        self.vm_writer.writePush(segment, index)
+                    symbol = self.symbol_table.lookup(identifier)
+                    if symbol.kind in ["field", "local"]:
+                        segment = self._get_vm_segment(symbol.kind)
+                        self.vm_writer.writePush(segment, symbol.index)
                         n_args += 1
-                        class_name = self.symbol_table._typeof(identifier)
+                        class_name = symbol.type
                         full_fxn_name = f"{class_name}.{method_name}"
                     else:
                         # Static call (e.g., Main.helper)
@@ -988,12 +1231,10 @@ class CompilationEngine:
         self.tokenizer.advance()
 
         # Check if we're in a constructor
-        is_constructor = False
-        for scope in self.symbol_table._symbol_table.values():
-            for var in scope:
-                if var.get("name") == "this" and var.get("kind") == "argument":
-                    is_constructor = True
-                    break
+        try:
+            is_constructor = self.symbol_table.lookup("this").kind == "argument"
+        except VariableNotFoundError:
+            is_constructor = False
 
         # Process expression if any
         if self.tokenizer.current_token == ";":
@@ -1040,13 +1281,138 @@ class CompilationEngine:
 
         return count
 
-    def _close(self):
-        """Close output file"""
-        if hasattr(self, 'vm_writer') and self.vm_writer:
-            self.vm_writer.close()
-        if hasattr(self, 'output') and self.output:
-            self.output.close()
+    def _close(self, discard:bool=False):
+        """
+        Releases the source and the output sink, safe to call more than once
+
+        With discard, buffered VM code is dropped instead of written (used when
+        compilation failed)
+        """
+        try:
+            self.tokenizer.close()
+        finally:
+            self.vm_writer.close(discard=discard)
+
+    def _instrument(self, stats):
+        #time and count this engine's work into stats by wrapping methods on this
+        #instance only, so engines without stats run the plain methods
+        compile_class = self._compileClass
+        lookup = self.symbol_table.lookup
+        close_writer = self.vm_writer.close
+
+        def timed_compile_class():
+            start = time.perf_counter()
+            try:
+                compile_class()
+            finally:
+                stats.compile_seconds += time.perf_counter() - start
+                tokenizer = self.tokenizer
+                stats.tokens = tokenizer.index if tokenizer.streaming else len(tokenizer.tokens)
+
+        def counted_lookup(name:str):
+            stats.symbol_lookups += 1
+            return lookup(name)
+
+        def timed_close(discard:bool=False):
+            start = time.perf_counter()
+            try:
+                close_writer(discard=discard)
+            finally:
+                stats.write_seconds += time.perf_counter() - start
+                stats.vm_instructions = self.vm_writer.instructions_written
+                stats.bytes_out = self.vm_writer.bytes_written
+
+        self._compileClass = timed_compile_class
+        self.symbol_table.lookup = counted_lookup
+        self.vm_writer.close = timed_close
+
+    def add_hook(self, hook:CompileHook):
+        """
+        Registers hook to be told about every grammar rule entered and exited
+        and every VM command emitted from now on
+
+        The routines and writer methods are wrapped on this instance only, when the
+        first hook is added, so engines without hooks run the plain methods
+        """
+        hooks = self.__dict__.get("_hooks")
+
+        if hooks is None:
+            hooks = self._hooks = []
+            self._install_hooks(hooks)
+
+        hooks.append(hook)
+
+    def remove_hook(self, hook:CompileHook):
+        #unregister hook; without hooks left the plain methods are restored
+        self._hooks.remove(hook)
+
+        if not self._hooks:
+            for target, name, original in self._unhooked:
+                if original is None:
+                    delattr(target, name)
+                else:
+                    setattr(target, name, original)
+            del self._hooks, self._unhooked
+
+    def _install_hooks(self, hooks:list):
+        #wrap what is there now - possibly already wrapped by _instrument - and
+        #remember the instance attributes the wrappers replace
+        self._unhooked = []
+
+        def wrap(target, name:str, wrapper):
+            self._unhooked.append((target, name, target.__dict__.get(name)))
+            setattr(target, name, wrapper)
+
+        def hooked_rule(rule:str, routine):
+            def hooked(*args, **kwargs):
+                for hook in hooks:
+                    hook.enter(rule)
+                try:
+                    return routine(*args, **kwargs)
+                finally:
+                    for hook in hooks:
+                        hook.exit(rule)
+            return hooked
+
+        def hooked_emit(command, write):
+            def hooked(*args, **kwargs):
+                write(*args, **kwargs)
+                #the engine passes writer arguments in parameter order, by position or keyword
+                args += tuple(kwargs.values())
+                for hook in hooks:
+                    hook.emit(command or args[0], args)
+            return hooked
+
+        for name, rule in GRAMMAR_RULES.items():
+            wrap(self, name, hooked_rule(rule, getattr(self, name)))
+
+        for name, command in _WRITER_COMMANDS.items():
+            wrap(self.vm_writer, name, hooked_emit(command, getattr(self.vm_writer, name)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        #a failed compilation does not replace the .vm file with partial output
+        self._close(discard=exc_type is not None)
+
+
+def compile_source(text:str, class_name:str, **engine_options) -> str:
+    """
+    Compiles the Jack source text of one class and returns its VM code
+
+    Nothing is read from or written to the filesystem. engine_options are the
+    CompilationEngine options (lexer, streaming, buffered_output, record_ir,
+    peephole_rules, fold_constants, strength_reduce, build_ast)
 
+    Raises SyntaxError when text is empty, does not start with a class, ends before
+    the class's closing '}' or goes on after it
+    """
+    import io
 
+    output = io.StringIO()
 
+    with CompilationEngine(input_file=f"{class_name}.jack", source=text, output_stream=output, **engine_options) as engine:
+        engine._compileClass()
 
+    return output.getvalue()
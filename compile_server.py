@@ -0,0 +1,228 @@
+import diagnostics
+import json
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import time
+from compilation_engine import CompilationEngine, compile_source
+
+"""
+* Compile server: keeps the compiler loaded in one long-running process and compiles
+* on request over a Unix domain socket, so a compile does not pay for starting and
+* importing a fresh interpreter.
+*
+* Protocol: JSON lines. Each request is one JSON object on one line, answered by one
+* JSON object on one line. A connection may send any number of requests.
+*
+*   {"path": "/abs/Main.jack"}                      compile a file, its .vm file is written as usual
+*   {"source": "class Main {...}", "class_name": "Main"}   compile source text in memory
+*   {"op": "shutdown"}                              stop the server
+*
+* Replies: {"ok": true, "vm": "<vm text>", "elapsed_ms": 1.2}
+*          {"ok": false, "error": "<diagnostic>", "elapsed_ms": 0.4}
+
+"""
+
+logger = diagnostics.get_logger(__name__)
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), f"jack-compile-{os.getuid()}.sock")
+
+
+def _compile_path(input_file:str, engine_options:dict) -> str:
+    #compile a .jack file to its .vm file and return the VM text
+    with CompilationEngine(input_file=input_file, **engine_options) as engine:
+        engine._compileClass()
+
+    with open(engine.vm_writer.output_file_name) as f:
+        return f.read()
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        #one reply line per request line, until the client hangs up
+        for line in self.rfile:
+            if not line.strip():
+                continue
+
+            reply = self.server.dispatch(line)
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+            self.wfile.flush()
+
+            if self.server.stopping:
+                break
+
+
+class CompileServer(socketserver.UnixStreamServer):
+
+    def __init__(self, socket_path:str=DEFAULT_SOCKET, **engine_options):
+        """
+        Binds the server to socket_path (owner access only)
+
+        engine_options are passed to every CompilationEngine, as in JackAnalyzer
+        """
+        self.socket_path = socket_path
+        self.engine_options = engine_options
+        self.stopping = False
+
+        if os.path.exists(socket_path):
+            _remove_stale_socket(socket_path)
+
+        umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, _RequestHandler)
+        finally:
+            os.umask(umask)
+
+    def serve(self):
+        #handle requests until a shutdown request arrives
+        logger.info("Compile server listening on %s", self.socket_path)
+
+        try:
+            while not self.stopping:
+                self.handle_request()
+        finally:
+            self.server_close()
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def dispatch(self, line:bytes) -> dict:
+        #run one request line and build its reply
+        start = time.perf_counter()
+
+        try:
+            request = json.loads(line)
+            reply = {"ok": True}
+
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+
+            op = request.get("op", "compile")
+
+            if op == "shutdown":
+                self.stopping = True
+            elif op != "compile":
+                raise ValueError(f"Unknown op '{op}'")
+            elif "path" in request:
+                reply["vm"] = _compile_path(request["path"], self.engine_options)
+            elif "source" in request:
+                class_name = request.get("class_name", "")
+                if not class_name.isidentifier():
+                    raise ValueError(f"Invalid class name '{class_name}'")
+                reply["vm"] = compile_source(request["source"], class_name, **self.engine_options)
+            else:
+                raise ValueError("compile request needs a 'path' or a 'source'")
+
+        except Exception as e:
+            reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+        reply["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        logger.debug("Request answered in %.3f ms: %s", reply["elapsed_ms"], "ok" if reply["ok"] else reply["error"])
+        return reply
+
+
+def _remove_stale_socket(socket_path:str):
+    #a socket file nobody listens on is left over from a server that died
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        probe.connect(socket_path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.unlink(socket_path)
+    else:
+        raise OSError(f"A compile server is already listening on {socket_path}")
+    finally:
+        probe.close()
+
+
+class CompileClient:
+
+    def __init__(self, socket_path:str=DEFAULT_SOCKET):
+        #thin client: one connection, one JSON line per request
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(socket_path)
+        self._reader = self._socket.makefile("rb")
+
+    def request(self, **request) -> dict:
+        self._socket.sendall(json.dumps(request).encode() + b"\n")
+        reply = self._reader.readline()
+
+        if not reply:
+            raise ConnectionError("Compile server closed the connection")
+
+        return json.loads(reply)
+
+    def compile_file(self, path:str) -> dict:
+        #the server resolves paths itself, so send an absolute one
+        return self.request(path=os.path.abspath(path))
+
+    def compile_text(self, source:str, class_name:str) -> dict:
+        return self.request(source=source, class_name=class_name)
+
+    def shutdown(self) -> dict:
+        return self.request(op="shutdown")
+
+    def close(self):
+        self._reader.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Jack compile server and client")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help=f"Unix socket path (default: {DEFAULT_SOCKET})")
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="log server start (-v) or every request (-vv)")
+    parser.add_argument("--trace", action="store_true", help="also log every token and term compiled")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="run the compile server")
+    serve.add_argument("--fold-constants", action="store_true", help="evaluate integer constant subexpressions at compile time")
+    serve.add_argument("--strength-reduce", action="store_true", help="compile multiplications by small or power-of-two constants to adds")
+    serve.add_argument("--peephole", action="store_true", help="run the peephole optimizer over the generated VM code")
+
+    compile_command = commands.add_parser("compile", help="compile .jack files on a running server")
+    compile_command.add_argument("files", nargs="+", help=".jack files to compile")
+
+    commands.add_parser("shutdown", help="stop a running server")
+
+    args = parser.parse_args()
+    diagnostics.configure(diagnostics.verbosity_level(args.verbose, args.trace))
+
+    if args.command == "serve":
+        from peephole import DEFAULT_RULES
+
+        CompileServer(args.socket,
+                      peephole_rules=DEFAULT_RULES if args.peephole else None,
+                      fold_constants=args.fold_constants,
+                      strength_reduce=args.strength_reduce).serve()
+
+    elif args.command == "compile":
+        failed = 0
+
+        with CompileClient(args.socket) as client:
+            for file in args.files:
+                reply = client.compile_file(file)
+
+                if reply["ok"]:
+                    print(f"{file}: compiled in {reply['elapsed_ms']:.1f} ms")
+                else:
+                    print(f"{file}: {reply['error']}")
+                    failed += 1
+
+        sys.exit(1 if failed else 0)
+
+    else:
+        with CompileClient(args.socket) as client:
+            client.shutdown()
@@ -0,0 +1,101 @@
+import sys
+
+"""
+* Logging levels and setup shared by the compiler modules
+* Every module logs to its own get_logger(__name__). Nothing below WARNING is shown
+* unless an entry point calls configure().
+*
+*   INFO   per-file progress (files compiled, skipped, rebuilt)
+*   DEBUG  per-declaration and per-statement progress of the compilation engine
+*   TRACE  per-token and per-term detail, including whole token lists
+*
+* The logging module costs more to import than the rest of the compiler, so it is
+* only imported once something needs it: configure() (-v, --trace), a record at
+* WARNING or above, or an importer that already uses logging itself. Until then
+* nothing can have lowered a level, so records below WARNING are dropped unlooked.
+*
+* Hot paths test a flag taken once per compilation unit (e.g. self._trace) before
+* logging, so disabled levels cost neither a call nor any formatting.
+
+"""
+
+#the logging module's levels, so callers need not import it
+TRACE = 5
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+
+def _logging():
+    #the logging module, with the TRACE level named
+    import logging
+
+    if logging.getLevelName(TRACE) != "TRACE":
+        logging.addLevelName(TRACE, "TRACE")
+    return logging
+
+
+class _LazyLogger:
+
+    __slots__ = ("name", "_logger")
+
+    def __init__(self, name:str):
+        self.name = name
+        self._logger = None
+
+    def _current(self):
+        #the real logger once the logging module is in use, otherwise None
+        if self._logger is None and "logging" in sys.modules:
+            self._logger = _logging().getLogger(self.name)
+        return self._logger
+
+    def isEnabledFor(self, level:int) -> bool:
+        logger = self._current()
+        return level >= WARNING if logger is None else logger.isEnabledFor(level)
+
+    def log(self, level:int, msg:str, *args, **kwargs):
+        logger = self._current()
+
+        if logger is None:
+            if level < WARNING:
+                return
+            logger = self._logger = _logging().getLogger(self.name)
+
+        logger.log(level, msg, *args, **kwargs)
+
+    def debug(self, msg:str, *args, **kwargs):
+        self.log(DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg:str, *args, **kwargs):
+        self.log(INFO, msg, *args, **kwargs)
+
+    def warning(self, msg:str, *args, **kwargs):
+        self.log(WARNING, msg, *args, **kwargs)
+
+    def error(self, msg:str, *args, **kwargs):
+        self.log(ERROR, msg, *args, **kwargs)
+
+
+def get_logger(name:str) -> _LazyLogger:
+    #logging.getLogger(name), without importing logging before it is needed
+    return _LazyLogger(name)
+
+
+def current_level() -> int:
+    #the root logger's level, WARNING while logging is not in use
+    if "logging" not in sys.modules:
+        return WARNING
+    return _logging().getLogger().getEffectiveLevel()
+
+
+def verbosity_level(verbose:int=0, trace:bool=False) -> int:
+    #logging level for -v (INFO), -vv (DEBUG) and --trace
+    if trace:
+        return TRACE
+    return (WARNING, INFO)[verbose] if verbose < 2 else DEBUG
+
+
+def configure(level:int=WARNING):
+    #send log records at level and above to stderr
+    _logging().basicConfig(level=level, format="%(levelname)s %(name)s: %(message)s")
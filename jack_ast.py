@@ -0,0 +1,422 @@
+from tokenizer import TokenType
+
+"""
+* Compact syntax tree of a Jack class
+* parse_class() reads a whole class from a Tokenizer in one pass and returns a Class
+* node; code_generator.CodeGenerator turns it into VM code. Several passes (analyzers,
+* optimizers, dumps) can walk the same tree instead of lexing and parsing again.
+*
+* The parser consumes tokens exactly like CompilationEngine does, and, like it, only
+* checks what it needs to build the tree. Names are not resolved here - the code
+* generator fills in the symbol table as it walks, as the engine does while parsing.
+*
+*   Class            name, class_var_decs, subroutines
+*   ClassVarDec      kind ("static"|"field"), type, names
+*   Subroutine       kind ("constructor"|"function"|"method"), return_type, name,
+*                    parameters [(type, name)], var_decs, statements
+*   VarDec           type, names
+*   statements       Let, If, While, Do, Return
+*   Expression       terms, operators (len(terms) == len(operators) + 1)
+*   terms            IntegerConstant, StringConstant, KeywordConstant, VarName,
+*                    ArrayAccess, SubroutineCall, UnaryOp, Parenthesized
+
+"""
+
+
+class Node:
+    __slots__ = ()
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Class(Node):
+    __slots__ = ("name", "class_var_decs", "subroutines")
+
+    def __init__(self, name:str, class_var_decs:list, subroutines:list):
+        self.name = name
+        self.class_var_decs = class_var_decs
+        self.subroutines = subroutines
+
+
+class ClassVarDec(Node):
+    __slots__ = ("kind", "type", "names")
+
+    def __init__(self, kind:str, type:str, names:list):
+        self.kind = kind
+        self.type = type
+        self.names = names
+
+
+class Subroutine(Node):
+    __slots__ = ("kind", "return_type", "name", "parameters", "var_decs", "statements")
+
+    def __init__(self, kind:str, return_type:str, name:str, parameters:list, var_decs:list, statements:list):
+        self.kind = kind
+        self.return_type = return_type
+        self.name = name
+        self.parameters = parameters
+        self.var_decs = var_decs
+        self.statements = statements
+
+
+class VarDec(Node):
+    __slots__ = ("type", "names")
+
+    def __init__(self, type:str, names:list):
+        self.type = type
+        self.names = names
+
+
+#statements
+
+class Let(Node):
+    __slots__ = ("name", "index", "value")
+
+    def __init__(self, name:str, index, value):
+        #index is the Expression between [] for array elements, otherwise None
+        self.name = name
+        self.index = index
+        self.value = value
+
+
+class If(Node):
+    __slots__ = ("condition", "statements", "else_statements")
+
+    def __init__(self, condition, statements:list, else_statements):
+        #else_statements is None without an else clause
+        self.condition = condition
+        self.statements = statements
+        self.else_statements = else_statements
+
+
+class While(Node):
+    __slots__ = ("condition", "statements")
+
+    def __init__(self, condition, statements:list):
+        self.condition = condition
+        self.statements = statements
+
+
+class Do(Node):
+    __slots__ = ("call",)
+
+    def __init__(self, call):
+        self.call = call
+
+
+class Return(Node):
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        #value is None for a bare return
+        self.value = value
+
+
+#expressions
+
+class Expression(Node):
+    __slots__ = ("terms", "operators")
+
+    def __init__(self, terms:list, operators:list):
+        self.terms = terms
+        self.operators = operators
+
+
+class IntegerConstant(Node):
+    __slots__ = ("value",)
+
+    def __init__(self, value:int):
+        self.value = value
+
+
+class StringConstant(Node):
+    __slots__ = ("value",)
+
+    def __init__(self, value:str):
+        self.value = value
+
+
+class KeywordConstant(Node):
+    __slots__ = ("value",)
+
+    def __init__(self, value:str):
+        #"true", "false", "null" or "this"
+        self.value = value
+
+
+class VarName(Node):
+    __slots__ = ("name",)
+
+    def __init__(self, name:str):
+        self.name = name
+
+
+class ArrayAccess(Node):
+    __slots__ = ("name", "index")
+
+    def __init__(self, name:str, index):
+        self.name = name
+        self.index = index
+
+
+class SubroutineCall(Node):
+    __slots__ = ("receiver", "name", "arguments")
+
+    def __init__(self, receiver, name:str, arguments:list):
+        #receiver is the class or variable name before the '.', None for name(...)
+        self.receiver = receiver
+        self.name = name
+        self.arguments = arguments
+
+
+class UnaryOp(Node):
+    __slots__ = ("operator", "term")
+
+    def __init__(self, operator:str, term):
+        self.operator = operator
+        self.term = term
+
+
+class Parenthesized(Node):
+    __slots__ = ("expression",)
+
+    def __init__(self, expression):
+        self.expression = expression
+
+
+_STATEMENT_KEYWORDS = ("let", "if", "while", "do", "return")
+
+_BINARY_OPERATORS = ("+", "-", "|", "&", "<", ">", "/", "*", "=")
+
+
+def walk(node):
+    #every node of the tree under node (included), parents before children
+    yield node
+
+    for name in node.__slots__:
+        value = getattr(node, name)
+
+        if isinstance(value, Node):
+            yield from walk(value)
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, Node):
+                    yield from walk(item)
+
+
+def parse_class(tokenizer) -> Class:
+    """
+    Parses the class the tokenizer is positioned on into a Class node
+
+    The tokenizer is left on the class's closing '}' (or wherever the class body
+    ended), so the caller can check that the class is complete
+    """
+    return _Parser(tokenizer).parse_class()
+
+
+class _Parser:
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+
+    def _take(self) -> str:
+        #the current token, advancing past it
+        token = self.tokenizer.current_token
+        self.tokenizer.advance()
+        return token
+
+    def parse_class(self) -> Class:
+        tokenizer = self.tokenizer
+
+        tokenizer.advance()  # 'class'
+        name = self._take()
+        tokenizer.advance()  # '{'
+
+        class_var_decs = []
+        while tokenizer.current_token in ("static", "field"):
+            kind = self._take()
+            class_var_decs.append(ClassVarDec(kind, self._take(), self._parseNames()))
+
+        subroutines = []
+        while tokenizer.current_token in ("constructor", "method", "function"):
+            subroutines.append(self._parseSubroutine())
+
+        return Class(name, class_var_decs, subroutines)
+
+    def _parseNames(self) -> list:
+        #varName (',' varName)* ';'
+        names = [self._take()]
+
+        while self.tokenizer.current_token == ",":
+            self.tokenizer.advance()
+            names.append(self._take())
+
+        self.tokenizer.advance()  # ';'
+        return names
+
+    def _parseSubroutine(self) -> Subroutine:
+        tokenizer = self.tokenizer
+
+        kind = self._take()
+        return_type = self._take()
+        name = self._take()
+        tokenizer.advance()  # '('
+
+        parameters = []
+        if tokenizer.current_token != ")":
+            parameters.append((self._take(), self._take()))
+
+            while tokenizer.current_token == ",":
+                tokenizer.advance()
+                parameters.append((self._take(), self._take()))
+
+        tokenizer.advance()  # ')'
+        tokenizer.advance()  # '{'
+
+        var_decs = []
+        while tokenizer.current_token == "var":
+            tokenizer.advance()
+            var_decs.append(VarDec(self._take(), self._parseNames()))
+
+        statements = self._parseStatements()
+        tokenizer.advance()  # '}'
+
+        return Subroutine(kind, return_type, name, parameters, var_decs, statements)
+
+    def _parseStatements(self) -> list:
+        tokenizer = self.tokenizer
+        statements = []
+
+        while tokenizer.current_token in _STATEMENT_KEYWORDS:
+            keyword = self._take()
+
+            if keyword == "let":
+                name = self._take()
+                index = None
+
+                if tokenizer.current_token == "[":
+                    tokenizer.advance()
+                    index = self._parseExpression()
+                    tokenizer.advance()  # ']'
+
+                tokenizer.advance()  # '='
+                statements.append(Let(name, index, self._parseExpression()))
+                tokenizer.advance()  # ';'
+
+            elif keyword == "if":
+                condition = self._parseBlockCondition()
+                body = self._parseBlock()
+                else_statements = None
+
+                if tokenizer.current_token == "else":
+                    tokenizer.advance()
+                    else_statements = self._parseBlock()
+
+                statements.append(If(condition, body, else_statements))
+
+            elif keyword == "while":
+                condition = self._parseBlockCondition()
+                statements.append(While(condition, self._parseBlock()))
+
+            elif keyword == "do":
+                statements.append(Do(self._parseCall(self._take())))
+                tokenizer.advance()  # ';'
+
+            else:
+                value = None
+                if tokenizer.current_token != ";":
+                    value = self._parseExpression()
+                tokenizer.advance()  # ';'
+                statements.append(Return(value))
+
+        return statements
+
+    def _parseBlockCondition(self) -> Expression:
+        #'(' expression ')'
+        self.tokenizer.advance()
+        condition = self._parseExpression()
+        self.tokenizer.advance()
+        return condition
+
+    def _parseBlock(self) -> list:
+        #'{' statements '}'
+        self.tokenizer.advance()
+        statements = self._parseStatements()
+        self.tokenizer.advance()
+        return statements
+
+    def _parseExpression(self) -> Expression:
+        terms = [self._parseTerm()]
+        operators = []
+
+        while self.tokenizer.current_token in _BINARY_OPERATORS:
+            operators.append(self._take())
+            terms.append(self._parseTerm())
+
+        return Expression(terms, operators)
+
+    def _parseTerm(self):
+        tokenizer = self.tokenizer
+        token = tokenizer.current_token
+        token_type = tokenizer.tokenType()
+
+        if token_type is TokenType.INT_CONST:
+            term = IntegerConstant(tokenizer.intVal())
+            tokenizer.advance()
+
+        elif token_type is TokenType.STRING_CONST:
+            term = StringConstant(tokenizer.stringVal())
+            tokenizer.advance()
+
+        elif token in ("true", "false", "null", "this"):
+            term = KeywordConstant(token)
+            tokenizer.advance()
+
+        elif token == "(":
+            tokenizer.advance()
+            term = Parenthesized(self._parseExpression())
+            tokenizer.advance()  # ')'
+
+        elif token in ("-", "~"):
+            tokenizer.advance()
+            term = UnaryOp(token, self._parseTerm())
+
+        else:
+            tokenizer.advance()
+
+            if tokenizer.current_token == "[":
+                tokenizer.advance()
+                term = ArrayAccess(token, self._parseExpression())
+                tokenizer.advance()  # ']'
+
+            elif tokenizer.current_token in ("(", "."):
+                term = self._parseCall(token)
+
+            else:
+                term = VarName(token)
+
+        return term
+
+    def _parseCall(self, name:str) -> SubroutineCall:
+        #the rest of a subroutine call whose first name was just consumed
+        tokenizer = self.tokenizer
+        receiver = None
+
+        if tokenizer.current_token == ".":
+            tokenizer.advance()
+            receiver, name = name, self._take()
+
+        tokenizer.advance()  # '('
+
+        arguments = []
+        if tokenizer.current_token != ")":
+            arguments.append(self._parseExpression())
+
+            while tokenizer.current_token == ",":
+                tokenizer.advance()
+                arguments.append(self._parseExpression())
+
+        tokenizer.advance()  # ')'
+        return SubroutineCall(receiver, name, arguments)
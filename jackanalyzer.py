@@ -1,50 +1,310 @@
 from compilation_engine import CompilationEngine
-import sys
+from collections import namedtuple
+from itertools import repeat
+from tokenizer import LEXERS
+import diagnostics
 import os
+import sys
+
+logger = diagnostics.get_logger(__name__)
+
+#outcome of one watch-mode rebuild: file counts and the latency in ms
+Rebuild = namedtuple("Rebuild", ["compiled", "up_to_date", "failed", "deleted", "total", "elapsed_ms"])
+
+
+def _compile_file(input_file:str, engine_options:dict, collect_stats:bool=False):
+    """
+    Compiles one .jack file to its .vm file
+
+    Module-level so that worker processes can run it. Returns
+    (input_file, error, removed_instructions, stats): error is None on success,
+    otherwise the formatted traceback; removed_instructions is the peephole count or
+    None; stats is the file's CompileStats with collect_stats, otherwise None
+    """
+    logger.info("Processing file: %s", input_file)
+    stats = None
+
+    if collect_stats:
+        from stats import CompileStats  # only needed for --stats
+
+        stats = CompileStats(input_file)
+
+    try:
+        with CompilationEngine(input_file=input_file, stats=stats, **engine_options) as engine:
+            engine._compileClass()  # Start compilation
+
+    except Exception:
+        import traceback
+        return input_file, traceback.format_exc(), None, None
+
+    vm_writer = engine.vm_writer
+    removed = vm_writer.removed_instructions if vm_writer.peephole_rules is not None else None
+
+    return input_file, None, removed, stats
+
 
 class JackAnalyzer:
     
-    def __init__(self, input_path):
+    def __init__(self, input_path, jobs:int=1, force:bool=False, collect_stats:bool=False, **engine_options):
+        """
+        Compiles a .jack file or every .jack file in a directory
+
+        With jobs > 1 the files of a directory are compiled in that many worker
+        processes. A file that fails to compile does not stop the others; the
+        failures are collected in self.errors as (file, traceback) pairs.
+
+        Files whose .vm output is up to date according to the build cache
+        (build_cache.py) are skipped, unless force is set. The names of the
+        skipped files are kept in self.skipped.
+
+        With collect_stats, self.stats holds a stats.CompileStats (phase timings
+        and counters) for every file compiled. With peephole rules, self.removed maps
+        every file compiled to the number of instructions the optimizer removed.
+
+        engine_options are passed to each CompilationEngine
+        (lexer, streaming, use_mmap, buffered_output, record_ir, peephole_rules,
+        fold_constants, strength_reduce, build_ast)
+        """
         # Check if path exists
-        if os.path.exists(input_path):
-            try:
-                if os.path.isdir(input_path):
-                    # Process all .jack files in the directory
-                    jack_files = [file for file in os.listdir(input_path) if file.endswith(".jack")]
-
-                    print(jack_files)
-                    
-                    for file in jack_files:
-                        # Create full path by joining directory and filename
-                        full_file_path = os.path.join(input_path, file)
-                        print(f"Processing file: {full_file_path}")
-                        
-                        # Pass the full path to the CompilationEngine
-                        engine = CompilationEngine(input_file=full_file_path)
-                        engine._compileClass()  # Start compilation
-                        engine._close()
-                else:
-                    # Process a single file
-                    print(f"Processing file: {input_path}")
-                    engine = CompilationEngine(input_file=input_path)
-                    engine._compileClass()  # Start compilation
-                    engine._close()
-            except Exception as e:
-                print(f"Error compiling {input_path}: {e}")
-                import traceback
-                traceback.print_exc()  # This will print the full stack trace
-        else:
+        if not os.path.exists(input_path):
             raise FileNotFoundError(f"Path not found: {input_path}")
 
+        self.input_path = input_path
+        self.jobs = jobs
+        self.collect_stats = collect_stats
+        self.force = force
+        self.engine_options = engine_options
+        self._executor = None
+
+        from build_cache import BuildCache  # worker processes only need _compile_file
+
+        if os.path.isdir(input_path):
+            self.cache = BuildCache(input_path, engine_options)
+        else:
+            self.cache = BuildCache(os.path.dirname(input_path) or ".", engine_options)
+
+        jack_files = self._jack_files()
+
+        if os.path.isdir(input_path):
+            logger.debug("Found %d .jack files: %s", len(jack_files), jack_files)
+
+            for evicted in self.cache.evict(jack_files):
+                logger.info("Evicted %s from the build cache", evicted)
+
+        self._build(jack_files, force)
+
+    def _jack_files(self) -> list:
+        if os.path.isdir(self.input_path):
+            # Process all .jack files in the directory, in a stable order
+            return sorted(os.path.join(self.input_path, file) for file in os.listdir(self.input_path) if file.endswith(".jack"))
+
+        # Process a single file
+        return [self.input_path]
+
+    def _build(self, jack_files:list, force:bool=False):
+        #compile the files of jack_files that are out of date, recording the outcome in the cache
+        cache = self.cache
+        self.errors = []
+        self.skipped = []
+        self.stats = []
+        self.removed = {}
+
+        if force:
+            stale_files = jack_files
+        else:
+            stale_files = [file for file in jack_files if not cache.is_up_to_date(file)]
+            self.skipped = [file for file in jack_files if file not in stale_files]
+
+            for file in self.skipped:
+                logger.info("Up to date: %s", file)
+
+        if self.jobs > 1 and len(stale_files) > 1:
+            results = self._compile_parallel(stale_files)
+        else:
+            results = (_compile_file(file, self.engine_options, self.collect_stats) for file in stale_files)
+
+        # results arrive in file order whichever way they were compiled
+        for input_file, error, removed, stats in results:
+            if error is not None:
+                logger.error("Error compiling %s:\n%s", input_file, error)
+                self.errors.append((input_file, error))
+                cache.forget(input_file)
+                continue
+
+            cache.record(input_file)
+
+            if stats is not None:
+                self.stats.append(stats)
+
+            if removed is not None:
+                self.removed[input_file] = removed
+
+        cache.save()
+
+        if self.errors:
+            logger.error("%d of %d files failed to compile: %s", len(self.errors), len(jack_files), ", ".join(file for file, _ in self.errors))
+
+    def _compile_parallel(self, jack_files:list):
+        #compile the files in a pool of worker processes, yielding results in file order
+        if self._executor is not None:
+            #watch mode keeps one pool alive between rebuilds
+            yield from self._executor.map(_compile_file, jack_files, repeat(self.engine_options), repeat(self.collect_stats))
+            return
+
+        with self._new_pool() as executor:
+            yield from executor.map(_compile_file, jack_files, repeat(self.engine_options), repeat(self.collect_stats))
+
+    def _new_pool(self):
+        #worker processes log at the level of this process
+        from concurrent.futures import ProcessPoolExecutor  # only needed for --jobs
+
+        return ProcessPoolExecutor(max_workers=self.jobs, initializer=diagnostics.configure,
+                                   initargs=(diagnostics.current_level(),))
+
+    def watch(self, interval:float=0.5):
+        """
+        Polls the input every interval seconds and recompiles the .jack files that
+        changed, until interrupted (Ctrl-C)
+
+        A file counts as changed when its size or modification time differs from the
+        last poll; the build cache then skips files whose contents are unchanged,
+        unless the analyzer was created with force. The compiler stays imported and,
+        with jobs > 1, the worker pool stays alive between rebuilds. Each rebuild
+        reports how long it took.
+        """
+        import time
+
+        snapshot = self._snapshot()
+        logger.info("Watching %s for changes (Ctrl-C to stop)", self.input_path)
+
+        if self.jobs > 1:
+            self._executor = self._new_pool()
+
+        try:
+            while True:
+                time.sleep(interval)
+                snapshot, _ = self.poll(snapshot)
+
+        except KeyboardInterrupt:
+            logger.info("Stopped watching")
+
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def poll(self, snapshot:dict) -> tuple:
+        """
+        One watch-mode poll: rebuilds the files that changed since snapshot (a
+        previous poll's, or _snapshot()) and evicts the deleted ones
+
+        Returns the new snapshot and a Rebuild, or None when nothing changed
+        """
+        import time
+
+        current = self._snapshot()
+
+        if current == snapshot:
+            return current, None
+
+        start = time.perf_counter()
+        changed = sorted(file for file, stamp in current.items() if snapshot.get(file) != stamp)
+        deleted = [file for file in snapshot if file not in current]
+
+        if deleted:
+            for evicted in self.cache.evict(list(current)):
+                logger.info("Evicted %s from the build cache", evicted)
+
+        self._build(changed, self.force)
+
+        rebuild = Rebuild(compiled=len(changed) - len(self.skipped) - len(self.errors), up_to_date=len(self.skipped),
+                          failed=len(self.errors), deleted=len(deleted), total=len(current),
+                          elapsed_ms=(time.perf_counter() - start) * 1000)
+        logger.info("Rebuilt %d of %d files in %.1f ms (%d up to date, %d failed, %d deleted)",
+                    rebuild.compiled, rebuild.total, rebuild.elapsed_ms, rebuild.up_to_date, rebuild.failed,
+                    rebuild.deleted)
+
+        return current, rebuild
+
+    def _snapshot(self) -> dict:
+        #.jack file -> (size, mtime) as of now
+        snapshot = {}
+
+        for file in self._jack_files():
+            try:
+                stat = os.stat(file)
+            except FileNotFoundError:
+                continue  # deleted between listing and stat
+            snapshot[file] = (stat.st_size, stat.st_mtime_ns)
+
+        return snapshot
+
 if __name__ == "__main__":
+    import argparse  # only the command line needs it, not importers of JackAnalyzer
+
+    parser = argparse.ArgumentParser(description="Compile .jack files to .vm files")
+    parser.add_argument("input", help="a .jack file or a directory of .jack files")
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="log progress per file (-v) or per declaration and statement (-vv)")
+    parser.add_argument("--trace", action="store_true", help="log every token and term (very verbose)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="compile the files of a directory in N worker processes (default: 1)")
+    parser.add_argument("--force", action="store_true", help="recompile every file, even those the build cache reports as up to date")
+    parser.add_argument("--watch", action="store_true", help="keep running and recompile the files that change")
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between polls in --watch mode (default: 0.5)")
+    parser.add_argument("--stats", action="store_true", help="print per-phase timings and counters for every compiled file")
+    parser.add_argument("--stats-json", metavar="PATH", help="write the same statistics as a JSON report to PATH")
+    parser.add_argument("--lexer", choices=LEXERS, default="hand", help="tokenizer backend (default: hand)")
+    parser.add_argument("--stream", action="store_true", help="lex lazily while parsing instead of tokenizing each file up front")
+    parser.add_argument("--mmap", action="store_true", help="lex a memory-mapped view of each file (implies --lexer regex)")
+    parser.add_argument("--buffered", action="store_true", help="write each .vm file in one atomic bulk write")
+    parser.add_argument("--ir", action="store_true", help="record VM commands as instruction lists and serialize them on close")
+    parser.add_argument("--peephole", action="store_true", help="run the peephole optimizer over the generated VM code (implies --ir)")
+    parser.add_argument("--fold-constants", action="store_true", help="evaluate integer constant subexpressions at compile time")
+    parser.add_argument("--strength-reduce", action="store_true", help="compile multiplications by small or power-of-two constants to adds and skip *1 and /1")
+    parser.add_argument("--ast", action="store_true", help="parse each class into a syntax tree, then generate its code from the tree")
+    args = parser.parse_args()
+
+    peephole_rules = None
+    if args.peephole:
+        from peephole import DEFAULT_RULES
+        peephole_rules = DEFAULT_RULES
+
+    level = diagnostics.verbosity_level(args.verbose, args.trace)
+    #watch mode reports each rebuild
+    diagnostics.configure(min(level, diagnostics.INFO) if args.watch else level)
+
     try:
-        if len(sys.argv) < 2:
-            print("Usage: python jackanalyzer.py <input_file_or_directory>")
-            sys.exit(1)
-            
-        input_path = sys.argv[1]
-        JackAnalyzer(input_path)
+        analyzer = JackAnalyzer(args.input,
+                                jobs=args.jobs,
+                                force=args.force,
+                                collect_stats=args.stats or args.stats_json is not None,
+                                lexer="regex" if args.mmap else args.lexer,
+                                streaming=args.stream,
+                                use_mmap=args.mmap,
+                                buffered_output=args.buffered,
+                                record_ir=args.ir,
+                                peephole_rules=peephole_rules,
+                                fold_constants=args.fold_constants,
+                                strength_reduce=args.strength_reduce,
+                                build_ast=args.ast)
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("%s", e)
+        sys.exit(1)
+
+    for input_file, removed in analyzer.removed.items():
+        print(f"Peephole optimizer removed {removed} instructions from {os.path.splitext(input_file)[0]}.vm")
+
+    if args.stats or args.stats_json:
+        import stats
+
+        if args.stats:
+            print(stats.summary(analyzer.stats))
+
+        if args.stats_json:
+            stats.write_report(analyzer.stats, args.stats_json)
+
+    if args.watch:
+        analyzer.watch(args.interval)
+
+    sys.exit(1 if analyzer.errors else 0)
 
     
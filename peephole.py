@@ -0,0 +1,119 @@
+from vm_ir import Opcode
+
+"""
+* Peephole optimizer over the instruction-list IR (see vm_ir.py)
+* A rule looks at the window starting at code[i] and returns (width, replacement)
+* to replace code[i:i+width], or None when it does not apply.
+* Rules are applied until no rule fires any more.
+
+"""
+
+#instructions after which control never falls through
+_JUMPS = (Opcode.GOTO, Opcode.RETURN)
+
+#instructions control can enter from elsewhere
+_ENTRIES = (Opcode.LABEL, Opcode.FUNCTION)
+
+
+def array_store_term(code, i):
+    #push S n; pop temp 0; pop pointer 1; push temp 0 -> pop pointer 1; push S n
+    #arr[i] = term parks the term's value in temp 0 only to set pointer 1 under it. A term
+    #that does not read THAT or the pointers can be pushed after pointer 1 is set instead;
+    #the generated code always writes temp 0 before reading it, so its old value is dead
+    if (i + 3 < len(code) and code[i][0] is Opcode.PUSH and code[i][1] not in ("that", "pointer", "temp")
+            and code[i + 1] == (Opcode.POP, "temp", 0) and code[i + 2] == (Opcode.POP, "pointer", 1)
+            and code[i + 3] == (Opcode.PUSH, "temp", 0)):
+        return 4, [code[i + 2], code[i]]
+
+
+def push_pop_same(code, i):
+    #push X n; pop X n -> (nothing)
+    if i + 1 < len(code):
+        first, second = code[i], code[i + 1]
+        if first[0] is Opcode.PUSH and second[0] is Opcode.POP and first[1:] == second[1:]:
+            return 2, []
+
+
+def double_negation(code, i):
+    #not; not -> (nothing)   neg; neg -> (nothing)
+    if i + 1 < len(code) and code[i][0] in (Opcode.NOT, Opcode.NEG) and code[i + 1][0] is code[i][0]:
+        return 2, []
+
+
+def negated_zero(code, i):
+    #push constant 0; neg -> push constant 0
+    if i + 1 < len(code) and code[i] == (Opcode.PUSH, "constant", 0) and code[i + 1][0] is Opcode.NEG:
+        return 2, [code[i]]
+
+
+def constant_branch(code, i):
+    #push constant c; not; if-goto L -> goto L   (~c is never 0 for 0 <= c <= 32767)
+    #push constant c; if-goto L -> goto L when c != 0, otherwise (nothing)
+    if i + 1 < len(code) and code[i][0] is Opcode.PUSH and code[i][1] == "constant":
+        value = code[i][2]
+
+        if code[i + 1][0] is Opcode.NOT and i + 2 < len(code) and code[i + 2][0] is Opcode.IF_GOTO:
+            return 3, [(Opcode.GOTO, code[i + 2][1], None)]
+
+        if code[i + 1][0] is Opcode.IF_GOTO:
+            return 2, [(Opcode.GOTO, code[i + 1][1], None)] if value else []
+
+
+def jump_to_next(code, i):
+    #goto L; label L -> label L
+    if i + 1 < len(code) and code[i][0] is Opcode.GOTO and code[i + 1] == (Opcode.LABEL, code[i][1], None):
+        return 2, [code[i + 1]]
+
+
+def unreachable(code, i):
+    #goto/return followed by code that no label leads to -> goto/return
+    if code[i][0] in _JUMPS:
+        end = i + 1
+        while end < len(code) and code[end][0] not in _ENTRIES:
+            end += 1
+
+        if end > i + 1:
+            return end - i, [code[i]]
+
+
+DEFAULT_RULES = (
+    array_store_term,
+    push_pop_same,
+    double_negation,
+    negated_zero,
+    constant_branch,
+    jump_to_next,
+    unreachable,
+)
+
+
+def optimize(instructions, rules=DEFAULT_RULES):
+    """
+    Rewrites the instructions with the given rules until none applies
+
+    Returns the optimized instruction list and the number of instructions removed
+    """
+    code = list(instructions)
+    changed = True
+
+    while changed:
+        changed = False
+        optimized = []
+        i = 0
+
+        while i < len(code):
+            for rule in rules:
+                match = rule(code, i)
+                if match is not None:
+                    width, replacement = match
+                    optimized.extend(replacement)
+                    i += width
+                    changed = True
+                    break
+            else:
+                optimized.append(code[i])
+                i += 1
+
+        code = optimized
+
+    return code, len(instructions) - len(code)
@@ -0,0 +1,236 @@
+import io
+import os
+import sys
+import threading
+import time
+from compilation_engine import GRAMMAR_RULES, CompilationEngine, CompileHook
+
+"""
+* Per-grammar-rule profiling of the compilation engine
+*
+* RuleProfiler   a CompilationEngine hook (see CompilationEngine.add_hook) that times
+*                every grammar rule (GRAMMAR_RULES) exactly and counts the VM
+*                instructions each one emits. Hooks add a call per rule entered and
+*                exited, so small rules (term, expression) look more expensive than
+*                they are.
+* RuleSampler    samples the compiling thread's stack at a fixed interval and keeps
+*                the frames of grammar rules. Nothing is hooked, so the overhead is
+*                low and the proportions are realistic, but short runs get few samples.
+*
+* Both collect folded stacks - "class;subroutineDec;...;term 1234", one line per rule
+* stack with its weight - which flamegraph.pl, speedscope and inferno read as they are.
+* profile_files() can additionally run the compilation under cProfile and save the
+* function-level statistics for pstats / snakeviz.
+
+"""
+
+#weight of a sample taken outside any grammar rule (lexing, setup, writing)
+OUTSIDE_RULES = "(outside rules)"
+
+
+class RuleProfiler(CompileHook):
+
+    def __init__(self):
+        #rule stack ("class;subroutineDec;statements") -> exclusive ns / calls / VM instructions
+        self.times = {}
+        self.calls = {}
+        self.instructions = {}
+        #one [stack, start ns, ns spent in nested rules] per rule being compiled
+        self._frames = []
+
+    def enter(self, rule:str):
+        stack = f"{self._frames[-1][0]};{rule}" if self._frames else rule
+        self._frames.append([stack, time.perf_counter_ns(), 0])
+
+    def exit(self, rule:str):
+        stack, start, nested = self._frames.pop()
+        elapsed = time.perf_counter_ns() - start
+
+        self.times[stack] = self.times.get(stack, 0) + elapsed - nested
+        self.calls[stack] = self.calls.get(stack, 0) + 1
+
+        if self._frames:
+            self._frames[-1][2] += elapsed
+
+    def emit(self, command:str, args:tuple):
+        stack = self._frames[-1][0] if self._frames else OUTSIDE_RULES
+        self.instructions[stack] = self.instructions.get(stack, 0) + 1
+
+    def folded(self, metric:str="time") -> dict:
+        #rule stack -> weight: exclusive microseconds ("time"), "calls" or emitted "instructions"
+        if metric == "time":
+            return {stack: ns // 1000 for stack, ns in self.times.items()}
+        return dict(getattr(self, metric))
+
+
+class RuleSampler:
+
+    def __init__(self, interval:float=0.001, thread_id:int=None):
+        """
+        Samples thread_id (default: the thread creating the sampler) every interval
+        seconds between start() and stop()
+        """
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        #rule stack -> number of samples
+        self.samples = {}
+        self._stopping = threading.Event()
+        self._thread = None
+        self._switch_interval = None
+        #code object of every grammar rule's routine -> the rule
+        self._rules = {getattr(CompilationEngine, name).__code__: rule for name, rule in GRAMMAR_RULES.items()}
+
+    def start(self):
+        #the sampler only runs when the compiling thread releases the GIL, so let
+        #it switch at least as often as we sample
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch_interval, self.interval))
+
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="RuleSampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._thread.join()
+        sys.setswitchinterval(self._switch_interval)
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self._sample(frame)
+
+    def _sample(self, frame):
+        rules = []
+
+        while frame is not None:
+            rule = self._rules.get(frame.f_code)
+            if rule is not None:
+                rules.append(rule)
+            frame = frame.f_back
+
+        stack = ";".join(reversed(rules)) if rules else OUTSIDE_RULES
+        self.samples[stack] = self.samples.get(stack, 0) + 1
+
+    def folded(self, metric:str="samples") -> dict:
+        return dict(self.samples)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def _compile_in_memory(input_file:str, engine_options:dict, hook:CompileHook=None):
+    #compile input_file without writing its .vm file
+    with open(input_file) as f:
+        source = f.read()
+
+    with CompilationEngine(input_file=input_file, source=source, output_stream=io.StringIO(),
+                           **engine_options) as engine:
+        if hook is not None:
+            engine.add_hook(hook)
+        engine._compileClass()
+
+
+def profile_files(jack_files:list, sampling:bool=False, interval:float=0.001, cprofile_path:str=None,
+                  **engine_options):
+    """
+    Compiles jack_files in memory (no .vm files are written) under a RuleProfiler,
+    or under a RuleSampler with sampling, and returns the profiler
+
+    With cprofile_path, the run is also profiled by cProfile and its statistics are
+    saved there (load them with pstats.Stats(cprofile_path))
+    """
+    if cprofile_path is not None:
+        import cProfile  # only needed for the function-level profile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        if sampling:
+            rule_profiler = RuleSampler(interval)
+            with rule_profiler:
+                for file in jack_files:
+                    _compile_in_memory(file, engine_options)
+        else:
+            rule_profiler = RuleProfiler()
+            for file in jack_files:
+                _compile_in_memory(file, engine_options, rule_profiler)
+
+    finally:
+        if cprofile_path is not None:
+            profiler.disable()
+            profiler.dump_stats(cprofile_path)
+
+    return rule_profiler
+
+
+def format_folded(folded:dict) -> str:
+    #one "stack weight" line per rule stack, in stack order; zero weights are left out
+    return "".join(f"{stack} {weight}\n" for stack, weight in sorted(folded.items()) if weight)
+
+
+def summary(folded:dict, unit:str, top:int=20) -> str:
+    #the rules with the highest self weight, summed over every stack they end
+    by_rule = {}
+    for stack, weight in folded.items():
+        rule = stack.rsplit(";", 1)[-1]
+        by_rule[rule] = by_rule.get(rule, 0) + weight
+
+    grand_total = sum(by_rule.values()) or 1
+    rows = [f"{'rule':<24} {'self ' + unit:>14} {'share':>7}"]
+    rows.append("-" * len(rows[0]))
+
+    for rule, weight in sorted(by_rule.items(), key=lambda item: -item[1])[:top]:
+        rows.append(f"{rule:<24} {weight:>14} {weight / grand_total:>7.1%}")
+
+    return "\n".join(rows)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Per-grammar-rule profile of the Jack compiler, as folded stacks")
+    parser.add_argument("input", help=".jack file or directory of .jack files")
+    parser.add_argument("-o", "--output", help="write the folded stacks to OUTPUT instead of stdout")
+    parser.add_argument("--sample", action="store_true", help="sample the stack instead of hooking every rule")
+    parser.add_argument("--interval", type=float, default=1.0, help="sampling interval in ms (default: 1)")
+    parser.add_argument("--metric", choices=("time", "calls", "instructions"), default="time",
+                        help="weight of a hooked rule stack: exclusive microseconds, calls or VM instructions emitted")
+    parser.add_argument("--cprofile", metavar="PATH", help="also save cProfile statistics of the run to PATH")
+    parser.add_argument("--summary", action="store_true", help="print the heaviest rules instead of the folded stacks")
+    parser.add_argument("--repeat", type=int, default=1, help="compile every file this many times (more samples)")
+    parser.add_argument("--fold-constants", action="store_true", help="evaluate integer constant subexpressions at compile time")
+    parser.add_argument("--strength-reduce", action="store_true", help="compile multiplications by small or power-of-two constants to adds")
+    parser.add_argument("--peephole", action="store_true", help="run the peephole optimizer over the generated VM code")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.input):
+        files = sorted(os.path.join(args.input, name) for name in os.listdir(args.input) if name.endswith(".jack"))
+    else:
+        files = [args.input]
+
+    peephole_rules = None
+    if args.peephole:
+        from peephole import DEFAULT_RULES
+        peephole_rules = DEFAULT_RULES
+
+    rule_profiler = profile_files(files * args.repeat, sampling=args.sample, interval=args.interval / 1000,
+                                  cprofile_path=args.cprofile, peephole_rules=peephole_rules,
+                                  fold_constants=args.fold_constants, strength_reduce=args.strength_reduce)
+
+    folded = rule_profiler.folded(args.metric)
+
+    if args.summary:
+        unit = "samples" if args.sample else {"time": "us"}.get(args.metric, args.metric)
+        print(summary(folded, unit))
+    elif args.output:
+        with open(args.output, "w") as f:
+            f.write(format_folded(folded))
+    else:
+        sys.stdout.write(format_folded(folded))
@@ -0,0 +1,85 @@
+"""
+* Per-class compile statistics
+* A CompileStats passed to CompilationEngine(stats=...) is filled in while the class
+* compiles: wall time per phase, token count, VM instructions and bytes written,
+* symbol table lookups and source bytes read. Engines created without stats are
+* not instrumented at all.
+*
+*   lex      building the Tokenizer - in streaming mode tokens are lexed on demand,
+*            so their lexing is counted in the compile phase instead
+*   compile  CompilationEngine._compileClass, parsing and code generation
+*   write    VM_Writer.close - optimizing, serializing and writing buffered output
+*            (unbuffered output is written during the compile phase)
+
+"""
+
+#fields of a stats record, in report order
+FIELDS = ("file", "lex_seconds", "compile_seconds", "write_seconds", "tokens", "vm_instructions",
+          "symbol_lookups", "bytes_in", "bytes_out")
+
+
+class CompileStats:
+
+    def __init__(self, file:str=""):
+        self.file = file
+        self.lex_seconds = 0.0
+        self.compile_seconds = 0.0
+        self.write_seconds = 0.0
+        self.tokens = 0
+        self.vm_instructions = 0
+        self.symbol_lookups = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    @property
+    def total_seconds(self) -> float:
+        return self.lex_seconds + self.compile_seconds + self.write_seconds
+
+    @property
+    def tokens_per_second(self) -> float:
+        #tokens through the whole pipeline per second of lex + compile + write
+        return self.tokens / self.total_seconds if self.total_seconds else 0.0
+
+    def add(self, other:"CompileStats"):
+        #accumulate another record into this one (for totals)
+        for field in FIELDS[1:]:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+
+    def as_dict(self) -> dict:
+        record = {field: getattr(self, field) for field in FIELDS}
+        record["total_seconds"] = self.total_seconds
+        record["tokens_per_second"] = self.tokens_per_second
+        return record
+
+
+def total(records:list) -> CompileStats:
+    #one record summing all of records
+    result = CompileStats("total")
+    for record in records:
+        result.add(record)
+    return result
+
+
+def summary(records:list) -> str:
+    #a text table with one row per class and a total row
+    header = (f"{'file':<28} {'lex ms':>8} {'compile ms':>10} {'write ms':>8} {'tokens':>8} "
+              f"{'tokens/s':>10} {'VM instr':>8} {'lookups':>8} {'bytes in':>9} {'bytes out':>9}")
+    rows = [header, "-" * len(header)]
+
+    for record in list(records) + [total(records)]:
+        rows.append(f"{record.file[-28:]:<28} {record.lex_seconds * 1000:>8.2f} {record.compile_seconds * 1000:>10.2f} "
+                    f"{record.write_seconds * 1000:>8.2f} {record.tokens:>8} {record.tokens_per_second:>10.0f} "
+                    f"{record.vm_instructions:>8} {record.symbol_lookups:>8} {record.bytes_in:>9} {record.bytes_out:>9}")
+
+    return "\n".join(rows)
+
+
+def write_report(records:list, path:str):
+    #machine-readable report: {"files": [...], "total": {...}}
+    import json  # only needed for the JSON report
+
+    report = {"files": [record.as_dict() for record in records], "total": total(records).as_dict()}
+
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
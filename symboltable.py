@@ -1,16 +1,8 @@
 
-from pydantic import BaseModel, Field
+from collections import namedtuple
 
 
 
-class Kind(BaseModel):
-    #pydantic validation model
-    static:str = Field("static")
-    field:str = Field("field")
-    argument:str = Field("argument")
-    local:str=Field("local")
-
-
 class VariableNotFoundError(Exception):
     def __init__(self, variableName:str, scope:str, message:str):
         self.variable_name = variableName
@@ -25,6 +17,10 @@ class VariableNotFoundError(Exception):
 
 
 
+#a symbol table entry
+Symbol = namedtuple("Symbol", ["name", "type", "kind", "index"])
+
+
 class SymbolTable:
 
     #constructor
@@ -33,17 +29,23 @@ class SymbolTable:
         #constructs a new symbol table
         self._current_scope = "class" #start at class level
 
+        #scope -> {name: Symbol}
         self._symbol_table = {
 
-            "class": [],
+            "class": {},
 
-            "subroutine": []
+            "subroutine": {}
 
                             }
 
+        #running number of variables defined per kind
+        self._counts = {"static": 0, "field": 0, "argument": 0, "local": 0}
+
     def _startSubroutine(self):
         #starts a new subroutine scope i.e resets the subroutine table
-        self._symbol_table["subroutine"] = []
+        self._symbol_table["subroutine"] = {}
+        self._counts["argument"] = 0
+        self._counts["local"] = 0
 
         #update scope
         self._current_scope = "subroutine"
@@ -51,81 +53,39 @@ class SymbolTable:
 
     def _define(self, name:str, type:str, kind):
         #defines a new identifier of the given params
-        scope = "class" if kind in ["static", "field"] else "subroutine"
-
-        index = self._varCount(kind)
+        scope = "class" if kind in ("static", "field") else "subroutine"
 
+        index = self._counts.get(kind, 0)
+        self._counts[kind] = index + 1
 
-        self._symbol_table[scope].append(
-
-            {
-                "name":name,
-                "type":type,
-                "kind":kind,
-                "index":index,
-            }
-        )
+        #the first definition of a name wins
+        self._symbol_table[scope].setdefault(name, Symbol(name, type, kind, index))
 
     def _varCount(self,kind)->int:
         #returns no. of variables of the given kind already defined inthe scope
-        scope = "class" if kind in ["static","field"] else "subroutine"
-        
-        return sum(1 for var in self._symbol_table[scope] if var['kind']==kind)
+        return self._counts.get(kind, 0)
     
 
+    def lookup(self, name:str) -> Symbol:
+        #returns the Symbol (name, type, kind, index) of the named identifier in the current scope
+        symbol = self._symbol_table[self._current_scope].get(name)
 
-    def _kindof(self, name:str)->str:
-        #returns kind of the named identifier in the current scope
-        scope = self._current_scope
+        if symbol is None and self._current_scope == "subroutine":
+            symbol = self._symbol_table["class"].get(name)
+
+        if symbol is None:
+            raise VariableNotFoundError(name, self._current_scope, "Variable not found")
 
-        for variable in self._symbol_table[scope]:
+        return symbol
 
-            if variable["name"] == name:
-                return variable["kind"]
-            
-        if scope == "subroutine":
-            for variable in self._symbol_table["class"]:
-                if variable["name"] == name:
-                    return variable["kind"]
-                
-        raise VariableNotFoundError(name, self._current_scope, "Variable not found")    
+    def _kindof(self, name:str)->str:
+        #returns kind of the named identifier in the current scope
+        return self.lookup(name).kind
 
     def _typeof(self, name:str)->str:
         #returns type of
-
-        scope = self._current_scope
-
-        for variable in self._symbol_table[scope]:
-
-            if variable["name"] == name:
-
-                return variable["type"]
-            
-        if self._current_scope == "subroutine":
-            for variable in self._symbol_table["class"]:
-                if variable["name"] == name:
-                    return variable["type"]
-
-        raise VariableNotFoundError(name, self._current_scope, "Variable not found")
+        return self.lookup(name).type
 
     def _indexof(self, name:str)->int:
         #return index assigned
-        
-        scope = self._current_scope
-
-        for variable in self._symbol_table[scope]:
-
-            if variable["name"]==name:
-
-               return variable["index"]
-            
-        if scope == "subroutine":
-            for variable in self._symbol_table["class"]:
-                if variable["name"] == name:
-                    return variable["index"]
-            
-        raise VariableNotFoundError(name, self._current_scope , "variable not found")
-            
-
-    
-        
\ No newline at end of file
+        return self.lookup(name).index
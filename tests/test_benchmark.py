@@ -0,0 +1,31 @@
+import json
+
+from benchmark import run_throughput
+
+#a corpus small enough to benchmark in a test
+SHAPE = dict(classes=1, fields=2, methods=2, depth=1)
+
+
+def test_missing_baseline_is_reported_and_not_compared(tmp_path, capsys):
+    baseline_file = tmp_path / "baseline.json"
+
+    assert run_throughput(1, SHAPE, str(baseline_file), False, 0.2)
+
+    assert f"no baseline at {baseline_file}" in capsys.readouterr().out
+    assert not baseline_file.exists()
+
+
+def test_saved_baseline_is_compared_against(tmp_path, capsys):
+    baseline_file = tmp_path / "baseline.json"
+
+    assert run_throughput(1, SHAPE, str(baseline_file), True, 0.2)
+    assert "no baseline" not in capsys.readouterr().out
+
+    #a baseline nothing can reach makes every benchmark a regression
+    stored = json.loads(baseline_file.read_text())
+    for result in stored["results"].values():
+        result["rate"] *= 1000
+    baseline_file.write_text(json.dumps(stored))
+
+    assert not run_throughput(1, SHAPE, str(baseline_file), False, 0.2)
+    assert "REGRESSION engine: throughput" in capsys.readouterr().out
@@ -0,0 +1,131 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import build_cache
+from build_cache import MANIFEST_NAME, BuildCache
+from jackanalyzer import JackAnalyzer
+
+MAIN = "class Main { function int main() { return 1; } }"
+OTHER = "class Other { function int f() { return 2; } }"
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / "Main.jack").write_text(MAIN)
+    (tmp_path / "Other.jack").write_text(OTHER)
+    JackAnalyzer(str(tmp_path))
+    return tmp_path
+
+
+def _compiled(directory, **options) -> list:
+    #names of the files a fresh build of directory compiles
+    analyzer = JackAnalyzer(str(directory), **options)
+    skipped = {os.path.basename(file) for file in analyzer.skipped}
+    return sorted({"Main.jack", "Other.jack"} - skipped)
+
+
+def test_unchanged_files_are_skipped(project):
+    assert _compiled(project) == []
+
+
+def test_changed_contents_are_recompiled(project):
+    (project / "Main.jack").write_text(MAIN.replace("1", "3"))
+    assert _compiled(project) == ["Main.jack"]
+    assert "push constant 3" in (project / "Main.vm").read_text()
+
+
+def test_touched_but_unchanged_file_is_skipped(project):
+    os.utime(project / "Main.jack")
+    assert _compiled(project) == []
+
+
+def test_changed_options_recompile_everything(project):
+    assert _compiled(project, fold_constants=True) == ["Main.jack", "Other.jack"]
+    assert _compiled(project, fold_constants=True) == []
+
+
+def test_edited_vm_file_is_rebuilt(project):
+    (project / "Other.vm").write_text("edited\n")
+    assert _compiled(project) == ["Other.jack"]
+
+
+def test_new_compiler_version_recompiles_everything(project, monkeypatch):
+    monkeypatch.setattr(build_cache, "COMPILER_VERSION", "0.0")
+    assert _compiled(project) == ["Main.jack", "Other.jack"]
+
+
+def test_compiler_source_change_recompiles_everything(project, monkeypatch):
+    #what editing one of COMPILER_MODULES does to the next run
+    monkeypatch.setattr(build_cache, "_source_digest", "0" * 16)
+    assert _compiled(project) == ["Main.jack", "Other.jack"]
+
+
+def test_compiler_version_covers_every_compiler_module():
+    #a module the compiler loads but the version does not hash could change the output unnoticed
+    repo = os.path.dirname(os.path.abspath(build_cache.__file__))
+    check = ("import sys, compilation_engine, peephole\n"
+             "compilation_engine.compile_source('class A { function int f() { return 2 * 3; } }', 'A', build_ast=True,"
+             " fold_constants=True, strength_reduce=True, peephole_rules=peephole.DEFAULT_RULES)\n"
+             "print(' '.join(name for name, module in sys.modules.items()"
+             " if getattr(module, '__file__', None) and module.__file__.startswith(sys.argv[1])))")
+    loaded = subprocess.run([sys.executable, "-c", check, repo], cwd=repo, capture_output=True, text=True,
+                            check=True).stdout.split()
+
+    #diagnostics only decides what is logged
+    assert set(loaded) - {"diagnostics"} == set(build_cache.COMPILER_MODULES)
+    assert build_cache.compiler_version().startswith(build_cache.COMPILER_VERSION + "+")
+
+
+def test_failed_compile_is_forgotten(project):
+    (project / "Main.jack").write_text("class Main { function int main() { return x; } }")
+    analyzer = JackAnalyzer(str(project))
+    assert [os.path.basename(file) for file, _ in analyzer.errors] == ["Main.jack"]
+
+    manifest = json.loads((project / MANIFEST_NAME).read_text())
+    assert sorted(manifest["files"]) == ["Other.jack"]
+
+    #fixing the file makes it compile again, even though the old .vm is still there
+    (project / "Main.jack").write_text(MAIN)
+    assert _compiled(project) == ["Main.jack"]
+
+
+def test_evict_drops_the_entry_and_its_vm_file(project):
+    (project / "Other.jack").unlink()
+    cache = BuildCache(str(project), {})
+
+    assert cache.evict([str(project / "Main.jack")]) == ["Other.jack"]
+    cache.save()
+
+    assert not (project / "Other.vm").exists()
+    assert (project / "Main.vm").exists()
+    assert sorted(json.loads((project / MANIFEST_NAME).read_text())["files"]) == ["Main.jack"]
+
+
+def test_evict_keeps_a_vm_file_edited_by_hand(project):
+    (project / "Other.jack").unlink()
+    (project / "Other.vm").write_text("edited by hand\n")
+
+    assert BuildCache(str(project), {}).evict([str(project / "Main.jack")]) == ["Other.jack"]
+    assert (project / "Other.vm").exists()
+
+
+def test_manifest_is_written_atomically(project):
+    #no temp file is left next to the manifest
+    assert sorted(os.listdir(project)) == [MANIFEST_NAME, "Main.jack", "Main.vm", "Other.jack", "Other.vm"]
+
+
+def test_failed_atomic_write_keeps_the_old_file(tmp_path):
+    from vm_writer import write_atomically
+
+    target = tmp_path / "Main.vm"
+    write_atomically(str(target), "old\n")
+
+    with pytest.raises(TypeError):
+        write_atomically(str(target), None)  # fails after the temp file is created
+
+    assert target.read_text() == "old\n"
+    assert os.listdir(tmp_path) == ["Main.vm"]
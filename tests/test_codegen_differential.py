@@ -0,0 +1,150 @@
+import random
+
+import pytest
+
+from compilation_engine import compile_source
+from peephole import DEFAULT_RULES
+from vm_interpreter import VMError, VMInterpreter
+
+#every code generation mode must compute what the plain compiler computes
+MODES = {
+    "fold": dict(fold_constants=True),
+    "strength": dict(strength_reduce=True),
+    "peephole": dict(peephole_rules=DEFAULT_RULES),
+    "ast": dict(build_ast=True),
+    "all": dict(fold_constants=True, strength_reduce=True, peephole_rules=DEFAULT_RULES, build_ast=True),
+}
+
+PROGRAM = {
+    "Main": """
+        class Main {
+            static int calls;
+
+            function int main() {
+                var Array a;
+                var int i, sum;
+                var Counter counter;
+                var String s;
+
+                let a = Array.new(10);
+                let i = 0;
+                while (i < 10) {
+                    let a[i] = (i * i) - (2 / 1) + (-3) + (i * 8) - (i / 4);
+                    let sum = sum + a[i];
+                    let i = i + 1;
+                }
+
+                if ((sum > 100) & ~(sum = 0)) {
+                    do Output.printString("big ");
+                } else {
+                    do Output.printString("small ");
+                }
+
+                let counter = Counter.new(3 * 4 + 2);
+                do counter.add(sum);
+                do counter.add(Main.half(-17));
+                let s = "x*1 = ";
+                do Output.printString(s);
+                do Output.printInt(counter.total() * 1);
+                do Output.println();
+
+                let i = ((1 + 2) * 3) - (100 / 5) + (7 * 0) + (~5) + (-(-6)) + (9 * 1);
+                let i = i * 16 + (i / 1) * 7 + (32767 + 1) + (1 / (i + 3));
+                return i + sum + counter.total() + calls;
+            }
+
+            function int half(int x) {
+                let calls = calls + 1;
+                return x / 2;
+            }
+        }
+    """,
+    "Counter": """
+        class Counter {
+            field int total, step;
+
+            constructor Counter new(int s) {
+                let step = s;
+                let total = 0;
+                return this;
+            }
+
+            method void add(int x) {
+                let total = total + (x * step) + (step * 2);
+                return;
+            }
+
+            method int total() {
+                return total;
+            }
+        }
+    """,
+}
+
+
+def _run(programs:dict, **engine_options) -> tuple:
+    #(return value, printed output) of the program compiled with engine_options
+    vm_code = {name: compile_source(source, name, **engine_options) for name, source in programs.items()}
+    interpreter = VMInterpreter(vm_code)
+    return interpreter.run(), interpreter.output
+
+
+def _expression(rng:random.Random, depth:int) -> str:
+    #a random Jack expression over the locals x and y
+    choice = rng.random()
+
+    if depth == 0 or choice < 0.3:
+        return rng.choice(["0", "1", "2", "3", "4", "7", "8", "16", "100", "256", "1024", "32767", "x", "y"])
+    if choice < 0.45:
+        return rng.choice("-~") + _expression(rng, depth - 1)
+    if choice < 0.6:
+        return f"({_expression(rng, depth - 1)})"
+
+    return f"({_expression(rng, depth - 1)} {rng.choice('+-*/&|<>=')} {_expression(rng, depth - 1)})"
+
+
+def _expression_program(expression:str, x:int, y:int) -> dict:
+    return {"Main": "class Main { function int main() { var int x, y; let x = %d; let y = %d; return %s; } }"
+                    % (x, y, expression)}
+
+
+@pytest.mark.parametrize("mode", [None, *MODES])
+@pytest.mark.parametrize("source", [
+    "class Main { function void main() { return; }",
+    "class Main { function void main() { return; } } junk",
+    "class Main { } }",
+    "",
+    "  // only a comment\n",
+])
+def test_incomplete_class_is_a_syntax_error(mode, source):
+    with pytest.raises(SyntaxError):
+        compile_source(source, "Main", **MODES.get(mode, {}))
+
+
+@pytest.mark.parametrize("mode", [None, *MODES])
+def test_empty_class_compiles_to_nothing(mode):
+    assert compile_source("class Main { }", "Main", **MODES.get(mode, {})) == ""
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_program(mode):
+    assert _run(PROGRAM, **MODES[mode]) == _run(PROGRAM)
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("seed", range(4))
+def test_random_expressions(mode, seed):
+    rng = random.Random(seed)
+
+    for _ in range(40):
+        expression = _expression(rng, 4)
+
+        for x, y in ((0, 0), (1, -1), (7, 3), (-5, 2), (32767, -32767), (123, -45)):
+            programs = _expression_program(expression, x, y)
+
+            try:
+                expected = _run(programs)
+            except VMError:
+                continue  # division by zero
+
+            assert _run(programs, **MODES[mode]) == expected, expression
@@ -0,0 +1,42 @@
+import os
+import tempfile
+import threading
+
+import pytest
+
+from compile_server import CompileClient, CompileServer
+
+
+@pytest.fixture
+def client():
+    #a server on a private socket, serving in a thread until the test is done
+    directory = tempfile.mkdtemp()  # pytest's tmp_path can exceed the socket path limit
+    socket_path = os.path.join(directory, "compile.sock")
+    server = CompileServer(socket_path)
+    thread = threading.Thread(target=server.serve, daemon=True)
+    thread.start()
+
+    with CompileClient(socket_path) as client:
+        yield client
+        client.shutdown()
+
+    thread.join()
+    os.rmdir(directory)
+
+
+def test_compiles_source(client):
+    reply = client.compile_text("class A { function int f() { return 1; } }", "A")
+    assert reply["ok"]
+    assert reply["vm"] == "function A.f 0\npush constant 1\nreturn\n"
+
+
+@pytest.mark.parametrize("source, message", [
+    ("class A {", "class A is not closed"),
+    ("class A { function void f() { return; }", "class A is not closed"),
+    ("class A { } junk", "unexpected 'junk' after the end of class A"),
+    ("", "the source is empty"),
+])
+def test_malformed_source_is_an_error(client, source, message):
+    reply = client.compile_text(source, "A")
+    assert not reply["ok"]
+    assert reply["error"].startswith("SyntaxError") and message in reply["error"]
@@ -0,0 +1,26 @@
+import io
+
+from compilation_engine import GRAMMAR_RULES, CompilationEngine, CompileHook
+
+SOURCE = "class Main { function int main() { var int x; let x = 2 * (3 + 4) * x / 1; return x * 8; } }"
+
+
+class RuleRecorder(CompileHook):
+
+    def __init__(self):
+        self.rules = set()
+
+    def enter(self, rule:str):
+        self.rules.add(rule)
+
+
+def test_hooks_see_only_grammar_rules():
+    recorder = RuleRecorder()
+
+    with CompilationEngine(input_file="Main.jack", source=SOURCE, output_stream=io.StringIO(),
+                           fold_constants=True, strength_reduce=True) as engine:
+        engine.add_hook(recorder)
+        engine._compileClass()
+
+    assert {"class", "subroutineDec", "let", "expression", "term"} <= recorder.rules
+    assert recorder.rules <= set(GRAMMAR_RULES.values())
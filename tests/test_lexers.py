@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+from benchmark import generate_corpus
+from tokenizer import Tokenizer
+
+#fragments that exercise the lexers' corner cases: comments inside and after words,
+#strings glued to words, unterminated strings and comments, numbers out of range
+_FRAGMENTS = ["class", "let", "do", "int", "x", "foo_1", "Bar", "0", "7", "32767", "32768", "99999", "12ab",
+              "+", "-", "*", "/", "(", ")", "{", "}", "[", "]", ";", ",", ".", "<", ">", "=", "~", "&", "|",
+              " ", " ", "  ", "\t", "\n", "\n", "\r\n", "//", "// note\n", "/*", "*/", "/* c */", "/** doc\n */",
+              '"', '"text"', '"a b"', '""', "é"]
+
+
+def _records(source:str, lexer:str, **options) -> list:
+    tokenizer = Tokenizer(input_file="Main.jack", lexer=lexer, source=source, **options)
+    return [tokenizer._record(index) for index in range(len(tokenizer.tokens))]
+
+
+def _sources():
+    sources = list(generate_corpus(classes=2, fields=6, methods=6, depth=2, expression_terms=6,
+                                   string_length=12, seed=3).values())
+    rng = random.Random(0)
+    for _ in range(400):
+        sources.append("".join(rng.choice(_FRAGMENTS) for _ in range(rng.randint(1, 40))))
+    return sources
+
+
+@pytest.mark.parametrize("source", _sources())
+def test_regex_lexer_matches_hand_lexer(source):
+    assert _records(source, "regex") == _records(source, "hand")
+
+
+@pytest.mark.parametrize("source", [source for source in _sources() if source.isascii()][::8])
+def test_mmap_lexer_matches_hand_lexer(source, tmp_path):
+    #mmap columns are byte offsets, which equal character columns for ASCII sources
+    path = tmp_path / "Main.jack"
+    path.write_bytes(source.encode())
+    mapped = Tokenizer(input_file=str(path), lexer="regex", use_mmap=True)
+    assert [mapped._record(index) for index in range(len(mapped.tokens))] == _records(source, "hand")
+
+
+def test_mmap_lexer_translates_crlf_in_strings(tmp_path):
+    source = 'class Main {\r\n  let s = "one\r\ntwo";\r\n  let t = x"a\r\nb";\r\n}\r\n'
+    path = tmp_path / "Main.jack"
+    path.write_bytes(source.encode())
+    mapped = Tokenizer(input_file=str(path), lexer="regex", use_mmap=True)
+
+    assert '"one\ntwo"' in mapped.tokens and 'x"a\nb"' in mapped.tokens
+    assert [mapped._record(index) for index in range(len(mapped.tokens))] == _records(source, "hand")
+
+
+def test_streaming_yields_the_stored_tokens():
+    source = next(iter(generate_corpus(classes=1, seed=1).values()))
+    for lexer in ("hand", "regex"):
+        tokenizer = Tokenizer(input_file="Main.jack", lexer=lexer, source=source, streaming=True)
+        streamed = []
+        while tokenizer.hasMoreTokens():
+            streamed.append(tokenizer.peek(0))
+            tokenizer.advance()
+        assert streamed == _records(source, lexer)
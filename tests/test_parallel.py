@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from jackanalyzer import JackAnalyzer
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SOURCES = {
+    "Alpha.jack": "class Alpha { function int f() { return 1 + 2; } }",
+    "Beta.jack": "class Beta { function int f() { return missing; } }",
+    "Gamma.jack": "class Gamma { function int f(int x) { return x * 3; } }",
+}
+
+
+def _project(directory):
+    directory.mkdir(exist_ok=True)
+    for name, source in SOURCES.items():
+        (directory / name).write_text(source)
+    return directory
+
+
+def _outputs(directory) -> dict:
+    return {name: (directory / name).read_text() for name in sorted(os.listdir(directory)) if name.endswith(".vm")}
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_failing_file_does_not_stop_the_others(tmp_path, jobs):
+    analyzer = JackAnalyzer(str(_project(tmp_path)), jobs=jobs)
+
+    assert [os.path.basename(file) for file, _ in analyzer.errors] == ["Beta.jack"]
+    assert "VariableNotFoundError" in analyzer.errors[0][1]
+    assert sorted(_outputs(tmp_path)) == ["Alpha.vm", "Gamma.vm"]
+
+
+def test_parallel_build_matches_serial_build(tmp_path):
+    serial, parallel = _project(tmp_path / "serial"), _project(tmp_path / "parallel")
+
+    results = {}
+    for directory, jobs in ((serial, 1), (parallel, 2)):
+        process = subprocess.run([sys.executable, "jackanalyzer.py", str(directory), "-j", str(jobs), "--peephole"],
+                                 cwd=REPO_DIR, capture_output=True, text=True)
+        #one failed file makes the whole run fail
+        assert process.returncode == 1
+        #results are reported in file order whichever worker compiled them
+        results[jobs] = (process.stdout.replace(str(directory), "DIR"), _outputs(directory))
+
+    assert results[1] == results[2]
+    assert list(results[2][1]) == ["Alpha.vm", "Gamma.vm"]
@@ -0,0 +1,45 @@
+from compilation_engine import compile_source
+from peephole import DEFAULT_RULES, optimize
+from vm_interpreter import VMInterpreter
+from vm_ir import parse
+
+SOURCE = """
+    class Main {
+        function int main() {
+            var Array a;
+            var int x;
+            let x = 5;
+            let a = Array.new(3);
+            let a[0] = x;
+            let a[1] = 7;
+            let a[2] = a[1];
+            return a[0] + a[1] + a[2];
+        }
+    }
+"""
+
+
+def test_array_store_of_a_term_skips_temp_0():
+    plain = compile_source(SOURCE, "Main")
+    optimized = compile_source(SOURCE, "Main", peephole_rules=DEFAULT_RULES)
+
+    #a[0] = x and a[1] = 7 go straight to THAT, a[2] = a[1] reads THAT and still needs temp 0
+    assert plain.count("pop temp 0") == 3
+    assert optimized.count("pop temp 0") == 1
+    assert VMInterpreter({"Main": optimized}).run() == VMInterpreter({"Main": plain}).run() == 19
+
+
+def test_optimize_counts_the_removed_instructions():
+    code = parse(compile_source(SOURCE, "Main"))
+    optimized, removed = optimize(code)
+    assert removed == len(code) - len(optimized) == 4
+
+
+def test_analyzer_keeps_the_removed_counts(tmp_path, capsys):
+    from jackanalyzer import JackAnalyzer
+
+    (tmp_path / "Main.jack").write_text(SOURCE)
+    analyzer = JackAnalyzer(str(tmp_path), peephole_rules=DEFAULT_RULES)
+
+    assert analyzer.removed == {str(tmp_path / "Main.jack"): 4}
+    assert capsys.readouterr().out == ""  # printing is up to the command line
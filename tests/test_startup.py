@@ -0,0 +1,11 @@
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_the_compiler_does_not_import_logging():
+    #logging alone costs about as much to import as the whole compiler
+    check = "import sys, jackanalyzer; sys.exit('logging' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", check], cwd=REPO_DIR).returncode == 0
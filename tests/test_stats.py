@@ -0,0 +1,74 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import stats
+from jackanalyzer import JackAnalyzer
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#23 tokens; compiles to 5 instructions, 69 bytes
+SOURCE = "class Main { function int main() { var int x; let x = 2; return x; } }\n"
+VM_CODE = "function Main.main 1\npush constant 2\npop local 0\npush local 0\nreturn\n"
+
+
+@pytest.mark.parametrize("options", [{}, dict(buffered_output=True), dict(streaming=True), dict(record_ir=True)])
+def test_counters_of_a_known_class(tmp_path, options):
+    (tmp_path / "Main.jack").write_text(SOURCE)
+    record, = JackAnalyzer(str(tmp_path), collect_stats=True, **options).stats
+
+    assert (tmp_path / "Main.vm").read_text() == VM_CODE
+    assert record.tokens == 23
+    assert record.vm_instructions == 5
+    assert record.bytes_in == len(SOURCE)
+    assert record.bytes_out == len(VM_CODE)
+    #x in the let, x in the return, and the return's check for a constructor's 'this'
+    assert record.symbol_lookups == 3
+    assert record.lex_seconds > 0 and record.compile_seconds > 0
+    assert record.total_seconds == record.lex_seconds + record.compile_seconds + record.write_seconds
+
+
+def test_total_adds_every_counter():
+    first, second = stats.CompileStats("a"), stats.CompileStats("b")
+    first.tokens, first.bytes_out, first.lex_seconds = 10, 100, 0.5
+    second.tokens, second.bytes_out, second.lex_seconds = 5, 50, 0.25
+
+    total = stats.total([first, second])
+    assert (total.file, total.tokens, total.bytes_out, total.lex_seconds) == ("total", 15, 150, 0.75)
+    assert total.tokens_per_second == 20
+
+
+def test_summary_has_a_row_per_file_and_a_total():
+    record = stats.CompileStats("Main.jack")
+    record.tokens = 23
+
+    rows = stats.summary([record]).splitlines()
+    assert len(rows) == 4
+    assert rows[2].startswith("Main.jack") and rows[3].startswith("total")
+
+
+def test_json_report_round_trips(tmp_path):
+    (tmp_path / "Main.jack").write_text(SOURCE)
+    (tmp_path / "Other.jack").write_text(SOURCE.replace("Main", "Other"))
+    report_path = tmp_path / "report.json"
+
+    subprocess.run([sys.executable, "jackanalyzer.py", str(tmp_path), "--stats-json", str(report_path)],
+                   cwd=REPO_DIR, check=True)
+    report = json.loads(report_path.read_text())
+
+    assert [os.path.basename(record["file"]) for record in report["files"]] == ["Main.jack", "Other.jack"]
+
+    #each record rebuilds the CompileStats it came from
+    records = []
+    for fields in report["files"]:
+        record = stats.CompileStats()
+        for field in stats.FIELDS:
+            setattr(record, field, fields[field])
+        assert record.as_dict() == fields
+        records.append(record)
+
+    assert stats.total(records).as_dict() == report["total"]
+    assert report["total"]["tokens"] == 46 and report["total"]["vm_instructions"] == 10
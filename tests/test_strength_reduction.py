@@ -0,0 +1,40 @@
+import pytest
+
+from compilation_engine import compile_source
+from vm_interpreter import VMInterpreter
+
+
+def _divide(x, y):
+    #Math.divide truncates toward zero
+    quotient = abs(x) // abs(y)
+    return quotient if (x < 0) == (y < 0) else -quotient
+
+
+def _run(expression:str, x:int, **engine_options) -> int:
+    #value of expression in a function where the local x holds x
+    source = ("class Main { function int main() { var int x; let x = %d; let x = %sx; return %s; } }"
+              % (abs(x), "-" if x < 0 else "", expression))
+    vm_code = compile_source(source, "Main", **engine_options)
+    return VMInterpreter({"Main": vm_code}).run()
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("1 / x", lambda x: _divide(1, x)),
+    ("-1 / x", lambda x: _divide(-1, x)),
+    ("x / 1", lambda x: x),
+    ("x * 1", lambda x: x),
+    ("1 * x", lambda x: x),
+    ("x / -1", lambda x: -x),
+])
+@pytest.mark.parametrize("x", [1, -1, 2, -3, 7, 100])
+@pytest.mark.parametrize("fold_constants", [False, True])
+@pytest.mark.parametrize("build_ast", [False, True])
+def test_reduction_by_one(expression, expected, x, fold_constants, build_ast):
+    assert _run(expression, x, strength_reduce=True, fold_constants=fold_constants, build_ast=build_ast) == expected(x)
+
+
+@pytest.mark.parametrize("build_ast", [False, True])
+def test_constant_divided_by_expression_calls_math_divide(build_ast):
+    vm_code = compile_source("class F { function int f(int x) { return 1 / x; } }", "F", strength_reduce=True,
+                             build_ast=build_ast)
+    assert "call Math.divide 2" in vm_code
@@ -0,0 +1,78 @@
+import pytest
+
+from symboltable import Symbol, SymbolTable, VariableNotFoundError
+
+
+@pytest.fixture
+def table():
+    table = SymbolTable()
+    table._define(name="count", type="int", kind="static")
+    table._define(name="x", type="int", kind="field")
+    table._define(name="y", type="int", kind="field")
+    table._define(name="name", type="String", kind="static")
+    return table
+
+
+def test_indices_are_numbered_per_kind(table):
+    table._startSubroutine()
+    table._define(name="this", type="Point", kind="argument")
+    table._define(name="dx", type="int", kind="argument")
+    table._define(name="i", type="int", kind="local")
+    table._define(name="sum", type="int", kind="local")
+
+    assert [table._indexof(name) for name in ("count", "name", "x", "y")] == [0, 1, 0, 1]
+    assert [table._indexof(name) for name in ("this", "dx", "i", "sum")] == [0, 1, 0, 1]
+    assert [table._varCount(kind) for kind in ("static", "field", "argument", "local")] == [2, 2, 2, 2]
+
+
+def test_subroutine_scope_shadows_class_scope(table):
+    table._startSubroutine()
+    table._define(name="x", type="boolean", kind="local")
+
+    assert table.lookup("x") == Symbol("x", "boolean", "local", 0)
+    assert table.lookup("y") == Symbol("y", "int", "field", 1)
+
+
+def test_first_definition_wins(table):
+    table._startSubroutine()
+    table._define(name="i", type="int", kind="local")
+    table._define(name="i", type="char", kind="local")
+
+    assert table.lookup("i") == Symbol("i", "int", "local", 0)
+    #the second definition still takes an index, as it did before the rewrite
+    assert table._varCount("local") == 2
+
+
+def test_start_subroutine_resets_only_the_subroutine_scope(table):
+    table._startSubroutine()
+    table._define(name="a", type="int", kind="argument")
+    table._define(name="i", type="int", kind="local")
+
+    table._startSubroutine()
+    table._define(name="j", type="int", kind="local")
+
+    assert table.lookup("j").index == 0
+    assert table._varCount("argument") == 0 and table._varCount("local") == 1
+    assert table._varCount("static") == 2 and table._varCount("field") == 2
+    assert table.lookup("count") == Symbol("count", "int", "static", 0)
+
+    for name in ("a", "i"):
+        with pytest.raises(VariableNotFoundError):
+            table.lookup(name)
+
+
+def test_lookup_of_an_unknown_name_raises(table):
+    with pytest.raises(VariableNotFoundError) as error:
+        table.lookup("missing")
+
+    assert error.value.variable_name == "missing"
+    assert error.value.scope == "class"
+    assert str(error.value) == "Variable not found in scope 'class'"
+
+
+def test_class_scope_does_not_see_subroutine_variables():
+    table = SymbolTable()
+    table._define(name="i", type="int", kind="local")
+
+    with pytest.raises(VariableNotFoundError):
+        table.lookup("i")
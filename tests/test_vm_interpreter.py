@@ -0,0 +1,34 @@
+from compilation_engine import compile_source
+from vm_interpreter import OS_COSTS, VMInterpreter
+
+LOOP = ("class Main { function int main() { var int i, sum; let i = 0;"
+        " while (i < 100) { let sum = sum + (i * 7); let i = i + 1; } return sum; } }")
+
+
+def _interpreter(source:str, os_costs:dict=None, **engine_options) -> VMInterpreter:
+    interpreter = VMInterpreter({"Main": compile_source(source, "Main", **engine_options)}, os_costs)
+    interpreter.run()
+    return interpreter
+
+
+def test_multiplication_costs_the_os_estimate():
+    interpreter = _interpreter(LOOP)
+    assert interpreter.os_calls() == {"Math.multiply": (100, 100 * OS_COSTS["Math.multiply"])}
+    assert interpreter.total_instructions == interpreter.executed + interpreter.os_instructions
+
+
+def test_strength_reduction_is_cheaper_than_math_multiply():
+    plain = _interpreter(LOOP)
+    reduced = _interpreter(LOOP, strength_reduce=True)
+    assert reduced.os_instructions == 0
+    assert reduced.total_instructions < plain.total_instructions
+
+
+def test_os_costs_override_the_defaults():
+    interpreter = _interpreter(LOOP, {"Math.multiply": 1})
+    assert interpreter.os_instructions == 100
+
+
+def test_divide_cost_depends_on_the_operands():
+    source = "class Main { function int main() { return %d / %d; } }"
+    assert _interpreter(source % (32000, 7)).os_instructions > _interpreter(source % (3, 5)).os_instructions
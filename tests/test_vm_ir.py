@@ -0,0 +1,43 @@
+import pytest
+
+from compilation_engine import compile_source
+from test_codegen_differential import PROGRAM
+from vm_ir import Opcode, parse, serialize, to_text
+
+
+@pytest.mark.parametrize("name", PROGRAM)
+def test_parse_is_the_inverse_of_serialize(name):
+    text = compile_source(PROGRAM[name], name)
+    instructions = parse(text)
+
+    assert serialize(instructions) == text
+    assert parse(serialize(instructions)) == instructions
+
+
+def test_every_opcode_round_trips():
+    instructions = [
+        (Opcode.FUNCTION, "Main.main", 2),
+        (Opcode.PUSH, "constant", 7),
+        (Opcode.POP, "local", 1),
+        *[(opcode, None, None) for opcode in (Opcode.ADD, Opcode.SUB, Opcode.NEG, Opcode.EQ, Opcode.GT,
+                                              Opcode.LT, Opcode.AND, Opcode.OR, Opcode.NOT)],
+        (Opcode.LABEL, "WHILE_EXP0", None),
+        (Opcode.IF_GOTO, "WHILE_END0", None),
+        (Opcode.GOTO, "WHILE_EXP0", None),
+        (Opcode.CALL, "Math.multiply", 2),
+        (Opcode.RETURN, None, None),
+    ]
+
+    assert {opcode for opcode, _, _ in instructions} == set(Opcode)
+    assert parse(serialize(instructions)) == instructions
+    assert serialize(instructions) == "".join(map(to_text, instructions))
+
+
+def test_parse_skips_comments_and_blank_lines():
+    assert parse("// header\n\npush constant 1 // one\n  add\n") == [(Opcode.PUSH, "constant", 1),
+                                                                      (Opcode.ADD, None, None)]
+
+
+def test_parse_rejects_unknown_commands():
+    with pytest.raises(ValueError, match="Line 2: unknown VM command 'jump'"):
+        parse("push constant 1\njump somewhere\n")
@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+from compilation_engine import CompilationEngine
+from test_codegen_differential import PROGRAM
+
+GOOD = "class Main { function int main() { return 1; } }"
+#fails in the middle of the class, after main has been written
+BAD = "class Main { function int main() { return 1; } function int f() { return x; } }"
+
+
+@pytest.mark.parametrize("options", [{}, dict(buffered_output=True), dict(record_ir=True)])
+def test_failed_compile_keeps_the_previous_vm_file(tmp_path, options):
+    source = tmp_path / "Main.jack"
+    source.write_text(GOOD)
+
+    with CompilationEngine(input_file=str(source), **options) as engine:
+        engine._compileClass()
+    previous = (tmp_path / "Main.vm").read_text()
+
+    source.write_text(BAD)
+    with pytest.raises(Exception):
+        with CompilationEngine(input_file=str(source), **options) as engine:
+            engine._compileClass()
+
+    assert (tmp_path / "Main.vm").read_text() == previous
+    assert sorted(os.listdir(tmp_path)) == ["Main.jack", "Main.vm"]
+
+
+@pytest.mark.parametrize("options", [{}, dict(buffered_output=True)])
+def test_failed_first_compile_writes_no_vm_file(tmp_path, options):
+    source = tmp_path / "Main.jack"
+    source.write_text(BAD)
+
+    with pytest.raises(Exception):
+        with CompilationEngine(input_file=str(source), **options) as engine:
+            engine._compileClass()
+
+    assert os.listdir(tmp_path) == ["Main.jack"]
+
+
+def _compile_to_file(directory, name:str, source:str, **options) -> bytes:
+    #the .vm file written for source, as bytes
+    path = directory / f"{name}.jack"
+    path.write_text(source)
+
+    with CompilationEngine(input_file=str(path), **options) as engine:
+        engine._compileClass()
+
+    return (directory / f"{name}.vm").read_bytes()
+
+
+@pytest.mark.parametrize("name", PROGRAM)
+def test_buffered_output_is_identical_to_unbuffered(tmp_path, name):
+    (tmp_path / "plain").mkdir()
+    (tmp_path / "buffered").mkdir()
+
+    plain = _compile_to_file(tmp_path / "plain", name, PROGRAM[name])
+    buffered = _compile_to_file(tmp_path / "buffered", name, PROGRAM[name], buffered_output=True)
+
+    assert plain
+    assert buffered == plain
+
+
+@pytest.mark.parametrize("name", PROGRAM)
+def test_ir_output_is_identical_to_unbuffered(tmp_path, name):
+    (tmp_path / "plain").mkdir()
+    (tmp_path / "ir").mkdir()
+
+    plain = _compile_to_file(tmp_path / "plain", name, PROGRAM[name])
+    ir = _compile_to_file(tmp_path / "ir", name, PROGRAM[name], record_ir=True)
+
+    assert ir == plain
@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+from jackanalyzer import JackAnalyzer, Rebuild
+
+MAIN = "class Main { function int main() { return 1; } }"
+OTHER = "class Other { function int f() { return 2; } }"
+
+
+@pytest.fixture
+def watched(tmp_path):
+    #an analyzer after its first build, and the snapshot watch mode starts from
+    (tmp_path / "Main.jack").write_text(MAIN)
+    (tmp_path / "Other.jack").write_text(OTHER)
+    analyzer = JackAnalyzer(str(tmp_path))
+    return analyzer, analyzer._snapshot(), tmp_path
+
+
+def _touch(path):
+    #a modification time the previous poll cannot have seen
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def _counts(rebuild:Rebuild) -> tuple:
+    return rebuild.compiled, rebuild.up_to_date, rebuild.failed, rebuild.deleted, rebuild.total
+
+
+def test_nothing_changed(watched):
+    analyzer, snapshot, _ = watched
+    assert analyzer.poll(snapshot) == (snapshot, None)
+
+
+def test_edit_is_rebuilt(watched):
+    analyzer, snapshot, directory = watched
+    (directory / "Main.jack").write_text(MAIN.replace("1", "42"))
+
+    snapshot, rebuild = analyzer.poll(snapshot)
+    assert _counts(rebuild) == (1, 0, 0, 0, 2)
+    assert "push constant 42" in (directory / "Main.vm").read_text()
+    assert analyzer.poll(snapshot)[1] is None
+
+
+def test_touch_without_change_is_up_to_date(watched):
+    analyzer, snapshot, directory = watched
+    _touch(directory / "Main.jack")
+
+    _, rebuild = analyzer.poll(snapshot)
+    assert _counts(rebuild) == (0, 1, 0, 0, 2)
+
+
+def test_force_rebuilds_a_touched_file(watched):
+    _, _, directory = watched
+    analyzer = JackAnalyzer(str(directory), force=True)
+    snapshot = analyzer._snapshot()
+    _touch(directory / "Main.jack")
+
+    _, rebuild = analyzer.poll(snapshot)
+    assert _counts(rebuild) == (1, 0, 0, 0, 2)
+
+
+def test_delete_evicts(watched):
+    analyzer, snapshot, directory = watched
+    (directory / "Other.jack").unlink()
+
+    _, rebuild = analyzer.poll(snapshot)
+    assert _counts(rebuild) == (0, 0, 0, 1, 1)
+    assert not (directory / "Other.vm").exists()
+
+
+def test_failing_file_is_counted_as_failed(watched):
+    analyzer, snapshot, directory = watched
+    (directory / "Bad.jack").write_text("class Bad { function int f() { return x; } }")
+    (directory / "Main.jack").write_text(MAIN.replace("1", "42"))
+
+    snapshot, rebuild = analyzer.poll(snapshot)
+    assert _counts(rebuild) == (1, 0, 1, 0, 3)
+    assert [os.path.basename(file) for file, _ in analyzer.errors] == ["Bad.jack"]
+
+    #fixing it rebuilds only that file
+    (directory / "Bad.jack").write_text("class Bad { function int f() { return 3; } }")
+    _, rebuild = analyzer.poll(snapshot)
+    assert _counts(rebuild) == (1, 0, 0, 0, 3)
@@ -1,4 +1,10 @@
+import io
 import os
+import sys
+from array import array
+from collections import deque, namedtuple
+from enum import Enum
+from diagnostics import TRACE, get_logger
 
 """
 * A tokenizer that generates an xml file output with the tokens from the .jack file
@@ -7,50 +13,274 @@ import os
 
 """
 
+logger = get_logger(__name__)
+
+class TokenType(str, Enum):
+    #token types - a str enum so they still compare equal to "KEYWORD", "SYMBOL" ...
+    KEYWORD = "KEYWORD"
+    SYMBOL = "SYMBOL"
+    INT_CONST = "INT_CONST"
+    STRING_CONST = "STRING_CONST"
+    IDENTIFIER = "IDENTIFIER"
+
+
+#a token classified once at lex time - value is interned, int_value is pre-parsed for INT_CONST
+Token = namedtuple("Token", ["value", "type", "int_value", "line", "column"])
+
+KEYWORDS = frozenset(["class","constructor","function","method","field","static","var"
+                      ,"int","char","boolean","void","true","false","null","this",
+                      "let","do","if","else","while","return"])
+
+SYMBOLS = frozenset(["{","}","(",")","[","]",",",";","+","-","*","/","&","|","<",">","=","~"])
+
+#the type column stores the position of a token's type in this tuple
+_TOKEN_TYPES = tuple(TokenType)
+_TYPE_CODES = {token_type: code for code, token_type in enumerate(_TOKEN_TYPES)}
+
+#available lexer backends: the hand-written character scanner and the master regex
+LEXERS = ("hand", "regex")
+
+#master regex for the regex lexer. Each match skips whitespace and comments and then
+#matches exactly one token, classified by the group that matched:
+#   symbol, keyword, integer, identifier   plain tokens (the '.' of foo.bar is not in
+#                                          SYMBOLS, so it is typed as an identifier)
+#   string                                 a string constant, possibly unterminated
+#   word                                   a word with block comments inside it or a string
+#                                          glued to it - rare, rebuilt by _join_word
+#   end                                    only whitespace and comments were left
+#like the hand-written scanner, a block comment does not end a word ( ab/**/c is "abc" ),
+#a word glued to a string ( abc"x" ) stays one token, and a word swallowed by an
+#unterminated string or block comment is dropped
+#the patterns are compiled on first use (re caches them), so the hand-written
+#lexer does not pay for compiling them at import time
+_WORD_CHAR = r"""[^\s{}()\[\],;+\-*/&|<>=~."]"""
+#a plain word ends before a character that is neither part of it nor starts a comment or string
+_WORD_END = rf"""(?!{_WORD_CHAR}|/\*|")"""
+
+_TOKEN_PATTERN = rf"""
+    (?: \s+ | //[^\n]* | /\*.*?(?:\*/|\Z) )*
+    (?:
+        (?P<symbol>     [{{}}()\[\],;+\-*/&|<>=~] )
+      | (?P<keyword>    (?:{"|".join(sorted(KEYWORDS, key=len, reverse=True))}) {_WORD_END} )
+      | (?P<integer>    \d+ {_WORD_END} )
+      | (?P<identifier> {_WORD_CHAR}+ {_WORD_END} | \. )
+      | (?P<string>     "[^"]*(?:"|\Z) )
+      | (?P<word>       {_WORD_CHAR}+
+                        (?: (?:/\*(?:(?!\*/).)*\*/)+ {_WORD_CHAR}+ )*
+                        (?: (?:/\*(?:(?!\*/).)*\*/)* (?: (?P<glued>"[^"]*(?:"|\Z)) | (?P<unterminated>/\*(?:(?!\*/).)*\Z) ) )? )
+      | (?P<end>        \Z )
+    )
+"""
+
+_BLOCK_COMMENT_PATTERN = r"/\*(?:(?!\*/).)*\*/"
+
+
+def _translate_newlines(text:str) -> str:
+    #"\r\n" and "\r" to "\n", the way reading a file in text mode translates them
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
 class Tokenizer:
 
-    def __init__(self, input_file):
+    def __init__(self, input_file, lexer:str="hand", streaming:bool=False, use_mmap:bool=False, source:str=None):
         
+        if lexer not in LEXERS:
+            raise ValueError(f"Unknown lexer '{lexer}', expected one of: {', '.join(LEXERS)}")
+
+        if use_mmap and lexer != "regex":
+            raise ValueError("Memory-mapped source reading requires the regex lexer")
+
+        if use_mmap and source is not None:
+            raise ValueError("Source text cannot be memory-mapped")
+
         self.outputfile = os.path.splitext(input_file)[0] + ".xml"
         self.index = 0
         self.current_token = ""
-        self.keywords = ["class","constructor","function","method","field","static","var"
-                         ,"int","char","boolean","void","true","false","null","this",
-                         "let","do","if","else","while","return"]
-        
-        self.symbols = ["{","}","(",")","[","]",",",";","+","-","*","/","&","|","<",">","=","~"]
+        self._current_type = TokenType.IDENTIFIER
+        self._current_int = None
+        self._current_line = 0
+        self.keywords = KEYWORDS
+        self.symbols = SYMBOLS
         self.input_file = input_file
-        #generate tokes with line numbers
-        self.tokens_with_line_numbers = self._generate_tokens_with_line_numbers(input_file=self.input_file)
+        self.lexer = lexer
+        self.streaming = streaming
+        self.use_mmap = use_mmap
+        self._trace = logger.isEnabledFor(TRACE)
+        #source text to lex instead of reading input_file, which then only names the source
+        self.source = source
+        self._file = None
+        self._mmap = None
+        self._stream = iter(())
 
         self._process_file()
 
 
     def _process_file(self):
-        
-        #open the file
-        with open(self.input_file, "r") as f:
 
-            print("SUCCESSFULLY OPENED THE FILE FOR READ.")
-            lines = f.readlines()
+        #open the file - Token records from a single scan
+        self._open_source()
 
-            #tokens
-            self.tokens = self._filter_lines(lines=lines)
+        if self.streaming:
+            self._open_stream()
+            return
 
-            print(f"Successfully generated tokens : {self.tokens}")
+        try:
+            self._store(self._stream)
+        finally:
+            self.close()
+
+        if self._trace:
+            logger.log(TRACE, "Successfully generated tokens : %s", self.tokens)
+
+        #initialize current token
+        if self.tokens and len(self.tokens)>0:
+            self._load(0)
 
-            #initialize current token
-            if self.tokens and len(self.tokens)>0:
-                self.current_token = self.tokens[0]
 
 
-            
         # write tokens to output file
         #self._write_tokens()
 
+    def _open_source(self):
+        #open the input file and set up the record generator of the selected lexer
+        if self.source is not None:
+            text = _translate_newlines(self.source)
+
+            if self.lexer == "regex":
+                self._stream = self._scan_regex(text=text)
+            else:
+                #StringIO splits lines on "\n" only, like a file (str.splitlines would also split on \f)
+                self._stream = self._scan(lines=io.StringIO(text))
+
+        elif self.use_mmap:
+            self._file = open(self.input_file, "rb")
+
+            #an empty file cannot be mapped
+            if os.fstat(self._file.fileno()).st_size:
+                import mmap  # only needed for --mmap
+
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                self._stream = self._scan_bytes(buffer=self._mmap)
+            else:
+                self._stream = self._scan_bytes(buffer=b"")
+
+        else:
+            self._file = open(self.input_file, "r")
+
+            if self.lexer == "regex":
+                self._stream = self._scan_regex(text=self._file.read())
+                self._file.close()
+                self._file = None
+            else:
+                self._stream = self._scan(lines=self._file)
+
+        logger.debug("Opened %s for reading", self.input_file if self.source is None else "source text")
+
+
+    def _open_stream(self):
+        """
+        Streaming mode: records are pulled from the scanner generator as the parser
+        advances and buffered only as far as peek() looks ahead, so no token list is
+        built. The hand-written lexer reads one line at a time and a memory-mapped
+        source is paged in by the OS; only the plain regex lexer holds the whole text
+        """
+        self._lookahead = deque()
+        self._has_current = False
+
+        #initialize current token
+        record = self._next_record()
+        if record is not None:
+            self._set_current(record)
+
+
+    def _next_record(self):
+        #next record from the lookahead buffer or the scanner, None once the source is exhausted
+        if self._lookahead:
+            return self._lookahead.popleft()
+
+        record = next(self._stream, None)
+        if record is None:
+            self.close()
+
+        return record
+
+
+    def _set_current(self, record:Token):
+        #make a streamed record the current token
+        self.current_token = record.value
+        self._current_type = record.type
+        self._current_int = record.int_value
+        self._current_line = record.line
+        self._current_record = record
+        self._has_current = True
+
+
+    def close(self):
+        #release the scanner and the source file/mapping held open by streaming mode
+        if hasattr(self._stream, "close"):
+            self._stream.close()
+        self._stream = iter(())
+
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+    def _store(self, records):
+        """
+        Stores the scanned records column-wise: the interned values in self.tokens
+        and the type code, line, column and integer value in parallel compact arrays
+
+        The values are kept as interned strings rather than start/end offsets into the
+        source. Nearly all tokens repeat a few thousand distinct strings, so the list
+        costs one 8 byte pointer per token, the same as two 4 byte offsets - which would
+        also keep the whole source alive and allocate a new string on every access.
+        Offsets could not even describe every token: a word joined across a block
+        comment (ab/**/c is "abc") is no slice of the source.
+        """
+        self.tokens = []
+        self._types = array("B")
+        self._lines = array("I")
+        self._columns = array("I")
+        self._int_values = array("H")
+
+        add_value = self.tokens.append
+        add_type = self._types.append
+        add_line = self._lines.append
+        add_column = self._columns.append
+        add_int = self._int_values.append
+
+        for value, token_type, int_value, line, column in records:
+            add_value(value)
+            add_type(_TYPE_CODES[token_type])
+            add_line(line)
+            add_column(column)
+            add_int(int_value or 0)
+
+
+    def _load(self, index:int):
+        #make the stored token at index the current token
+        self.current_token = self.tokens[index]
+        self._current_type = _TOKEN_TYPES[self._types[index]]
+        self._current_int = self._int_values[index] if self._current_type is TokenType.INT_CONST else None
+        self._current_line = self._lines[index]
+
+
+    def _record(self, index:int) -> Token:
+        #rebuild the Token record of the stored token at index
+        token_type = _TOKEN_TYPES[self._types[index]]
+        int_value = self._int_values[index] if token_type is TokenType.INT_CONST else None
+
+        return Token(self.tokens[index], token_type, int_value, self._lines[index], self._columns[index])
+
+
     def _write_tokens(self):
 
-        print("Writing the output file.....")
+        logger.debug("Writing the output file %s", self.outputfile)
 
         #make sure dir exists
         output_dir = os.path.dirname(self.outputfile)
@@ -59,7 +289,7 @@ class Tokenizer:
 
         with open(self.outputfile, "w") as f:
 
-            print("Successfully opened an output file.")
+            logger.debug("Successfully opened an output file.")
             f.write("<tokens>\n")
 
 
@@ -67,19 +297,19 @@ class Tokenizer:
 
                 token_type = self.tokenType()
 
-                print(f"Current token is : {self.current_token} and is of type : {token_type}")
+                logger.log(TRACE, "Current token is : %s and is of type : %s", self.current_token, token_type)
 
                 if token_type == "KEYWORD":
                     keyword = self.keyword()
 
-                    print(f"Keyword is : {keyword}")
+                    logger.log(TRACE, "Keyword is : %s", keyword)
                     xml_markup = self._xml_markup_keyword(token=keyword)
                     f.write(xml_markup + "\n")
 
                 elif token_type =="SYMBOL":
                     symbol = self.symbol()
 
-                    print(f"Symbol is : {symbol}")
+                    logger.log(TRACE, "Symbol is : %s", symbol)
                     xml_markup = self._xml_markup_symbol(token=symbol)
                     f.write(xml_markup + "\n")
 
@@ -87,7 +317,7 @@ class Tokenizer:
                     string = self.stringVal()
                     xml_markup = self._xml_markup_string_const(token=string)
 
-                    print(f"String is : {string}")
+                    logger.log(TRACE, "String is : %s", string)
                     f.write(xml_markup + "\n")
 
 
@@ -95,7 +325,7 @@ class Tokenizer:
                     integer_cons = self.intVal()
                     xml_markup = self._xml_markup_for_int(token=integer_cons)
 
-                    print(f"Integer Constant is : {integer_cons}")
+                    logger.log(TRACE, "Integer Constant is : %s", integer_cons)
                     f.write(xml_markup + "\n")
 
 
@@ -103,7 +333,7 @@ class Tokenizer:
                     identifier = self.identifier()
                     xml_markup = self._xml_markup_identifier(token=identifier)
 
-                    print(f"Identifier is : {identifier}")
+                    logger.log(TRACE, "Identifier is : %s", identifier)
                     f.write(xml_markup + "\n")
 
                     #handle other token types
@@ -114,132 +344,24 @@ class Tokenizer:
             
 
 
-    def _generate_tokens_with_line_numbers(self, input_file:str):
-        current_token=""
-        tokens =[]
-        in_block_comment=False
+    def _scan(self, lines):
+        """
+        Scans the source in a single pass and yields a
+        Token record for every token
+        """
+        current_token = ""
+        token_line = 1
+        token_column = 1
+        in_block_comment = False
         in_string = False
         line_number = 1
 
-        with open(input_file, "r") as f:
-            
-            #read line at a time
-            for line in f:
-                
-                #set char
-                i=0
-                while i < len(line):
-                    
-                    char = line[i]
-
-                    if in_block_comment:
-                        if char == "*" and i+1 < len(line) and line[i+1]=="/":
-                            in_block_comment=False
-                            i+=2 # skip the 2 characters
-
-                        else:
-                            i+=1
-
-                    elif in_string:
-                        if char == '"':
-                            current_token+=char
-
-                            #add the token
-                            token_with_number = (current_token, line_number)
-                            tokens.append(token_with_number)
-                            current_token = "" #reset
-                            in_string = False
-                            
-
-                        else:
-                            
-                            current_token+=char
-
-                        i+=1
-
-                    else:
-   
-                        if char == "/" and i+1 < len(line):
-                            #inline comment break
-                            if line[i+1] == "/":
-
-                                break
-
-                            elif line[i+1] == "*":
-                                in_block_comment=True
-                                i+=2 #skip /*
-                                continue
-
-                        if char.isspace():
-                            #space
-                            if current_token:
-                                token_with_number = (current_token, line_number)
-                                tokens.append(token_with_number)
-
-                                current_token = ""
-
-                            i+=1
-
-                        elif char == '"':
-                            current_token+=char
-                            in_string=True
-                            i+=1
-                            
-
-                        elif char in self.symbols:
-                            if current_token:
-                                token_with_number=(current_token, line_number)
-                                tokens.append(token_with_number)
-                                current_token =""
-
-                            token_with_number = (char, line_number)
-                            tokens.append(token_with_number)
-                            i+=1
-
-                        elif char == ".":
-                            if current_token:
-                                token_with_number = (current_token, line_number)
-                                tokens.append(token_with_number)
-                                current_token=""
-
-                            token_with_number = (char, line_number)
-                            tokens.append(token_with_number)
-
-                            i+=1
-                            
-
-                        # Handle other characters (keywords, identifiers, integers, etc.)
-                        else:
-                            current_token += char  # build the current_token
-                            i += 1  # move to the next charact
-
-
-                if current_token and not in_block_comment and not in_string:
-                        token_with_number = (current_token, line_number)
-                        tokens.append(token_with_number)
-                        current_token=""
-
-                #increment line number
-                line_number+=1
-
-            print(tokens)
-
-            return tokens
-
-                       
-  
-
-    def _filter_lines(self, lines: list) -> list:
-        tokens = []  # will store final tokens
-        in_block_comment = False  # a flag to track whether parser is inside block comment
-        in_string = False  # a flag to track whether parser is inside a string
-        current_token = ""  # temporary variable to build up the current token
-
+        #read line at a time
         for line in lines:
-            line = line.strip()  # remove leading/trailing whitespace
-            i = 0  # index to iterate through each character
 
+            i = 0
             while i < len(line):
+
                 char = line[i]
 
                 # Handle block comments
@@ -252,76 +374,225 @@ class Tokenizer:
 
                 # Handle string literals
                 elif in_string:
+                    current_token += char  # build the string token
                     if char == '"':
-                        in_string = False  # end of string
-                        current_token += char  # include the closing quote
-                        tokens.append(current_token)  # add the string token
+                        in_string = False  # end of string, closing quote included
+                        yield self._make_token(current_token, token_line, token_column)
                         current_token = ""  # reset current_token
-                    else:
-                        current_token += char  # build the string token
                     i += 1  # move to the next character
 
                 # Handle non-string, non-comment content
                 else:
-                    # Handle inline comments
-                    if char == "/":
-                        if i + 1 < len(line):
-                            next_char = line[i + 1]
-                            if next_char == "/":
-                                break  # skip the rest of the line (inline comment)
-                            elif next_char == "*":
-                                in_block_comment = True  # start of block comment
-                                i += 2  # skip the '/*' characters
-                                continue
-
-
-                    # handle foo.bar
-                    if char == ".":
-                        if current_token:
-                            tokens.append(current_token)
-                            current_token =""
-
-                        tokens.append(char)
-                        i+=1
-                        continue
+                    # Handle inline and block comments
+                    if char == "/" and i + 1 < len(line):
+                        if line[i + 1] == "/":
+                            break  # skip the rest of the line (inline comment)
+
+                        elif line[i + 1] == "*":
+                            in_block_comment = True  # start of block comment
+                            i += 2  # skip the '/*' characters
+                            continue
+
+                    # Handle whitespace
+                    if char.isspace():
+                        if current_token:  # if there's a current_token, add it
+                            yield self._make_token(current_token, token_line, token_column)
+                            current_token = ""  # reset current_token
+                        i += 1
 
                     # Handle string literals (start of string)
-                    if char == '"':
-                        in_string = True  # start of string
+                    elif char == '"':
+                        if not current_token:
+                            token_line, token_column = line_number, i + 1
                         current_token += char  # include the opening quote
-                        i += 1  # move to the next character
-                        continue
+                        in_string = True
+                        i += 1
 
-                    # Handle symbols
-                    if char in self.symbols:
+                    # Handle symbols and the '.' of foo.bar
+                    elif char in SYMBOLS or char == ".":
                         if current_token:  # if there's a current_token, add it first
-                            tokens.append(current_token)
+                            yield self._make_token(current_token, token_line, token_column)
                             current_token = ""  # reset current_token
-                        tokens.append(char)  # add the symbol as a token
-                        i += 1  # move to the next character
 
-                    # Handle whitespace
-                    elif char.isspace():
-                        if current_token:  # if there's a current_token, add it
-                            tokens.append(current_token)
-                            current_token = ""  # reset current_token
-                        i += 1  # move to the next character
+                        yield self._make_token(char, line_number, i + 1)
+                        i += 1
 
                     # Handle other characters (keywords, identifiers, integers, etc.)
                     else:
+                        if not current_token:
+                            token_line, token_column = line_number, i + 1
                         current_token += char  # build the current_token
                         i += 1  # move to the next character
 
             # After processing the line, add any remaining current_token
             if current_token and not in_block_comment and not in_string:
-                tokens.append(current_token)
+                yield self._make_token(current_token, token_line, token_column)
                 current_token = ""  # reset current_token
 
-            
-        
+            #increment line number
+            line_number += 1
+
+
+    def _scan_regex(self, text:str):
+        """
+        Scans the source with the master regex in one finditer sweep and yields
+        the same Token records as _scan
+
+        Every match is one token, typed by the group that matched. The line number
+        is only recomputed when a token starts past the end of the current line
+        """
+        import re  # only the regex lexers need it
+
+        intern = sys.intern
+        new_token = Token._make  # builds the record without a Python-level __new__ call
+        text_length = len(text)
+        line_number = 1
+        line_start = 0 #offset of the first character of the current line
+        line_end = text.find("\n") % (text_length + 1) #offset of its newline (text_length if none)
+
+        for match in re.compile(_TOKEN_PATTERN, re.VERBOSE | re.DOTALL).finditer(text):
+
+            kind = match.lastgroup
+            start, end = match.span(kind)
+
+            if start > line_end:
+                line_number += text.count("\n", line_end, start)
+                line_start = text.rindex("\n", line_end, start) + 1
+                line_end = text.find("\n", start) % (text_length + 1)
+
+            if kind == "symbol":
+                yield new_token((text[start:end], TokenType.SYMBOL, None, line_number, start - line_start + 1))
+
+            elif kind == "identifier":
+                yield new_token((intern(text[start:end]), TokenType.IDENTIFIER, None, line_number, start - line_start + 1))
+
+            elif kind == "keyword":
+                yield new_token((intern(text[start:end]), TokenType.KEYWORD, None, line_number, start - line_start + 1))
+
+            elif kind == "integer":
+                token = intern(text[start:end])
+                value = int(token)
+                if value <= 32767:
+                    yield new_token((token, TokenType.INT_CONST, value, line_number, start - line_start + 1))
+                else:
+                    yield new_token((token, TokenType.IDENTIFIER, None, line_number, start - line_start + 1))
+
+            elif kind == "string":
+                token = text[start:end]
+
+                #an unterminated string is dropped like the hand-written scanner does
+                if end - start > 1 and token[-1] == '"':
+                    yield new_token((token, TokenType.STRING_CONST, None, line_number, start - line_start + 1))
+
+            elif kind == "word":
+                glued_start = match.start("glued")
+                head = text[start:glued_start if glued_start != -1 else end]
+                glued = text[glued_start:end] if glued_start != -1 else ""
+
+                token = self._join_word(head, glued, match.start("unterminated") != -1)
+                if token is not None:
+                    yield self._make_token(token, line_number, start - line_start + 1)
+
+
+    def _scan_bytes(self, buffer):
+        """
+        Scans a bytes buffer (the memory-mapped source) with the master regex. Matches are
+        handled by offset and every distinct keyword, symbol, identifier or integer is decoded and
+        classified once through a cache probed with memoryview slices, so no per-line or per-token str is
+        built for lexemes seen before. Columns are byte offsets
+
+        The bytes are not newline-translated like text mode does. "\r\n" in a string constant is
+        turned into "\n" so values match the other lexers, and elsewhere "\r" is whitespace, but a
+        lone "\r" does not start a new line. Only ASCII whitespace separates tokens, whereas the other
+        lexers also split on non-ASCII whitespace such as U+00A0
+        """
+        import re  # only the regex lexers need it
+
+        view = memoryview(buffer)
+        lexemes = {} #raw lexeme bytes -> (interned str, type, int value)
+        new_token = Token._make
+        buffer_length = len(buffer)
+        line_number = 1
+        line_start = 0 #offset of the first byte of the current line
+        line_end = buffer.find(b"\n") % (buffer_length + 1) #offset of its newline
+
+        try:
+            #the master regex over bytes
+            token_re = re.compile(_TOKEN_PATTERN.encode("ascii"), re.VERBOSE | re.DOTALL)
+
+            for match in token_re.finditer(buffer):
+
+                kind = match.lastgroup
+                start, end = match.span(kind)
+
+                #mmap has no count(), step over the newlines one by one
+                while start > line_end:
+                    line_number += 1
+                    line_start = line_end + 1
+                    line_end = buffer.find(b"\n", line_start) % (buffer_length + 1)
+
+                if kind == "symbol" or kind == "identifier" or kind == "keyword" or kind == "integer":
+                    classified = lexemes.get(view[start:end])
+                    if classified is None:
+                        lexeme = bytes(view[start:end])
+                        classified = lexemes[lexeme] = self._make_token(lexeme.decode("utf-8"), 0, 0)[:3]
+
+                    yield new_token(classified + (line_number, start - line_start + 1))
+
+                elif kind == "string":
+                    #an unterminated string is dropped like the hand-written scanner does
+                    if end - start > 1 and buffer[end - 1] == 0x22:
+                        token = _translate_newlines(bytes(view[start:end]).decode("utf-8"))
+                        yield self._make_token(token, line_number, start - line_start + 1)
+
+                elif kind == "word":
+                    glued_start = match.start("glued")
+                    head = bytes(view[start:glued_start if glued_start != -1 else end]).decode("utf-8")
+                    glued = _translate_newlines(bytes(view[glued_start:end]).decode("utf-8")) if glued_start != -1 else ""
+
+                    token = self._join_word(head, glued, match.start("unterminated") != -1)
+                    if token is not None:
+                        yield self._make_token(token, line_number, start - line_start + 1)
 
-        return tokens
-                    
+        finally:
+            #the mapping cannot be closed while a view of it is alive
+            view.release()
+
+
+    def _join_word(self, head:str, glued:str, unterminated:bool):
+        """
+        Builds the token of a regex word match the way the hand-written scanner does:
+        block comments inside the word are removed, a glued string is kept, and None
+        is returned when the word runs into an unterminated string or block comment
+        """
+        if unterminated or (glued and not (len(glued) > 1 and glued.endswith('"'))):
+            return None
+
+        if "/*" in head:
+            import re
+
+            head = re.sub(_BLOCK_COMMENT_PATTERN, "", head, flags=re.DOTALL)
+
+        return head + glued
+
+
+    def _make_token(self, token:str, line_number:int, column:int) -> Token:
+        #classify a raw token once, at lex time
+        if token in KEYWORDS:
+            return Token(sys.intern(token), TokenType.KEYWORD, None, line_number, column)
+
+        elif token in SYMBOLS:
+            return Token(sys.intern(token), TokenType.SYMBOL, None, line_number, column)
+
+        elif token.isdigit() and 0<= int(token)<=32767:
+            return Token(sys.intern(token), TokenType.INT_CONST, int(token), line_number, column)
+
+        elif token.startswith('"') and token.endswith('"'):
+            return Token(token, TokenType.STRING_CONST, None, line_number, column)
+
+        else:
+
+            return Token(sys.intern(token), TokenType.IDENTIFIER, None, line_number, column)
 
 
     def _xml_markup_keyword(self, token):
@@ -364,6 +635,9 @@ class Tokenizer:
 
     def hasMoreTokens(self):
         #is there more tokens?
+        if self.streaming:
+            return self._has_current
+
         return self.index < len(self.tokens)
 
     def advance(self):
@@ -373,38 +647,54 @@ class Tokenizer:
             self.index+=1
 
         # advance current token
-            if self.index <len(self.tokens):
-                self.current_token = self.tokens[self.index]
+            if self.streaming:
+                record = self._next_record()
+                if record is not None:
+                    self._set_current(record)
+                else:
+                    self._has_current = False
+
+            elif self.index <len(self.tokens):
+                self._load(self.index)
+
+    def peek(self, k:int=1):
+        #the Token record k positions after the current token without consuming it
+        #(k=0 is the current token), None past the end
+        if self.streaming:
+            if k == 0:
+                return self._current_record if self._has_current else None
+
+            while len(self._lookahead) < k:
+                record = next(self._stream, None)
+                if record is None:
+                    self.close()
+                    return None
+                self._lookahead.append(record)
+
+            return self._lookahead[k - 1]
+
+        position = self.index + k
+        return self._record(position) if position < len(self.tokens) else None
+
+    def lineNumber(self):
+        #line number of the current token
+        return self._current_line
 
     def tokenType(self):
         #return the token type
-        if self.current_token in self.keywords:
-            return "KEYWORD"
-        
-        elif self.current_token in self.symbols:
-            return "SYMBOL"
-        
-        elif self.current_token.isdigit() and 0<= int(self.current_token)<=32767:
-            return "INT_CONST"
-        
-        elif self.current_token.startswith('"') and self.current_token.endswith('"'):
-            return "STRING_CONST"
-        
-        else:
-
-            return "IDENTIFIER"
+        return self._current_type
 
 
     def keyword(self):
         #return keyword
-        if self.tokenType() == "KEYWORD":
+        if self._current_type is TokenType.KEYWORD:
             return self.current_token
         
 
 
     def symbol(self):
         #return symbol
-        if self.tokenType() == "SYMBOL":
+        if self._current_type is TokenType.SYMBOL:
             return self.current_token
         
 
@@ -412,19 +702,19 @@ class Tokenizer:
 
     def identifier(self):
         #return identifier
-        if self.tokenType() == "IDENTIFIER":
+        if self._current_type is TokenType.IDENTIFIER:
             return self.current_token
 
     def intVal(self):
-        #return identifier
-        if self.tokenType() == "INT_CONST":
-            return int(self.current_token)
+        #return the pre-parsed integer
+        if self._current_type is TokenType.INT_CONST:
+            return self._current_int
         
         
 
     def stringVal(self):
         #return string value without the ""
-        if self.tokenType() == "STRING_CONST":
+        if self._current_type is TokenType.STRING_CONST:
             return self.current_token[1:-1]
         
 
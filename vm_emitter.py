@@ -0,0 +1,214 @@
+"""
+* VM code emission shared by CompilationEngine (which compiles while parsing) and
+* code_generator.CodeGenerator (which compiles a jack_ast tree)
+* VMEmitter holds what both write the same way: labels, segments, constants,
+* operators and the constant folding / strength reduction of an expression's
+* '(op term)*' part. It only uses the attributes listed in its docstring, so
+* anything else a class keeps stays private to that class.
+
+"""
+
+#OS classes: calls on these names are never method calls on a variable
+BUILT_IN_CLASSES = ("Math", "String", "Array", "Output", "Screen", "Keyboard", "Memory", "Sys")
+
+#binary operators constant folding can evaluate
+FOLDABLE_OPERATORS = ("+","-","*","/","&","|","<",">","=")
+
+
+def to_int16(value:int) -> int:
+    #wrap to the Hack platform's 16-bit two's complement range
+    return ((value + 32768) & 0xFFFF) - 32768
+
+
+def fold(op:str, left:int, right:int):
+    """
+    Evaluates left op right the way the VM and the OS would at runtime,
+    None when it cannot be folded (division by zero is left to Math.divide)
+    """
+    if op == "+":
+        return to_int16(left + right)
+    elif op == "-":
+        return to_int16(left - right)
+    elif op == "*":
+        return to_int16(left * right)
+    elif op == "/":
+        if right == 0:
+            return None
+        quotient = abs(left) // abs(right)  # Math.divide truncates toward zero
+        return to_int16(quotient if (left < 0) == (right < 0) else -quotient)
+    elif op == "&":
+        return to_int16(left & right)
+    elif op == "|":
+        return to_int16(left | right)
+    elif op == "<":
+        return -1 if left < right else 0
+    elif op == ">":
+        return -1 if left > right else 0
+    elif op == "=":
+        return -1 if left == right else 0
+
+
+class VMEmitter:
+    """
+    Mixin writing VM code through self.vm_writer
+
+    The class using it provides vm_writer (a VM_Writer), fold_constants and
+    strength_reduce (bools) and _label_num (the label counter of the current
+    subroutine)
+    """
+
+    def _generate_label(self, prefix: str) -> str:
+        self._label_num += 1
+        return f"{prefix}_{self._label_num}"
+
+    #mapping vm segments
+    def _get_vm_segment(self, kind:str)->str:
+        return "this" if kind == "field"  else kind
+
+    def _writeConstant(self, value:int):
+        #push a 16-bit integer, the VM only has push constant 0..32767
+        if value >= 0:
+            self.vm_writer.writePush("constant", value)
+
+        elif value == -32768:
+            self.vm_writer.writePush("constant", 32767)
+            self.vm_writer.writeArithmetic("not")
+
+        else:
+            self.vm_writer.writePush("constant", -value)
+            self.vm_writer.writeArithmetic("neg")
+
+
+    def _isReducible(self, op:str, constant:int) -> bool:
+        #can x op constant be compiled without calling Math.multiply/Math.divide
+        magnitude = abs(constant)
+
+        if op == "*":
+            return magnitude <= 255 or magnitude & (magnitude - 1) == 0
+
+        return op == "/" and magnitude == 1
+
+
+    def _writeReduced(self, op:str, constant:int):
+        """
+        Writes x op constant for the x on top of the stack without an OS call
+
+        Multiplication is done by doubling and adding (shift-and-add), with temp 1
+        holding a copy of x since the VM has no dup. x * 0 still pops x because
+        computing it may have had side effects.
+        """
+        magnitude = abs(constant)
+
+        if op == "*" and magnitude == 0:
+            self.vm_writer.writePop("temp", 1)
+            self.vm_writer.writePush("constant", 0)
+
+        elif op == "*" and magnitude & (magnitude - 1) == 0:
+            #x * 2^k: double k times
+            for _ in range(magnitude.bit_length() - 1):
+                self.vm_writer.writePop("temp", 1)
+                self.vm_writer.writePush("temp", 1)
+                self.vm_writer.writePush("temp", 1)
+                self.vm_writer.writeArithmetic("add")
+
+        elif op == "*":
+            #x * c: sum x * 2^bit over the set bits of c, doubling temp 1 between bits
+            self.vm_writer.writePop("temp", 1)
+
+            for bit in range(magnitude.bit_length()):
+                if bit > 0:
+                    self.vm_writer.writePush("temp", 1)
+                    self.vm_writer.writePush("temp", 1)
+                    self.vm_writer.writeArithmetic("add")
+                    self.vm_writer.writePop("temp", 1)
+
+                if magnitude >> bit & 1:
+                    self.vm_writer.writePush("temp", 1)
+
+                    if magnitude & ((1 << bit) - 1):
+                        self.vm_writer.writeArithmetic("add")
+
+        #x * -c and x / -1 negate the result
+        if constant < 0:
+            self.vm_writer.writeArithmetic("neg")
+
+    def _writeOperator(self, op:str):
+        #write the VM code of a binary operator
+
+        if op == "+":
+            self.vm_writer.writeArithmetic("add")
+
+        elif op == "-":
+            self.vm_writer.writeArithmetic("sub")
+
+        elif op == "*":
+            self.vm_writer.writeCall("Math.multiply", 2)
+
+        elif op == "/":
+            self.vm_writer.writeCall("Math.divide", 2)
+
+        elif op == "=":
+            self.vm_writer.writeArithmetic("eq")
+
+        elif op == "&":
+            self.vm_writer.writeArithmetic("and")
+
+        elif op == "|":
+            self.vm_writer.writeArithmetic("or")
+
+        elif op == "<":
+            self.vm_writer.writeArithmetic("lt")
+
+        elif op == ">":
+            self.vm_writer.writeArithmetic("gt")
+
+        else:
+            pass
+
+    def _writeFoldedOperations(self, pending, operands, compile_term, skip_term):
+        """
+        Writes the '(op term)*' part of an expression, folding constants and/or
+        strength-reducing multiplications and divisions by constants
+
+        pending is the value of the first term if it is a constant (and so not
+        written yet), otherwise None. operands yields (op, right, term) where right
+        is the constant value of the term or None; compile_term(term) writes a term
+        and skip_term(term) passes over a constant term that was evaluated here.
+        """
+        for op, right, term in operands:
+
+            if pending is not None:
+
+                if right is not None and self.fold_constants:
+                    folded = fold(op, pending, right)
+
+                    if folded is not None:
+                        skip_term(term)
+                        pending = folded
+                        continue
+
+                #c * x: multiplication commutes, so x goes first and c is applied to it
+                #(c / x does not - it stays a Math.divide call)
+                if right is None and self.strength_reduce and op == "*" and self._isReducible(op, pending):
+                    compile_term(term)
+                    self._writeReduced(op, pending)
+                    pending = None
+                    continue
+
+                #the left operand has to be on the stack before the right one
+                self._writeConstant(pending)
+                pending = None
+
+            #x * c, x / c
+            if right is not None and self.strength_reduce and self._isReducible(op, right):
+                skip_term(term)
+                self._writeReduced(op, right)
+                continue
+
+            #process next term
+            compile_term(term)
+
+            self._writeOperator(op)
+
+        if pending is not None:
+            self._writeConstant(pending)
@@ -0,0 +1,601 @@
+import os
+from vm_emitter import to_int16
+from vm_ir import Opcode, parse
+
+"""
+* Stack-machine interpreter for the .vm code the compiler generates
+* Runs a program on the Hack VM's memory model (SP, LCL, ARG, THIS, THAT, temp, static,
+* stack from 256, heap from 2048) and counts every VM instruction it executes, per
+* instruction and so per function. Calls to the OS classes the compiler knows
+* (CompilationEngine.built_in_classes) go to Python stubs unless the program defines
+* them. The call instruction counts as a VM instruction; what the real Jack OS would
+* execute for the call is estimated from OS_COSTS and counted separately
+* (os_instructions), so code that avoids an OS call (e.g. strength-reduced
+* multiplications) is measured as cheaper than code that makes one.
+*
+* The instructions are decoded once into a flat list: labels are resolved to
+* instruction indexes and dropped (they are not executed), and push/pop are
+* specialised by segment kind.
+
+"""
+
+DEFAULT_MAX_STEPS = 50_000_000
+
+#memory map
+_SP, _LCL, _ARG, _THIS, _THAT = 0, 1, 2, 3, 4
+_TEMP = 5
+_STATIC = 16
+_STACK = 256
+_HEAP = 2048
+_HEAP_END = 16384
+
+#segments addressed through a base pointer / at a fixed address
+_POINTER_SEGMENTS = {"local": _LCL, "argument": _ARG, "this": _THIS, "that": _THAT}
+_FIXED_SEGMENTS = {"temp": _TEMP, "pointer": _THIS}
+
+#decoded opcodes, roughly in order of how often compiled code runs them
+(_PUSH_CONSTANT, _PUSH_POINTER, _PUSH_FIXED, _POP_POINTER, _POP_FIXED, _ADD, _SUB, _NEG, _EQ, _GT, _LT,
+ _AND, _OR, _NOT, _GOTO, _IF_GOTO, _CALL, _CALL_OS, _FUNCTION, _RETURN, _HALT) = range(21)
+
+_ARITHMETIC = {Opcode.ADD: _ADD, Opcode.SUB: _SUB, Opcode.NEG: _NEG, Opcode.EQ: _EQ, Opcode.GT: _GT,
+               Opcode.LT: _LT, Opcode.AND: _AND, Opcode.OR: _OR, Opcode.NOT: _NOT}
+
+#estimated VM instructions the Jack OS executes for one call, call instruction excluded.
+#Math.multiply and Math.divide were measured by running textbook OS implementations
+#compiled by this compiler; the others are rough. A callable gets the interpreter and
+#the call's arguments. Functions not listed cost DEFAULT_OS_COST
+DEFAULT_OS_COST = 20
+
+
+def _divide_cost(vm, x:int, y:int) -> int:
+    #one recursion level per quotient bit
+    return 30 + 36 * max(1, abs(x).bit_length() - abs(y).bit_length() + 1)
+
+
+def _string_length(vm, string:int) -> int:
+    return vm.ram[string + 1] if 0 <= string < len(vm.ram) - 1 else 0
+
+
+OS_COSTS = {
+    "Math.multiply": 540,
+    "Math.divide": _divide_cost,
+    "Math.min": 10,
+    "Math.max": 10,
+    "Math.abs": 10,
+    "Math.sqrt": 4600,
+    "Memory.alloc": 50,
+    "Memory.deAlloc": 15,
+    "Memory.peek": 6,
+    "Memory.poke": 6,
+    "Array.new": 55,
+    "Array.dispose": 20,
+    "String.new": 70,
+    "String.dispose": 25,
+    "String.length": 8,
+    "String.charAt": 10,
+    "String.setCharAt": 12,
+    "String.appendChar": 20,
+    "String.eraseLastChar": 12,
+    "String.intValue": lambda vm, string: 20 + 60 * _string_length(vm, string),
+    "String.setInt": 300,
+    "String.newLine": 3,
+    "String.backSpace": 3,
+    "String.doubleQuote": 3,
+    "Output.printChar": 350,
+    "Output.printString": lambda vm, string: 20 + 360 * _string_length(vm, string),
+    "Output.printInt": lambda vm, number: 700 + 360 * len(str(number)),
+    "Output.println": 40,
+    "Output.backSpace": 350,
+    "Output.moveCursor": 40,
+    "Screen.clearScreen": 80000,
+    "Screen.setColor": 5,
+    "Screen.drawPixel": 700,
+    "Screen.drawLine": lambda vm, x1, y1, x2, y2: 700 * (max(abs(x2 - x1), abs(y2 - y1)) + 1),
+    "Screen.drawRectangle": lambda vm, x1, y1, x2, y2: 40 * (abs(x2 - x1) + 1) * (abs(y2 - y1) + 1),
+    "Screen.drawCircle": lambda vm, x, y, r: 1000 * (2 * abs(r) + 1),
+    "Keyboard.keyPressed": 5,
+    "Sys.wait": lambda vm, duration: 100 * max(duration, 0),
+}
+
+#characters with their own codes on the Hack platform
+_NEWLINE, _BACKSPACE, _DOUBLE_QUOTE = 128, 129, 34
+
+
+class VMError(Exception):
+    pass
+
+
+class VMInterpreter:
+
+    def __init__(self, programs:dict, os_costs:dict=None):
+        """
+        Loads a program
+
+        programs maps a file name (the class, as for the VM translator's statics) to
+        its VM code, as text or as a vm_ir instruction list. os_costs overrides
+        entries of OS_COSTS (function name -> instructions, or a callable)
+        """
+        self.ram = [0] * 32768
+        self.output = []
+        self.executed = 0
+        #estimated instructions the OS would have executed for the stub calls
+        self.os_instructions = 0
+        self.os_costs = dict(OS_COSTS, **(os_costs or {}))
+        self.code = []
+        #per decoded instruction: (function name, original VM instruction)
+        self.origins = []
+        self.functions = {}  # function name -> index of its first instruction
+        self._heap_next = _HEAP
+        self._halted = False
+        self._os = self._os_functions()
+
+        self._decode(programs)
+        self.counts = [0] * len(self.code)
+        #per instruction: estimated OS instructions of the stub calls it made
+        self.os_counts = [0] * len(self.code)
+
+    @classmethod
+    def from_path(cls, path:str, os_costs:dict=None) -> "VMInterpreter":
+        #load a .vm file or every .vm file of a directory
+        if os.path.isdir(path):
+            files = sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".vm"))
+        else:
+            files = [path]
+
+        programs = {}
+        for file in files:
+            with open(file) as f:
+                programs[os.path.splitext(os.path.basename(file))[0]] = f.read()
+
+        return cls(programs, os_costs)
+
+    #--------------------------------
+    #decoding
+    #--------------------------------
+
+    def _decode(self, programs:dict):
+        #flatten all files into self.code, resolving labels and calls
+        pending = []  # (index, function, label) of jumps / (index, None, name) of calls
+        labels = {}   # (function, label) -> index
+        static_base = _STATIC
+        function = None
+
+        for file_name, program in programs.items():
+            instructions = parse(program) if isinstance(program, str) else program
+            statics = {}
+
+            for instruction in instructions:
+                opcode, arg1, arg2 = instruction
+
+                if opcode is Opcode.LABEL:
+                    labels[(function, arg1)] = len(self.code)
+                    continue
+
+                if opcode is Opcode.FUNCTION:
+                    function = arg1
+                    if function in self.functions:
+                        raise VMError(f"Function {function} is defined twice")
+                    self.functions[function] = len(self.code)
+                    decoded = (_FUNCTION, arg2, None)
+
+                elif opcode is Opcode.PUSH or opcode is Opcode.POP:
+                    pop = opcode is Opcode.POP
+
+                    if arg1 == "constant":
+                        if pop:
+                            raise VMError(f"{function}: cannot pop to the constant segment")
+                        decoded = (_PUSH_CONSTANT, arg2, None)
+                    elif arg1 in _POINTER_SEGMENTS:
+                        decoded = (_POP_POINTER if pop else _PUSH_POINTER, _POINTER_SEGMENTS[arg1], arg2)
+                    elif arg1 in _FIXED_SEGMENTS:
+                        decoded = (_POP_FIXED if pop else _PUSH_FIXED, _FIXED_SEGMENTS[arg1] + arg2, None)
+                    elif arg1 == "static":
+                        if arg2 not in statics:
+                            statics[arg2] = static_base + len(statics)
+                        decoded = (_POP_FIXED if pop else _PUSH_FIXED, statics[arg2], None)
+                    else:
+                        raise VMError(f"{function}: unknown segment '{arg1}'")
+
+                elif opcode is Opcode.GOTO or opcode is Opcode.IF_GOTO:
+                    pending.append((len(self.code), function, arg1))
+                    decoded = (_GOTO if opcode is Opcode.GOTO else _IF_GOTO, None, None)
+
+                elif opcode is Opcode.CALL:
+                    pending.append((len(self.code), None, arg1))
+                    decoded = (_CALL, arg1, arg2)
+
+                elif opcode is Opcode.RETURN:
+                    decoded = (_RETURN, None, None)
+
+                else:
+                    decoded = (_ARITHMETIC[opcode], None, None)
+
+                self.code.append(decoded)
+                self.origins.append((function, instruction))
+
+            static_base += len(statics)
+
+        if static_base > _STACK:
+            raise VMError("Too many static variables")
+
+        for index, function, target in pending:
+            op, _, argument = self.code[index]
+
+            if op == _CALL:
+                if target in self.functions:
+                    self.code[index] = (_CALL, self.functions[target], argument)
+                elif target in self._os:
+                    self.code[index] = (_CALL_OS, (self._os[target], self.os_costs.get(target, DEFAULT_OS_COST)), argument)
+                else:
+                    raise VMError(f"{self.origins[index][0]}: call to undefined function {target}")
+            else:
+                if (function, target) not in labels:
+                    raise VMError(f"{function}: jump to undefined label {target}")
+                self.code[index] = (op, labels[(function, target)], None)
+
+        #returning from the entry function lands here
+        self.code.append((_HALT, None, None))
+        self.origins.append((None, None))
+
+    #--------------------------------
+    #execution
+    #--------------------------------
+
+    def run(self, entry:str=None, max_steps:int=DEFAULT_MAX_STEPS) -> int:
+        """
+        Calls entry (Sys.init if the program defines it, else Main.main) with no
+        arguments and runs until it returns or Sys.halt is called
+
+        Returns the entry function's return value. Raises VMError on a runtime error
+        or after max_steps instructions.
+        """
+        if entry is None:
+            entry = "Sys.init" if "Sys.init" in self.functions else "Main.main"
+        if entry not in self.functions:
+            raise VMError(f"Entry function {entry} is not defined")
+
+        ram, code, counts, os_counts = self.ram, self.code, self.counts, self.os_counts
+
+        #bootstrap: a call frame whose return address is the HALT instruction
+        sp = _STACK
+        for value in (len(code) - 1, ram[_LCL], ram[_ARG], ram[_THIS], ram[_THAT]):
+            ram[sp] = value
+            sp += 1
+        ram[_ARG] = sp - 5
+        ram[_LCL] = sp
+
+        pc = self.functions[entry]
+        steps = 0
+        os_steps = 0
+
+        try:
+            while True:
+                here = pc
+                op, a, b = code[here]
+                counts[here] += 1
+                steps += 1
+                pc = here + 1
+
+                if op == _PUSH_CONSTANT:
+                    ram[sp] = a
+                    sp += 1
+                elif op == _PUSH_POINTER:
+                    ram[sp] = ram[ram[a] + b]
+                    sp += 1
+                elif op == _PUSH_FIXED:
+                    ram[sp] = ram[a]
+                    sp += 1
+                elif op == _POP_POINTER:
+                    sp -= 1
+                    ram[ram[a] + b] = ram[sp]
+                elif op == _POP_FIXED:
+                    sp -= 1
+                    ram[a] = ram[sp]
+                elif op == _ADD:
+                    sp -= 1
+                    ram[sp - 1] = to_int16(ram[sp - 1] + ram[sp])
+                elif op == _SUB:
+                    sp -= 1
+                    ram[sp - 1] = to_int16(ram[sp - 1] - ram[sp])
+                elif op == _NEG:
+                    ram[sp - 1] = to_int16(-ram[sp - 1])
+                elif op == _EQ:
+                    sp -= 1
+                    ram[sp - 1] = -1 if ram[sp - 1] == ram[sp] else 0
+                elif op == _GT:
+                    sp -= 1
+                    ram[sp - 1] = -1 if ram[sp - 1] > ram[sp] else 0
+                elif op == _LT:
+                    sp -= 1
+                    ram[sp - 1] = -1 if ram[sp - 1] < ram[sp] else 0
+                elif op == _AND:
+                    sp -= 1
+                    ram[sp - 1] &= ram[sp]
+                elif op == _OR:
+                    sp -= 1
+                    ram[sp - 1] |= ram[sp]
+                elif op == _NOT:
+                    ram[sp - 1] = ~ram[sp - 1]
+                elif op == _GOTO:
+                    pc = a
+                elif op == _IF_GOTO:
+                    sp -= 1
+                    if ram[sp]:
+                        pc = a
+                elif op == _CALL:
+                    for value in (pc, ram[_LCL], ram[_ARG], ram[_THIS], ram[_THAT]):
+                        ram[sp] = value
+                        sp += 1
+                    ram[_ARG] = sp - b - 5
+                    ram[_LCL] = sp
+                    pc = a
+                elif op == _FUNCTION:
+                    for _ in range(a):
+                        ram[sp] = 0
+                        sp += 1
+                elif op == _RETURN:
+                    frame = ram[_LCL]
+                    return_address = ram[frame - 5]
+                    ram[ram[_ARG]] = ram[sp - 1]
+                    sp = ram[_ARG] + 1
+                    ram[_THAT], ram[_THIS], ram[_ARG], ram[_LCL] = ram[frame - 1], ram[frame - 2], ram[frame - 3], ram[frame - 4]
+                    pc = return_address
+                elif op == _CALL_OS:
+                    sp -= b
+                    stub, cost = a
+                    arguments = ram[sp:sp + b]
+                    if type(cost) is not int:
+                        cost = cost(self, *arguments)
+                    os_counts[here] += cost
+                    os_steps += cost
+                    result = stub(*arguments)
+                    ram[sp] = 0 if result is None else to_int16(result)
+                    sp += 1
+                    if self._halted:
+                        break
+                else:  # _HALT
+                    counts[here] -= 1  # not an instruction of the program
+                    steps -= 1
+                    break
+
+                if sp >= _HEAP:
+                    raise VMError(f"Stack overflow in {self.origins[here][0]}")
+
+                if steps > max_steps:
+                    raise VMError(f"Stopped after {max_steps} instructions in {self.origins[here][0]}")
+
+        except IndexError:
+            raise VMError(f"Memory access out of range in {self.origins[here][0]}") from None
+
+        finally:
+            #also after an error, so the counts so far can be reported
+            ram[_SP] = sp
+            self.executed += steps
+            self.os_instructions += os_steps
+
+        return ram[sp - 1]
+
+    #--------------------------------
+    #reports
+    #--------------------------------
+
+    def hot_spots(self, top:int=10) -> list:
+        #(function, instructions executed in it, calls) of the top functions by instructions
+        executed = {}
+
+        for (function, _), count in zip(self.origins, self.counts):
+            if function is not None and count:
+                executed[function] = executed.get(function, 0) + count
+
+        ranking = sorted(executed.items(), key=lambda item: item[1], reverse=True)[:top]
+        return [(function, count, self.counts[self.functions[function]]) for function, count in ranking]
+
+    def hot_instructions(self, top:int=10) -> list:
+        #(function, VM instruction, times executed) of the most executed instructions
+        ranking = sorted(range(len(self.counts)), key=self.counts.__getitem__, reverse=True)[:top]
+        return [(*self.origins[index], self.counts[index]) for index in ranking if self.counts[index]]
+
+    @property
+    def total_instructions(self) -> int:
+        #VM instructions executed plus the OS's estimated share
+        return self.executed + self.os_instructions
+
+    def os_calls(self) -> dict:
+        #OS function -> (stub calls, estimated OS instructions), most expensive first
+        calls = {}
+
+        for (op, _, _), (_, instruction), count, cost in zip(self.code, self.origins, self.counts, self.os_counts):
+            if op == _CALL_OS and count:
+                previous_count, previous_cost = calls.get(instruction[1], (0, 0))
+                calls[instruction[1]] = (previous_count + count, previous_cost + cost)
+
+        return dict(sorted(calls.items(), key=lambda item: item[1][1], reverse=True))
+
+    def report(self, top:int=10) -> str:
+        from vm_ir import to_text
+
+        lines = [f"executed {self.executed} VM instructions",
+                 f"estimated {self.os_instructions} OS instructions in stub calls",
+                 f"total {self.total_instructions} instructions", "",
+                 f"{'function':<32} {'instructions':>12} {'share':>7} {'calls':>8}"]
+
+        for function, count, calls in self.hot_spots(top):
+            lines.append(f"{function:<32} {count:>12} {count / max(self.executed, 1):>7.1%} {calls:>8}")
+
+        lines += ["", f"{'instruction':<44} {'executed':>12}"]
+        for function, instruction, count in self.hot_instructions(top):
+            lines.append(f"{function + ': ' + to_text(instruction).strip():<44} {count:>12}")
+
+        os_calls = self.os_calls()
+        if os_calls:
+            lines += ["", f"{'OS call (stub)':<32} {'calls':>12} {'est. instr.':>12}"]
+            for name, (count, cost) in list(os_calls.items())[:top]:
+                lines.append(f"{name:<32} {count:>12} {cost:>12}")
+
+        return "\n".join(lines)
+
+    #--------------------------------
+    #OS stubs
+    #--------------------------------
+
+    def _os_functions(self) -> dict:
+        #OS function name -> stub taking the arguments and returning the result (None for void)
+        return {
+            "Math.multiply": lambda x, y: x * y,
+            "Math.divide": self._divide,
+            "Math.min": min,
+            "Math.max": max,
+            "Math.abs": abs,
+            "Math.sqrt": lambda x: int(max(x, 0) ** 0.5),
+            "Memory.alloc": self._alloc,
+            "Memory.deAlloc": lambda address: None,
+            "Memory.peek": lambda address: self.ram[address],
+            "Memory.poke": self._poke,
+            "Array.new": self._alloc,
+            "Array.dispose": lambda array: None,
+            "String.new": self._string_new,
+            "String.dispose": lambda string: None,
+            "String.length": lambda string: self.ram[string + 1],
+            "String.charAt": lambda string, index: self.ram[string + 2 + index],
+            "String.setCharAt": self._string_set_char_at,
+            "String.appendChar": self._string_append_char,
+            "String.eraseLastChar": self._string_erase_last_char,
+            "String.intValue": self._string_int_value,
+            "String.setInt": self._string_set_int,
+            "String.newLine": lambda: _NEWLINE,
+            "String.backSpace": lambda: _BACKSPACE,
+            "String.doubleQuote": lambda: _DOUBLE_QUOTE,
+            "Output.printChar": self._print_char,
+            "Output.printString": self._print_string,
+            "Output.printInt": lambda number: self.output.append(str(number)),
+            "Output.println": lambda: self.output.append("\n"),
+            "Output.backSpace": lambda: self.output.append("\b"),
+            "Output.moveCursor": lambda row, column: None,
+            "Screen.clearScreen": lambda: None,
+            "Screen.setColor": lambda color: None,
+            "Screen.drawPixel": lambda x, y: None,
+            "Screen.drawLine": lambda x1, y1, x2, y2: None,
+            "Screen.drawRectangle": lambda x1, y1, x2, y2: None,
+            "Screen.drawCircle": lambda x, y, r: None,
+            "Keyboard.keyPressed": lambda: 0,
+            "Keyboard.readChar": lambda: 0,
+            "Keyboard.readLine": lambda message: self._string_new(0),
+            "Keyboard.readInt": lambda message: 0,
+            "Sys.halt": self._halt,
+            "Sys.error": self._error,
+            "Sys.wait": lambda duration: None,
+        }
+
+    def _divide(self, x:int, y:int) -> int:
+        if y == 0:
+            raise VMError("Math.divide: division by zero")
+        quotient = abs(x) // abs(y)  # truncates toward zero like the Jack OS
+        return quotient if (x < 0) == (y < 0) else -quotient
+
+    def _alloc(self, size:int) -> int:
+        if size < 0:
+            raise VMError(f"Memory.alloc: negative size {size}")
+        address = self._heap_next
+        self._heap_next += max(size, 1)
+        if self._heap_next > _HEAP_END:
+            raise VMError("Memory.alloc: heap overflow")
+        return address
+
+    def _poke(self, address:int, value:int):
+        self.ram[address] = value
+
+    def _string_new(self, max_length:int) -> int:
+        #layout: max length, length, characters
+        string = self._alloc(max_length + 2)
+        self.ram[string] = max_length
+        self.ram[string + 1] = 0
+        return string
+
+    def _chars(self, string:int) -> list:
+        return self.ram[string + 2:string + 2 + self.ram[string + 1]]
+
+    def _string_set_char_at(self, string:int, index:int, char:int):
+        self.ram[string + 2 + index] = char
+
+    def _string_append_char(self, string:int, char:int) -> int:
+        length = self.ram[string + 1]
+        if length >= self.ram[string]:
+            raise VMError("String.appendChar: string is full")
+        self.ram[string + 2 + length] = char
+        self.ram[string + 1] = length + 1
+        return string
+
+    def _string_erase_last_char(self, string:int):
+        if self.ram[string + 1]:
+            self.ram[string + 1] -= 1
+
+    def _string_int_value(self, string:int) -> int:
+        text = "".join(map(chr, self._chars(string)))
+        digits = text[1:] if text.startswith("-") else text
+        end = next((i for i, c in enumerate(digits) if not c.isdigit()), len(digits))
+        value = int(digits[:end] or 0)
+        return -value if text.startswith("-") else value
+
+    def _string_set_int(self, string:int, number:int):
+        self.ram[string + 1] = 0
+        for char in str(number):
+            self._string_append_char(string, ord(char))
+
+    def _print_char(self, char:int):
+        self.output.append("\n" if char == _NEWLINE else "\b" if char == _BACKSPACE else chr(char))
+
+    def _print_string(self, string:int):
+        for char in self._chars(string):
+            self._print_char(char)
+
+    def _halt(self):
+        self._halted = True
+
+    def _error(self, code:int):
+        raise VMError(f"Sys.error({code})")
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Run compiled .vm code and count the executed instructions")
+    parser.add_argument("input", help="a .vm file or a directory of .vm files")
+    parser.add_argument("--entry", help="function to run (default: Sys.init if defined, else Main.main)")
+    parser.add_argument("--max-steps", type=int, default=DEFAULT_MAX_STEPS,
+                        help=f"stop after this many instructions (default: {DEFAULT_MAX_STEPS})")
+    parser.add_argument("--top", type=int, default=10, help="hot spots to list (default: 10)")
+    parser.add_argument("--os-cost", action="append", default=[], metavar="FUNCTION=N",
+                        help="estimated instructions of one call of an OS function, e.g. Math.multiply=200 (repeatable)")
+    args = parser.parse_args()
+
+    os_costs = {}
+    for entry in args.os_cost:
+        name, _, cost = entry.partition("=")
+        if not cost.isdigit():
+            parser.error(f"--os-cost expects FUNCTION=N, got '{entry}'")
+        os_costs[name] = int(cost)
+
+    try:
+        interpreter = VMInterpreter.from_path(args.input, os_costs)
+    except (VMError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    error = None
+    try:
+        interpreter.run(entry=args.entry, max_steps=args.max_steps)
+    except VMError as e:
+        error = e
+
+    output = "".join(interpreter.output)
+    if output:
+        print(output)
+        print()
+
+    #the counts up to a runtime error are still worth reporting
+    print(interpreter.report(args.top))
+
+    if error is not None:
+        print(f"\nError: {error}")
+        sys.exit(1)
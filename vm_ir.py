@@ -0,0 +1,100 @@
+from enum import IntEnum
+
+"""
+* Instruction-list IR for VM code
+* An instruction is a plain (opcode, arg1, arg2) tuple:
+*   push/pop    (PUSH|POP, segment, index)
+*   arithmetic  (ADD ... NOT, None, None)
+*   branching   (LABEL|GOTO|IF_GOTO, label, None)
+*   functions   (FUNCTION, name, nLocals) (CALL, name, nArgs) (RETURN, None, None)
+
+"""
+
+class Opcode(IntEnum):
+    PUSH = 0
+    POP = 1
+    ADD = 2
+    SUB = 3
+    NEG = 4
+    EQ = 5
+    GT = 6
+    LT = 7
+    AND = 8
+    OR = 9
+    NOT = 10
+    LABEL = 11
+    GOTO = 12
+    IF_GOTO = 13
+    FUNCTION = 14
+    CALL = 15
+    RETURN = 16
+
+
+#arithmetic-logical command -> opcode
+ARITHMETIC_OPCODES = {
+    "add": Opcode.ADD,
+    "sub": Opcode.SUB,
+    "neg": Opcode.NEG,
+    "eq": Opcode.EQ,
+    "gt": Opcode.GT,
+    "lt": Opcode.LT,
+    "and": Opcode.AND,
+    "or": Opcode.OR,
+    "not": Opcode.NOT,
+}
+
+#opcode -> text template of the command
+_TEMPLATES = {
+    Opcode.PUSH: "push {} {}\n",
+    Opcode.POP: "pop {} {}\n",
+    Opcode.LABEL: "label {}\n",
+    Opcode.GOTO: "goto {}\n",
+    Opcode.IF_GOTO: "if-goto {}\n",
+    Opcode.FUNCTION: "function {} {}\n",
+    Opcode.CALL: "call {} {}\n",
+    Opcode.RETURN: "return\n",
+}
+_TEMPLATES.update({opcode: f"{command}\n" for command, opcode in ARITHMETIC_OPCODES.items()})
+
+
+def to_text(instruction:tuple) -> str:
+    #a single instruction as a line of VM text
+    opcode, arg1, arg2 = instruction
+    return _TEMPLATES[opcode].format(arg1, arg2)
+
+
+def serialize(instructions) -> str:
+    #instructions in the .vm text format
+    return "".join([_TEMPLATES[opcode].format(arg1, arg2) for opcode, arg1, arg2 in instructions])
+
+
+#command word -> opcode, for parsing VM text
+_COMMANDS = {"push": Opcode.PUSH, "pop": Opcode.POP, "label": Opcode.LABEL, "goto": Opcode.GOTO,
+             "if-goto": Opcode.IF_GOTO, "function": Opcode.FUNCTION, "call": Opcode.CALL, "return": Opcode.RETURN}
+_COMMANDS.update(ARITHMETIC_OPCODES)
+
+#opcodes whose second argument is a number
+_NUMBERED = (Opcode.PUSH, Opcode.POP, Opcode.FUNCTION, Opcode.CALL)
+
+
+def parse(text:str) -> list:
+    #VM text back to instructions (the inverse of serialize), skipping comments and blank lines
+    instructions = []
+
+    for line_number, line in enumerate(text.splitlines(), 1):
+        words = line.split("//", 1)[0].split()
+        if not words:
+            continue
+
+        opcode = _COMMANDS.get(words[0])
+        if opcode is None:
+            raise ValueError(f"Line {line_number}: unknown VM command '{words[0]}'")
+
+        if opcode in _NUMBERED:
+            instructions.append((opcode, words[1], int(words[2])))
+        elif len(words) > 1:
+            instructions.append((opcode, words[1], None))
+        else:
+            instructions.append((opcode, None, None))
+
+    return instructions
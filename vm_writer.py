@@ -1,58 +1,191 @@
 import os
+from vm_ir import ARITHMETIC_OPCODES, Opcode, serialize
+
+
+def _temp_path(path:str) -> str:
+    #where path is written before it is renamed into place
+    return f"{path}.{os.getpid()}.tmp"
+
+
+def write_atomically(path:str, text:str):
+    #write to a temp file next to path and rename it over path, so readers never see
+    #a partially written file
+    temp_path = _temp_path(path)
+
+    try:
+        with open(temp_path, "w") as f:
+            f.write(text)
+        os.replace(temp_path, path)
+
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
 
 class VM_Writer:
 
-    def __init__(self, output_file:str):
+    def __init__(self, output_file:str, buffered:bool=False, record_ir:bool=False, peephole_rules=None, stream=None,
+                 count_output:bool=False):
 
         self.output_file_name = os.path.splitext(output_file)[0] + ".vm"
 
-        #open file
-        self.output_file = open(self.output_file_name, "w")
+        #the peephole optimizer rewrites the IR, so it needs IR mode
+        record_ir = record_ir or peephole_rules is not None
+        self.buffered = buffered or record_ir
+
+        #IR mode: one list of (opcode, arg1, arg2) instructions per subroutine,
+        #serialized to text at close()
+        self.ir = [] if record_ir else None
+        self._instructions = []
+        self.peephole_rules = peephole_rules
+        self.removed_instructions = 0
+
+        #a text stream (e.g. io.StringIO) to write to instead of the .vm file, left open at close()
+        self.stream = stream
+
+        #with count_output, the VM instructions and characters (= bytes, VM code is ASCII)
+        #written are counted - buffered output is counted once at close()
+        self.count_output = count_output
+        self.instructions_written = 0
+        self.bytes_written = 0
+
+        if self.buffered:
+            #collect the commands in memory, the .vm file is written in one go at close()
+            self.output_file = None
+            self._buffer = []
+            self._write = self._buffer.append
+
+        elif stream is not None:
+            self.output_file = None
+            self._write = stream.write
+
+        else:
+            #write line by line to a temp file that close() renames over the .vm file,
+            #so neither readers nor a failed compilation leave a partial .vm file
+            self.output_file = open(_temp_path(self.output_file_name), "w")
+            self._write = self.output_file.write
+
+        if count_output and not self.buffered:
+            self._write = self._counting(self._write)
 
 
         
 
     def writePush(self, memory_segment:str, index:int):
-        self.output_file.write(f"push {memory_segment} {index}\n")
-        self.output_file.flush()  # Force write to disk
+        if self.ir is not None:
+            self._instructions.append((Opcode.PUSH, memory_segment, index))
+        else:
+            self._write(f"push {memory_segment} {index}\n")
 
 
     def writePop(self, memory_segment:str, index:int):
         #write pop command
-        self.output_file.write(f"pop {memory_segment} {index}\n")
+        if self.ir is not None:
+            self._instructions.append((Opcode.POP, memory_segment, index))
+        else:
+            self._write(f"pop {memory_segment} {index}\n")
 
 
     def writeArithmetic(self, command:str):
         #write command
-        self.output_file.write(f"{command}\n")
+        if self.ir is not None:
+            self._instructions.append((ARITHMETIC_OPCODES[command], None, None))
+        else:
+            self._write(f"{command}\n")
 
 
     def writeLabel(self, label:str):
         #write label
-        self.output_file.write(f"label {label}\n")
+        if self.ir is not None:
+            self._instructions.append((Opcode.LABEL, label, None))
+        else:
+            self._write(f"label {label}\n")
 
     def writeGoto(self, label:str):
         #write Goto
-        self.output_file.write(f"goto {label}\n")
+        if self.ir is not None:
+            self._instructions.append((Opcode.GOTO, label, None))
+        else:
+            self._write(f"goto {label}\n")
 
 
     def writeIf(self, label:str):
         #write if
-        self.output_file.write(f"if-goto {label}\n")
+        if self.ir is not None:
+            self._instructions.append((Opcode.IF_GOTO, label, None))
+        else:
+            self._write(f"if-goto {label}\n")
 
     def writeCall(self, name:str, nArgs:int):
         #write call
-        self.output_file.write(f"call {name} {nArgs}\n")
+        if self.ir is not None:
+            self._instructions.append((Opcode.CALL, name, nArgs))
+        else:
+            self._write(f"call {name} {nArgs}\n")
 
     def writeFunction(self, name:str, nLocals:int):
         #write function
-        self.output_file.write(f"function {name} {nLocals}\n")
+        if self.ir is not None:
+            #every subroutine gets its own instruction list
+            self._instructions = [(Opcode.FUNCTION, name, nLocals)]
+            self.ir.append(self._instructions)
+        else:
+            self._write(f"function {name} {nLocals}\n")
     
     def writeReturn(self):
         #write return
-        self.output_file.write(f"return\n")
-
-    def close(self):
-        self.output_file.close()
-
-    
\ No newline at end of file
+        if self.ir is not None:
+            self._instructions.append((Opcode.RETURN, None, None))
+        else:
+            self._write(f"return\n")
+
+    def close(self, discard:bool=False):
+        #flush the code to the .vm file; with discard it is dropped and the .vm file left as it was
+        if discard and self.buffered:
+            self._buffer = None
+
+        if self.ir is not None and self._buffer is not None:
+            if self.peephole_rules is not None:
+                self._optimize()
+
+            self._buffer.extend(serialize(subroutine) for subroutine in self.ir)
+
+        if self.buffered:
+            if self._buffer is not None:
+                text = "".join(self._buffer)
+
+                if self.count_output:
+                    self.instructions_written = text.count("\n")
+                    self.bytes_written = len(text)
+
+                if self.stream is not None:
+                    self.stream.write(text)
+                else:
+                    write_atomically(self.output_file_name, text)
+                self._buffer = None
+
+        elif self.output_file is not None and not self.output_file.closed:
+            self.output_file.close()
+
+            if discard:
+                os.unlink(self.output_file.name)
+            else:
+                os.replace(self.output_file.name, self.output_file_name)
+
+    def _counting(self, write):
+        #wrap an unbuffered write, which is called once per instruction
+        def counting_write(line:str):
+            self.instructions_written += 1
+            self.bytes_written += len(line)
+            write(line)
+
+        return counting_write
+
+    def _optimize(self):
+        #run the peephole optimizer over every subroutine
+        from peephole import optimize  # only needed with peephole rules
+
+        for position, subroutine in enumerate(self.ir):
+            self.ir[position], removed = optimize(subroutine, self.peephole_rules)
+            self.removed_instructions += removed